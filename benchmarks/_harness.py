@@ -0,0 +1,146 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+from pathlib import Path
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = Path(__file__).resolve().parents[1]
+for _p in (str(ROOT / "src"), str(ROOT)):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+
+def bench(
+    name: str,
+    fn: Callable[[], Any],
+    repeat: int = 20,
+    warmup: int = 2,
+    min_time_s: float = 0.0,
+    items: int = 1,
+    trace_memory: bool = True,
+) -> Dict[str, Any]:
+    """Chạy fn nhiều lần, trả về thống kê thời gian (ms/lần) và peak memory (tracemalloc).
+
+    ``items`` = số phần tử mỗi lần gọi xử lý (vd. số payload) để tính throughput.
+    Peak memory được đo ở một lần chạy riêng, không lẫn vào số liệu thời gian.
+    """
+    for _ in range(max(0, warmup)):
+        fn()
+
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    samples: List[float] = []
+    t_start = time.perf_counter()
+    try:
+        while len(samples) < max(1, repeat) or (time.perf_counter() - t_start) < min_time_s:
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000.0)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    peak_bytes = None
+    if trace_memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            peak_bytes = max(0, peak - base)
+        finally:
+            tracemalloc.stop()
+
+    samples.sort()
+    median = statistics.median(samples)
+    res = {
+        "name": name,
+        "runs": len(samples),
+        "min_ms": round(samples[0], 4),
+        "median_ms": round(median, 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "p95_ms": round(samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))], 4),
+        "stdev_ms": round(statistics.pstdev(samples), 4),
+        "peak_bytes": peak_bytes,
+        "items": int(items),
+    }
+    if items > 1 and median > 0:
+        res["items_per_s"] = round(items / (median / 1000.0), 1)
+    return res
+
+
+def environment() -> Dict[str, Any]:
+    env: Dict[str, Any] = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    for mod in ("numpy", "cv2", "onnxruntime", "fastavro", "confluent_kafka"):
+        m = sys.modules.get(mod)
+        if m is not None:
+            env[mod] = getattr(m, "__version__", "?")
+    return env
+
+
+def save_results(path: str | Path, suite: str, results: List[Dict[str, Any]],
+                 params: Optional[Dict[str, Any]] = None) -> None:
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    doc = {"suite": suite, "env": environment(), "params": params or {}, "results": results}
+    p.write_text(json.dumps(doc, indent=2, ensure_ascii=False), encoding="utf-8")
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    print(f"{'benchmark':36s} {'median_ms':>10s} {'p95_ms':>10s} {'min_ms':>10s} {'peak_MiB':>9s} {'items/s':>11s}")
+    for r in results:
+        peak = "-" if r.get("peak_bytes") is None else f"{r['peak_bytes'] / 2**20:.2f}"
+        ips = f"{r['items_per_s']:.0f}" if "items_per_s" in r else "-"
+        print(f"{r['name']:36s} {r['median_ms']:10.3f} {r['p95_ms']:10.3f} {r['min_ms']:10.3f} {peak:>9s} {ips:>11s}")
+
+
+def compare(base_path: str | Path, new_path: str | Path, threshold: float = 0.10,
+            mem_threshold: float = 0.20) -> int:
+    """So sánh 2 file kết quả; in bảng và trả về số benchmark bị regression."""
+    base = {r["name"]: r for r in json.loads(Path(base_path).read_text(encoding="utf-8"))["results"]}
+    new = {r["name"]: r for r in json.loads(Path(new_path).read_text(encoding="utf-8"))["results"]}
+
+    regressions = 0
+    print(f"{'benchmark':36s} {'base_ms':>10s} {'new_ms':>10s} {'delta':>8s} {'mem_delta':>10s}  verdict")
+    for name in sorted(set(base) | set(new)):
+        b, n = base.get(name), new.get(name)
+        if b is None or n is None:
+            print(f"{name:36s} {'-':>10s} {'-':>10s} {'-':>8s} {'-':>10s}  {'NEW' if b is None else 'GONE'}")
+            continue
+        d = (n["median_ms"] - b["median_ms"]) / b["median_ms"] if b["median_ms"] > 0 else 0.0
+        md = None
+        if b.get("peak_bytes") and n.get("peak_bytes") is not None:
+            md = (n["peak_bytes"] - b["peak_bytes"]) / b["peak_bytes"]
+        verdict = "ok"
+        if d > threshold:
+            verdict = "SLOWER"
+        elif d < -threshold:
+            verdict = "faster"
+        if md is not None and md > mem_threshold:
+            verdict = "MEM+" if verdict == "ok" else verdict + ",MEM+"
+        if "SLOWER" in verdict or "MEM+" in verdict:
+            regressions += 1
+        mds = "-" if md is None else f"{md * 100:+.1f}%"
+        print(f"{name:36s} {b['median_ms']:10.3f} {n['median_ms']:10.3f} {d * 100:+7.1f}% {mds:>10s}  {verdict}")
+    return regressions
+
+
+def add_compare_parser(sub) -> None:
+    cp = sub.add_parser("compare", help="so sánh 2 file kết quả JSON, exit 1 nếu có regression")
+    cp.add_argument("base")
+    cp.add_argument("new")
+    cp.add_argument("--threshold", type=float, default=0.10, help="ngưỡng chậm hơn (tỷ lệ, mặc định 0.10)")
+    cp.add_argument("--mem-threshold", type=float, default=0.20, help="ngưỡng tăng peak memory (tỷ lệ)")
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Throughput đánh giá AQL: apply_aql / quick_decision kiểu cũ (parse spec mỗi message) vs engine compile sẵn.
+
+    python benchmarks/bench_aql.py run --out data/bench/aql_base.json
+    python benchmarks/bench_aql.py run --n 1000000 --pool 50000 --fail-rate 0.1
+    python benchmarks/bench_aql.py compare data/bench/aql_base.json data/bench/aql_new.json
+
+Mỗi lần đo đánh giá ``--n`` payload (mặc định 1 triệu), lấy vòng qua ``--pool`` payload tổng hợp khác nhau
+cho ``--products`` spec. Kết quả hai đường được so khớp trên toàn bộ pool trước khi đo.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import random
+
+import _harness as H
+
+_SEV_ORDER = {"CRITICAL": 3, "MAJOR": 2, "MINOR": 1, "INFO": 0}
+_SEV_KEYS = set(_SEV_ORDER.keys())
+
+
+# ---------------- đường cũ (trước engine), giữ nguyên để làm baseline ----------------
+def _legacy_max_severity(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    if not a:
+        return b
+    if not b:
+        return a
+    return a if _SEV_ORDER.get(a, -1) >= _SEV_ORDER.get(b, -1) else b
+
+
+def legacy_apply_aql(defects: List[Dict], measures: Optional[Dict], spec: Dict) -> Tuple[str, str, Optional[str]]:
+    defects = defects or []
+    measures = measures or {}
+    banned = set(spec.get("banned_classes") or [])
+    max_defects = int(spec.get("max_defects", 999999))
+    max_by_class: Dict[str, int] = spec.get("max_by_class") or {}
+    thr: Dict[str, float] = spec.get("thresholds") or {}
+    sev_by_class: Dict[str, str] = {
+        k: (v if v in _SEV_KEYS else "MINOR") for k, v in (spec.get("severity_by_class") or {}).items()
+    }
+    reasons: List[str] = []
+    severity: Optional[str] = None
+    present = sorted({d.get("cls") for d in defects})
+    banned_present = [c for c in present if c in banned]
+    if banned_present:
+        reasons.append("banned:" + ",".join(banned_present))
+        for c in banned_present:
+            severity = _legacy_max_severity(severity, sev_by_class.get(c, "MAJOR"))
+    if len(defects) > max_defects:
+        reasons.append(f"too_many_defects(total={len(defects)}>{max_defects})")
+        severity = _legacy_max_severity(severity, "MAJOR")
+    if max_by_class:
+        counts: Dict[str, int] = {}
+        for d in defects:
+            c = str(d.get("cls"))
+            counts[c] = counts.get(c, 0) + 1
+        exceeded = [f"{c}:{counts[c]}>{lim}" for c, lim in max_by_class.items() if counts.get(c, 0) > int(lim)]
+        if exceeded:
+            reasons.append("exceed_by_class(" + ",".join(exceeded) + ")")
+            for item in exceeded:
+                c = item.split(":")[0]
+                severity = _legacy_max_severity(severity, sev_by_class.get(c, "MINOR"))
+    thr_msgs: List[str] = []
+    if "clearance_um_min" in thr:
+        v = measures.get("clearance_um")
+        if v is not None and float(v) < float(thr["clearance_um_min"]):
+            thr_msgs.append(f"clearance<{thr['clearance_um_min']}")
+            severity = _legacy_max_severity(severity, "MAJOR")
+    if "trace_width_um_min" in thr:
+        v = measures.get("trace_width_um")
+        if v is not None and float(v) < float(thr["trace_width_um_min"]):
+            thr_msgs.append(f"trace_width<{thr['trace_width_um_min']}")
+            severity = _legacy_max_severity(severity, "MAJOR")
+    if "pad_offset_um_max" in thr:
+        v = measures.get("pad_offset_um")
+        if v is not None and float(v) > float(thr["pad_offset_um_max"]):
+            thr_msgs.append(f"pad_offset>{thr['pad_offset_um_max']}")
+            severity = _legacy_max_severity(severity, "MINOR")
+    if thr_msgs:
+        reasons.append("thresholds:" + ",".join(thr_msgs))
+    if reasons:
+        return "FAIL", "; ".join(reasons), severity
+    return "PASS", "ok", severity
+
+
+_LEGACY_DEFAULT_RULES: Dict = {"max_defects": 0, "min_score": 0.0, "banned_classes": [], "max_by_class": {},
+                               "measure_thresholds": {}}
+
+
+def legacy_quick_decision(defects: List[Dict], measures: Optional[Dict] = None, rules: Optional[Dict] = None) -> str:
+    R = {**_LEGACY_DEFAULT_RULES, **(rules or {})}
+    eff_defects = []
+    min_score = R.get("min_score")
+    for d in defects or []:
+        s = float(d.get("score", 0.0))
+        if (min_score is None) or (s >= float(min_score)):
+            eff_defects.append(d)
+    banned = set(R.get("banned_classes") or [])
+    if any((d.get("cls") in banned) for d in eff_defects):
+        return "FAIL"
+    if len(eff_defects) > int(R.get("max_defects", 0)):
+        return "FAIL"
+    max_by_class: Dict[str, int] = R.get("max_by_class") or {}
+    if max_by_class:
+        counts: Dict[str, int] = {}
+        for d in eff_defects:
+            c = str(d.get("cls"))
+            counts[c] = counts.get(c, 0) + 1
+        for c, lim in max_by_class.items():
+            if counts.get(c, 0) > int(lim):
+                return "FAIL"
+    meas_th: Dict[str, float] = R.get("measure_thresholds") or {}
+    if measures and meas_th:
+        for tkey, mkey, is_min in (("clearance_um_min", "clearance_um", True),
+                                   ("trace_width_um_min", "trace_width_um", True),
+                                   ("pad_offset_um_max", "pad_offset_um", False)):
+            if tkey in meas_th:
+                m = measures.get(mkey)
+                if m is not None and ((float(m) < float(meas_th[tkey])) if is_min else (float(m) > float(meas_th[tkey]))):
+                    return "FAIL"
+    return "PASS"
+
+
+# ---------------- dữ liệu tổng hợp ----------------
+_CLASSES = ["SH", "SP", "SC", "OP", "MB", "HB", "CS", "CFO", "BMFO"]
+
+
+def synth_specs(products: int, seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    rng = random.Random(seed)
+    specs = {}
+    for i in range(products):
+        specs[f"PCB_{i}"] = {
+            "banned_classes": rng.sample(["CS", "BMFO", "CFO"], rng.randint(0, 2)),
+            "max_defects": rng.choice([5, 8, 12]),
+            "max_by_class": {c: rng.randint(1, 4) for c in rng.sample(_CLASSES, 4)},
+            "thresholds": {"clearance_um_min": 75, "pad_offset_um_max": 40},
+            "severity_by_class": {c: rng.choice(["CRITICAL", "MAJOR", "MINOR"]) for c in rng.sample(_CLASSES, 5)},
+        }
+    return specs
+
+
+def synth_cases(pool: int, specs: Dict[str, Dict[str, Any]], fail_rate: float, seed: int = 0
+                ) -> List[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], Dict[str, Any]]]:
+    """(defects, measures, spec): phần lớn board sạch/ít lỗi nhẹ (PASS), ~fail_rate vi phạm."""
+    rng = random.Random(seed)
+    names = sorted(specs)
+    cases = []
+    for _ in range(pool):
+        spec = specs[rng.choice(names)]
+        bad = rng.random() < fail_rate
+        k = rng.randint(0, 15) if bad else rng.choice([0, 0, 0, 1, 1, 2])
+        pool_cls = _CLASSES if bad else ["SH", "SP", "SC", "OP", "MB", "HB"]
+        defects = [{"cls": rng.choice(pool_cls), "score": rng.random(),
+                    "bbox": {"x": 0, "y": 0, "w": 10, "h": 10}} for _ in range(k)]
+        measures = None
+        if rng.random() < 0.5:
+            measures = {"clearance_um": rng.uniform(60, 120) if bad else rng.uniform(80, 120),
+                        "pad_offset_um": rng.uniform(0, 60) if bad else rng.uniform(0, 35)}
+        cases.append((defects, measures, spec))
+    return cases
+
+
+def run(args) -> int:
+    from aoi.aql.engine import compile_spec
+    from aoi.aql.mini import quick_decision
+
+    specs = synth_specs(args.products, seed=args.seed)
+    cases = synth_cases(args.pool, specs, args.fail_rate, seed=args.seed)
+    idx = [i % len(cases) for i in range(args.n)]
+
+    # kiểm tra tương đương trên toàn bộ pool trước khi đo
+    fails = 0
+    for defects, measures, spec in cases:
+        a = legacy_apply_aql(defects, measures, spec)
+        b = compile_spec(spec).evaluate(defects, measures).as_tuple()
+        if a != b:
+            raise SystemExit(f"[ERROR] engine != legacy apply_aql: {a} vs {b}")
+        fails += a[0] == "FAIL"
+        if legacy_quick_decision(defects, measures) != quick_decision(defects, measures):
+            raise SystemExit("[ERROR] engine != legacy quick_decision")
+    print(f"  equivalence ok on {len(cases)} cases (FAIL rate {fails / len(cases):.1%})")
+
+    def legacy_apply():
+        for i in idx:
+            d, m, s = cases[i]
+            legacy_apply_aql(d, m, s)
+
+    def compiled_apply():
+        # như handler: lấy result rồi đọc reason (chỉ format khi FAIL)
+        for i in idx:
+            d, m, s = cases[i]
+            compile_spec(s).evaluate(d, m).as_tuple()
+
+    def legacy_quick():
+        for i in idx:
+            d, m, _ = cases[i]
+            legacy_quick_decision(d, m)
+
+    def compiled_quick():
+        for i in idx:
+            d, m, _ = cases[i]
+            quick_decision(d, m)
+
+    results = []
+    for name, fn in (("aql.apply.legacy", legacy_apply), ("aql.apply.compiled", compiled_apply),
+                     ("aql.quick.legacy", legacy_quick), ("aql.quick.compiled", compiled_quick)):
+        r = H.bench(name, fn, repeat=args.repeat, warmup=1, items=args.n, trace_memory=not args.no_memory)
+        results.append(r)
+        print(f"  done {name}")
+
+    H.print_table(results)
+    params = {"n": args.n, "pool": args.pool, "products": args.products, "fail_rate": args.fail_rate,
+              "seed": args.seed}
+    if args.out:
+        H.save_results(args.out, "aql", results, params)
+        print(f"[OK] results -> {args.out}")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="AQL evaluation throughput: per-message spec parsing vs compiled engine")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rp = sub.add_parser("run", help="chạy benchmark")
+    rp.add_argument("--out", default=None, help="file JSON kết quả")
+    rp.add_argument("--n", type=int, default=1_000_000, help="số payload đánh giá mỗi lần đo")
+    rp.add_argument("--pool", type=int, default=50_000, help="số payload tổng hợp khác nhau")
+    rp.add_argument("--products", type=int, default=20, help="số spec (product_code)")
+    rp.add_argument("--fail-rate", type=float, default=0.1)
+    rp.add_argument("--repeat", type=int, default=3)
+    rp.add_argument("--seed", type=int, default=0)
+    rp.add_argument("--no-memory", action="store_true", help="bỏ đo peak memory (tracemalloc)")
+
+    H.add_compare_parser(sub)
+
+    args = ap.parse_args()
+    if args.cmd == "compare":
+        return 1 if H.compare(args.base, args.new, args.threshold, args.mem_threshold) else 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
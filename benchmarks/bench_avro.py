@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Throughput encode Avro cho AoiInferenceResultV1 / AoiQCEventV1: serializer generic vs encoder precompiled.
+
+    python benchmarks/bench_avro.py run --out data/bench/avro_base.json
+    python benchmarks/bench_avro.py run --n 5000 --max-defects 40
+    python benchmarks/bench_avro.py compare data/bench/avro_base.json data/bench/avro_new.json
+
+"generic.*" mô phỏng đường AvroSerializer: schema chưa parse, walk dict theo schema mỗi message.
+Nếu cài confluent_kafka thì đo thêm AvroSerializer thật với mock schema registry.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import io
+import json
+import random
+import struct
+
+import _harness as H
+
+
+def synth_inference_payloads(n: int, max_defects: int, seed: int = 0) -> List[Dict[str, Any]]:
+    from aoi.io import build_inference_payload
+    rng = random.Random(seed)
+    classes = ["SH", "SP", "SC", "OP", "MB", "HB", "CS", "CFO", "BMFO"]
+    out = []
+    for i in range(n):
+        k = rng.randint(0, max_defects)
+        defects = [{
+            "cls": rng.choice(classes), "score": rng.random(),
+            "bbox": {"x": rng.randint(0, 4000), "y": rng.randint(0, 3000), "w": rng.randint(5, 200), "h": rng.randint(5, 200)},
+        } for _ in range(k)]
+        out.append(build_inference_payload(
+            product_code=f"PCB_{i % 7}", station_id=f"ST{i % 12:02d}", model_family="yolov8-det",
+            model_version="v1.4.2", latency_ms=rng.randint(50, 900), defects=defects,
+            raw_url=f"s3://aoi/raw/{i}.jpg", overlay_url=f"s3://aoi/overlay/{i}.jpg",
+            board_serial=f"SN{i:08d}", event_id=f"{i:032x}", ts_ms=1_790_000_000_000 + i,
+            meta={"capture_id": None, "notes": None,
+                  "stages_ms": {"decode": rng.random() * 20, "tile": rng.random() * 5, "infer": rng.random() * 400,
+                                "merge": rng.random() * 3, "decision": rng.random()},
+                  "degradation": {"level": 0, "name": "full", "budget_ms": None, "queue_ms": rng.random(),
+                                  "estimated_ms": None}},
+            aql_mini_decision="FAIL" if k else "PASS",
+        ))
+    return out
+
+
+def synth_qc_events(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{
+        "event_id": f"{i:032x}", "ts_ms": 1_790_000_000_000 + i, "product_code": f"PCB_{i % 7}",
+        "station_id": f"ST{i % 12:02d}", "severity": rng.choice(["MINOR", "MAJOR", "CRITICAL"]),
+        "reason": "too_many_defects(total=4>3); exceed_by_class(SH:2>1)", "overlay_url": f"s3://aoi/overlay/{i}.jpg",
+        "defect_count": rng.randint(0, 30),
+    } for i in range(n)]
+
+
+def _generic_fastavro(schema_str: str, schema_id: int) -> Callable[[Dict[str, Any]], bytes]:
+    import fastavro
+    header = struct.pack(">bI", 0, schema_id)
+
+    def enc(rec: Dict[str, Any]) -> bytes:
+        # schema dạng dict chưa parse -> fastavro parse lại mỗi lần (như serializer generic)
+        buf = io.BytesIO()
+        buf.write(header)
+        fastavro.schemaless_writer(buf, json.loads(schema_str), rec)
+        return buf.getvalue()
+    return enc
+
+
+def _confluent_serializer(schema_str: str, topic: str) -> Callable[[Dict[str, Any]], bytes] | None:
+    try:
+        from confluent_kafka.schema_registry import SchemaRegistryClient
+        from confluent_kafka.schema_registry.avro import AvroSerializer
+        from confluent_kafka.serialization import SerializationContext, MessageField
+    except Exception:
+        return None
+    ser = AvroSerializer(SchemaRegistryClient({"url": "mock://bench"}), schema_str)
+    ctx = SerializationContext(topic, MessageField.VALUE)
+    return lambda rec: ser(rec, ctx)
+
+
+def run(args) -> int:
+    from aoi.io.avro_codec import AvroEncoder, fastavro
+    from apps.inference_api.producer import KafkaAvroProducer
+    from src.apps.stream_processor.producer import KafkaAvroQCEventProducer
+
+    suites: List[Tuple[str, str, str, List[Dict[str, Any]]]] = [
+        ("inference", KafkaAvroProducer._value_schema_str, "aoi.inference_results",
+         synth_inference_payloads(args.n, args.max_defects, seed=args.seed)),
+        ("qc_event", KafkaAvroQCEventProducer._value_schema_str, "aoi.qc_events",
+         synth_qc_events(args.n, seed=args.seed)),
+    ]
+
+    results = []
+    for tag, schema_str, topic, records in suites:
+        encoders: List[Tuple[str, Callable[[Dict[str, Any]], bytes]]] = []
+        if fastavro is not None:
+            encoders.append((f"{tag}.generic.fastavro_unparsed", _generic_fastavro(schema_str, 1)))
+        conf = _confluent_serializer(schema_str, topic)
+        if conf is not None:
+            encoders.append((f"{tag}.generic.confluent_AvroSerializer", conf))
+        if fastavro is not None:
+            encoders.append((f"{tag}.compiled.fastavro", AvroEncoder(schema_str, 1, backend="fastavro").encode))
+        encoders.append((f"{tag}.compiled.python", AvroEncoder(schema_str, 1, backend="python").encode))
+
+        # kiểm tra các encoder cho ra cùng bytes (bỏ qua header của serializer thật: schema ID khác)
+        ref = [e for n, e in encoders if ".compiled." in n][0]
+        for name, enc in encoders:
+            for rec in records[:50]:
+                if enc(rec)[5:] != ref(rec)[5:]:
+                    raise SystemExit(f"[ERROR] {name} output differs from compiled encoder")
+
+        total_bytes = sum(len(ref(r)) for r in records)
+        for name, enc in encoders:
+            def fn(enc=enc):
+                for rec in records:
+                    enc(rec)
+            r = H.bench(name, fn, repeat=args.repeat, warmup=1, items=len(records), trace_memory=not args.no_memory)
+            r["avg_bytes"] = round(total_bytes / len(records), 1)
+            results.append(r)
+            print(f"  done {name}")
+
+    H.print_table(results)
+    params = {"n": args.n, "max_defects": args.max_defects, "seed": args.seed,
+              "fastavro": getattr(fastavro, "__version__", None)}
+    if args.out:
+        H.save_results(args.out, "avro", results, params)
+        print(f"[OK] results -> {args.out}")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Avro encode throughput: generic vs precompiled")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rp = sub.add_parser("run", help="chạy benchmark")
+    rp.add_argument("--out", default=None, help="file JSON kết quả")
+    rp.add_argument("--n", type=int, default=2000, help="số record mỗi lần đo")
+    rp.add_argument("--max-defects", type=int, default=20)
+    rp.add_argument("--repeat", type=int, default=10)
+    rp.add_argument("--seed", type=int, default=0)
+    rp.add_argument("--no-memory", action="store_true", help="bỏ đo peak memory (tracemalloc)")
+
+    H.add_compare_parser(sub)
+
+    args = ap.parse_args()
+    if args.cmd == "compare":
+        return 1 if H.compare(args.base, args.new, args.threshold, args.mem_threshold) else 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
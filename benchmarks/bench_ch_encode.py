@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Encode body insert ClickHouse cho aoi_inspections: JSONEachRow vs RowBinary (có/không nén).
+
+    python benchmarks/bench_ch_encode.py run --out data/bench/ch_encode_base.json
+    python benchmarks/bench_ch_encode.py run --rows 5000 --max-defects 20
+    python benchmarks/bench_ch_encode.py compare data/bench/ch_encode_base.json data/bench/ch_encode_new.json
+
+Cả hai đường encode cùng 1 batch dòng đã qua ``_validate_and_cast`` (đúng như trong writer).
+Ngoài thời gian wall còn đo CPU (process_time) / dòng và kích thước body; RowBinary được decode lại
+để kiểm tra khớp từng giá trị trước khi đo.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Tuple
+import argparse
+import gzip
+import random
+import struct
+import time
+
+import _harness as H
+
+
+def synth_rows(n: int, max_defects: int, seed: int = 0) -> List[Dict[str, Any]]:
+    from pipelines.clickhouse_writer import ClickHouseWriter
+    rng = random.Random(seed)
+    classes = ["SH", "SP", "SC", "OP", "MB", "HB", "CS", "CFO", "BMFO"]
+    w = ClickHouseWriter("http://localhost:8123", compression="none")
+    rows = []
+    for i in range(n):
+        k = rng.randint(0, max_defects)
+        defects = [{"cls": rng.choice(classes), "score": round(rng.random(), 4),
+                    "bbox": {"x": rng.randint(0, 4000), "y": rng.randint(0, 3000),
+                             "w": rng.randint(5, 200), "h": rng.randint(5, 200)}} for _ in range(k)]
+        fail = k > max_defects // 2
+        rows.append(w._validate_and_cast({
+            "ts_ms": 1_790_000_000_000 + i, "event_id": f"{rng.getrandbits(128):032x}",
+            "product_code": f"PCB_{i % 7}", "station_id": f"ST{i % 12:02d}",
+            "board_serial": f"SN{i:08d}" if rng.random() < 0.8 else None,
+            "model_family": "yolov8-det", "model_version": "v1.4.2", "latency_ms": rng.randint(50, 900),
+            "aql_mini_decision": "FAIL" if fail else "PASS",
+            "fail_reason": f"too_many_defects(total={k}>{max_defects // 2})" if fail else None,
+            "defect_count": k, "defects_json": defects,
+            "image_overlay_url": f"s3://aoi/overlay/{i}.jpg", "image_raw_url": f"s3://aoi/raw/{i}.jpg",
+            "spec_version": "3f9a0c1d2b4e5f60",
+        }))
+    return rows
+
+
+# ---------------- decode RowBinary (chỉ để kiểm tra) ----------------
+_FMT = {"UInt16": "<H", "UInt32": "<I", "UInt64": "<Q"}
+
+
+def _varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return n, pos
+        shift += 7
+
+
+def decode_rowbinary(buf: bytes, cols: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+    rows, pos = [], 0
+    while pos < len(buf):
+        r: Dict[str, Any] = {}
+        for name, t in cols:
+            if t.startswith("Nullable("):
+                null = buf[pos]
+                pos += 1
+                if null:
+                    r[name] = None
+                    continue
+                t = t[len("Nullable("):-1]
+            if t == "String":
+                n, pos = _varint(buf, pos)
+                r[name] = buf[pos:pos + n].decode("utf-8")
+                pos += n
+            else:
+                s = struct.Struct(_FMT[t])
+                r[name] = s.unpack_from(buf, pos)[0]
+                pos += s.size
+        rows.append(r)
+    return rows
+
+
+def run(args) -> int:
+    from pipelines.clickhouse_writer import ClickHouseWriter
+    import zstandard as zstd
+
+    rows = synth_rows(args.rows, args.max_defects, seed=args.seed)
+    w_json = ClickHouseWriter("http://localhost:8123", compression="none", insert_format="JSONEachRow")
+    w_rb = ClickHouseWriter("http://localhost:8123", compression="none", insert_format="RowBinary")
+    cols = [(c, ClickHouseWriter._COL_TYPES[c]) for c in ClickHouseWriter._COLS]
+
+    back = decode_rowbinary(w_rb._encode_rows(rows), cols)
+    expect = [{c: r.get(c) for c, _ in cols} for r in rows]
+    if back != expect:
+        raise SystemExit("[ERROR] RowBinary round-trip mismatch")
+    print(f"  round-trip ok on {len(rows)} rows")
+
+    zc = zstd.ZstdCompressor(level=3)
+    cases = {
+        "ch.encode.json": lambda: w_json._encode_rows(rows),
+        "ch.encode.rowbinary": lambda: w_rb._encode_rows(rows),
+        "ch.encode.json+gzip1": lambda: gzip.compress(w_json._encode_rows(rows), compresslevel=1),
+        "ch.encode.rowbinary+gzip1": lambda: gzip.compress(w_rb._encode_rows(rows), compresslevel=1),
+        "ch.encode.json+zstd3": lambda: zc.compress(w_json._encode_rows(rows)),
+        "ch.encode.rowbinary+zstd3": lambda: zc.compress(w_rb._encode_rows(rows)),
+    }
+
+    results = []
+    for name, fn in cases.items():
+        r = H.bench(name, fn, repeat=args.repeat, warmup=2, items=len(rows), trace_memory=not args.no_memory)
+        # CPU/dòng đo riêng (process_time), không lẫn số liệu wall
+        c0 = time.process_time()
+        for _ in range(args.repeat):
+            body = fn()
+        cpu_s = (time.process_time() - c0) / args.repeat
+        r["cpu_us_per_row"] = round(cpu_s * 1e6 / len(rows), 3)
+        r["body_bytes"] = len(body)
+        results.append(r)
+        print(f"  done {name}")
+
+    H.print_table(results)
+    print(f"\n{'benchmark':36s} {'cpu_us/row':>11s} {'body_KiB':>10s} {'bytes/row':>10s}")
+    for r in results:
+        print(f"{r['name']:36s} {r['cpu_us_per_row']:11.3f} {r['body_bytes'] / 1024:10.1f} "
+              f"{r['body_bytes'] / len(rows):10.1f}")
+
+    params = {"rows": args.rows, "max_defects": args.max_defects, "seed": args.seed}
+    if args.out:
+        H.save_results(args.out, "ch_encode", results, params)
+        print(f"[OK] results -> {args.out}")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="ClickHouse insert body encoding: JSONEachRow vs RowBinary")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rp = sub.add_parser("run", help="chạy benchmark")
+    rp.add_argument("--out", default=None, help="file JSON kết quả")
+    rp.add_argument("--rows", type=int, default=5000, help="số dòng mỗi batch (như bulk.max_rows)")
+    rp.add_argument("--max-defects", type=int, default=12)
+    rp.add_argument("--repeat", type=int, default=20)
+    rp.add_argument("--seed", type=int, default=0)
+    rp.add_argument("--no-memory", action="store_true", help="bỏ đo peak memory (tracemalloc)")
+
+    H.add_compare_parser(sub)
+
+    args = ap.parse_args()
+    if args.cmd == "compare":
+        return 1 if H.compare(args.base, args.new, args.threshold, args.mem_threshold) else 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
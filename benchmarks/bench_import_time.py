@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Đo cold-start import time (python -X importtime) của stream processor và các script CLI.
+
+    python benchmarks/bench_import_time.py                 # bảng kết quả, exit 1 nếu vượt budget
+    python benchmarks/bench_import_time.py --budget-ms 250 --repeat 5 --json out.json
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = Path(__file__).resolve().parents[1]
+
+HEAVY = ("cv2", "onnxruntime", "numpy")
+
+# (tên, lệnh python, budget ms riêng hoặc None = dùng --budget-ms, module không được phép import)
+TARGETS: List[Tuple[str, List[str], Optional[float], Tuple[str, ...]]] = [
+    ("aoi", ["-c", "import aoi"], 20.0, HEAVY + ("minio",)),
+    ("aoi.aql.quick_decision", ["-c", "from aoi.aql import quick_decision"], 20.0, HEAVY + ("minio",)),
+    # bản thân minio-py đã tốn vài trăm ms; điều cần giữ là không kéo theo cv2/onnxruntime
+    ("aoi.io.MinIOClient", ["-c", "from aoi.io import MinIOClient"], 600.0, HEAVY),
+    ("stream_processor.handlers", ["-c", "import src.apps.stream_processor.handlers"], None, HEAVY),
+    ("stream_processor.spec_loader", ["-c", "import src.apps.stream_processor.spec_loader"], None, HEAVY),
+    ("scripts/load_jsonl_to_clickhouse.py", ["scripts/load_jsonl_to_clickhouse.py", "--help"], None, HEAVY),
+    ("scripts/build_demo_jsonl.py", ["scripts/build_demo_jsonl.py", "--help"], None, HEAVY),
+    ("scripts/promote_model.py", ["scripts/promote_model.py", "--help"], None, ()),
+]
+
+
+def parse_importtime(stderr: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """Trả về (tổng cumulative ms của các import top-level, [(module, cumulative ms)])."""
+    total_us = 0
+    mods: List[Tuple[str, float]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            _self_us, cum_us, name = line.split(":", 1)[1].split("|", 2)
+            cum = int(cum_us.strip())
+        except ValueError:
+            continue
+        if not name.startswith("  "):  # module top-level (không thụt lề)
+            total_us += cum
+        mods.append((name.strip(), cum / 1000.0))
+    return total_us / 1000.0, mods
+
+
+def run_once(args: List[str]) -> Dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([str(ROOT / "src"), str(ROOT), env.get("PYTHONPATH", "")])
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    t0 = time.perf_counter()
+    p = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=str(ROOT), env=env,
+                       capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - t0) * 1000.0
+    import_ms, mods = parse_importtime(p.stderr)
+    err = None
+    if p.returncode != 0:
+        tail = [ln for ln in p.stderr.splitlines() if not ln.startswith("import time:")]
+        err = tail[-1] if tail else f"exit code {p.returncode}"
+    return {"import_ms": import_ms, "wall_ms": wall_ms, "mods": mods, "error": err}
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Cold-start import-time benchmark")
+    ap.add_argument("--budget-ms", type=float, default=300.0,
+                    help="budget import time mặc định (ms, đã trừ thời gian khởi động interpreter)")
+    ap.add_argument("--repeat", type=int, default=3, help="số lần chạy mỗi target (lấy median)")
+    ap.add_argument("--top", type=int, default=5, help="in N module nặng nhất của mỗi target")
+    ap.add_argument("--only", default=None, help="chỉ chạy các target chứa chuỗi này")
+    ap.add_argument("--json", default=None, help="ghi kết quả ra file JSON")
+    args = ap.parse_args()
+
+    # baseline: interpreter + site (.pth) khi không import gì
+    repeat = max(1, args.repeat)
+    run_once(["-c", "pass"])
+    base_import = statistics.median(run_once(["-c", "pass"])["import_ms"] for _ in range(repeat))
+    base_mods = {m for m, _ in run_once(["-c", "pass"])["mods"]}
+
+    results = []
+    failed = False
+    for name, cmd, budget, forbid in TARGETS:
+        if args.only and args.only not in name:
+            continue
+        # lần chạy đầu để sinh .pyc, tránh tính thời gian compile vào kết quả
+        run_once(cmd)
+        runs = [run_once(cmd) for _ in range(repeat)]
+        budget_ms = float(budget if budget is not None else args.budget_ms)
+        err = runs[-1]["error"]
+        import_ms = max(0.0, statistics.median(r["import_ms"] for r in runs) - base_import)
+        wall_ms = statistics.median(r["wall_ms"] for r in runs)
+        loaded = {m for m, _ in runs[-1]["mods"]}
+        leaked = sorted(m for m in forbid if m in loaded and m not in base_mods)
+        heavy = sorted(runs[-1]["mods"], key=lambda m: m[1], reverse=True)
+        top = [m for m in heavy if "." not in m[0] and m[0] not in base_mods][: args.top]
+        if err:
+            status = "SKIP"
+        elif leaked:
+            status = "LEAK"
+        else:
+            status = "OK" if import_ms <= budget_ms else "OVER"
+        failed = failed or status in ("OVER", "LEAK")
+        results.append({
+            "target": name, "status": status, "import_ms": round(import_ms, 2),
+            "wall_ms": round(wall_ms, 2), "budget_ms": budget_ms, "error": err, "leaked": leaked,
+            "top_modules": [{"module": m, "cumulative_ms": round(ms, 2)} for m, ms in top],
+        })
+
+    print(f"baseline (python -c pass): {base_import:.1f} ms import time")
+    print(f"{'target':40s} {'import_ms':>10s} {'wall_ms':>9s} {'budget':>8s}  status")
+    for r in results:
+        print(f"{r['target']:40s} {r['import_ms']:10.1f} {r['wall_ms']:9.1f} {r['budget_ms']:8.0f}  {r['status']}")
+        if r["error"]:
+            print(f"    ! {r['error']}")
+        if r["leaked"]:
+            print(f"    ! imports {', '.join(r['leaked'])}")
+        if r["status"] in ("OVER", "LEAK"):
+            for m in r["top_modules"]:
+                print(f"    {m['module']:36s} {m['cumulative_ms']:8.1f} ms")
+
+    if args.json:
+        Path(args.json).write_text(
+            json.dumps({"python": sys.version, "baseline_ms": round(base_import, 2), "results": results}, indent=2),
+            encoding="utf-8")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Throughput stream processor theo số worker process (mô phỏng consumer group, không cần Kafka/ClickHouse).
+
+    python benchmarks/bench_processor_scaling.py run --workers 1,2,4 --out data/bench/proc_base.json
+    python benchmarks/bench_processor_scaling.py run --n 20000 --insert-ms 40 --format avro
+    python benchmarks/bench_processor_scaling.py compare data/bench/proc_base.json data/bench/proc_new.json
+
+Message được key theo station_id và chia vào ``--partitions`` partition (crc32 % P, như partitioner
+của librdkafka); partition được gán round-robin cho worker như 1 consumer group. Mỗi worker chạy
+đường xử lý thật: decode (JSON / Confluent Avro) -> handle_inference_batch (validate + AQL) ->
+ClickHouseWriter.insert_many, trong đó client HTTP (``http=``) được thay bằng client giả chỉ sleep
+``--insert-ms`` + ``--row-us``/dòng.
+Kiểm tra luôn thứ tự ts_ms theo từng station trong mỗi worker.
+"""
+from __future__ import annotations
+from typing import Any, Dict, List
+import argparse
+import json
+import multiprocessing as mp
+import os
+import statistics
+import tempfile
+import time
+import zlib
+
+import _harness as H
+
+
+def _partition_of(key: str, partitions: int) -> int:
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+def _build_partitions(args) -> List[List[bytes]]:
+    from bench_avro import synth_inference_payloads
+    payloads = synth_inference_payloads(args.n, args.max_defects, seed=args.seed)
+    parts: List[List[bytes]] = [[] for _ in range(args.partitions)]
+    if args.format == "avro":
+        from aoi.io.avro_codec import AvroEncoder
+        from apps.inference_api.producer import KafkaAvroProducer
+        enc = AvroEncoder(KafkaAvroProducer._value_schema_str, 1).encode
+    else:
+        enc = lambda p: json.dumps(p).encode("utf-8")  # noqa: E731
+    for p in payloads:
+        parts[_partition_of(p["station_id"], args.partitions)].append(enc(p))
+    return parts
+
+
+def _write_specs(d: str) -> None:
+    for i in range(7):
+        spec = {"banned_classes": ["CS"], "max_defects": 12, "max_by_class": {"SH": 3, "OP": 2},
+                "thresholds": {}, "severity_by_class": {"SH": "MAJOR", "OP": "CRITICAL"}}
+        with open(os.path.join(d, f"PCB_{i}.json"), "w", encoding="utf-8") as f:
+            json.dump(spec, f)
+
+
+def _worker(wid: int, n_workers: int, args, spec_dir: str, ready, go, out) -> None:
+    from src.pipelines.clickhouse_writer import ClickHouseWriter
+    from src.apps.stream_processor.handlers import handle_inference_batch
+    from src.apps.stream_processor.spec_loader import SpecRepository
+    import logging
+    logging.disable(logging.INFO)
+
+    parts = _build_partitions(args)
+    mine = [parts[p] for p in range(args.partitions) if p % n_workers == wid]
+
+    if args.format == "avro":
+        from aoi.io.avro_codec import compile_decoder
+        from apps.inference_api.producer import KafkaAvroProducer
+        dec = compile_decoder(KafkaAvroProducer._value_schema_str)
+        decode = lambda b: dec(b, 5)[0]  # noqa: E731
+    else:
+        decode = json.loads
+
+    insert_s, row_s = args.insert_ms / 1000.0, args.row_us / 1e6
+
+    class SimHTTP:
+        """Thay ClickHouseHTTP: mỗi insert ngủ insert_ms + row_us * số dòng (body JSONEachRow, đếm newline)."""
+
+        def insert(self, sql, body, settings=None):
+            time.sleep(insert_s + row_s * body.count(b"\n"))
+            return {}
+
+        def ping(self, timeout=5.0):
+            return True
+
+        def stats(self):
+            return {}
+
+        def close(self):
+            pass
+
+    ck = ClickHouseWriter("http://bench:8123", bulk_max_rows=args.bulk_rows, http=SimHTTP())
+    spec_repo = SpecRepository(local_dir=spec_dir)
+    last_ts: Dict[str, int] = {}
+    ordered = True
+
+    ready.put(wid)
+    go.wait()
+    t0 = time.perf_counter()
+    count = 0
+    # consume() lần lượt từ các partition được gán, mỗi lần tối đa batch_size message
+    cursors = [0] * len(mine)
+    while True:
+        progressed = False
+        for i, msgs in enumerate(mine):
+            c = cursors[i]
+            if c >= len(msgs):
+                continue
+            chunk = msgs[c:c + args.batch_size]
+            cursors[i] = c + len(chunk)
+            progressed = True
+            payloads = [decode(b) for b in chunk]
+            for p in payloads:
+                st = p["station_id"]
+                if p["ts_ms"] < last_ts.get(st, -1):
+                    ordered = False
+                last_ts[st] = p["ts_ms"]
+            handle_inference_batch(payloads, ck, spec_repo, offsets={("t", i): cursors[i] - 1})
+            count += len(chunk)
+        if not progressed:
+            break
+    ck.flush()
+    out.put({"wid": wid, "t0": t0, "t1": time.perf_counter(), "count": count, "ordered": ordered})
+
+
+def _run_once(n_workers: int, args, spec_dir: str) -> Dict[str, Any]:
+    ctx = mp.get_context("spawn")
+    ready, out, go = ctx.Queue(), ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=_worker, args=(w, n_workers, args, spec_dir, ready, go, out))
+             for w in range(n_workers)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.get(timeout=120)
+    go.set()
+    res = [out.get(timeout=600) for _ in procs]
+    for p in procs:
+        p.join()
+    wall = max(r["t1"] for r in res) - min(r["t0"] for r in res)
+    return {"wall_s": wall, "count": sum(r["count"] for r in res), "ordered": all(r["ordered"] for r in res)}
+
+
+def run(args) -> int:
+    counts = [int(x) for x in str(args.workers).split(",") if x.strip()]
+    results = []
+    with tempfile.TemporaryDirectory() as spec_dir:
+        _write_specs(spec_dir)
+        base_ips = None
+        for n in counts:
+            runs = [_run_once(n, args, spec_dir) for _ in range(args.repeat)]
+            if not all(r["ordered"] for r in runs):
+                raise SystemExit(f"[ERROR] per-station ordering violated with {n} worker(s)")
+            samples = sorted(r["wall_s"] * 1000.0 for r in runs)
+            median = statistics.median(samples)
+            ips = runs[0]["count"] / (median / 1000.0)
+            base_ips = base_ips or ips
+            results.append({
+                "name": f"processor.{args.format}.workers={n}",
+                "runs": len(samples),
+                "min_ms": round(samples[0], 4),
+                "median_ms": round(median, 4),
+                "mean_ms": round(statistics.fmean(samples), 4),
+                "p95_ms": round(samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))], 4),
+                "stdev_ms": round(statistics.pstdev(samples), 4),
+                "peak_bytes": None,
+                "items": runs[0]["count"],
+                "items_per_s": round(ips, 1),
+                "speedup": round(ips / base_ips, 2),
+            })
+            print(f"  done workers={n}: {ips:.0f} msg/s (x{ips / base_ips:.2f})")
+
+    H.print_table(results)
+    params = {"n": args.n, "partitions": args.partitions, "batch_size": args.batch_size, "bulk_rows": args.bulk_rows,
+              "insert_ms": args.insert_ms, "row_us": args.row_us, "format": args.format,
+              "max_defects": args.max_defects, "seed": args.seed, "cpus": os.cpu_count()}
+    if args.out:
+        H.save_results(args.out, "processor_scaling", results, params)
+        print(f"[OK] results -> {args.out}")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Stream processor throughput vs number of worker processes")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rp = sub.add_parser("run", help="chạy benchmark")
+    rp.add_argument("--out", default=None, help="file JSON kết quả")
+    rp.add_argument("--workers", default="1,2,4", help="danh sách số worker, vd. 1,2,4,8")
+    rp.add_argument("--n", type=int, default=10000, help="tổng số message")
+    rp.add_argument("--partitions", type=int, default=12)
+    rp.add_argument("--batch-size", type=int, default=500, help="processor.batch_size")
+    rp.add_argument("--bulk-rows", type=int, default=1000, help="clickhouse.bulk.max_rows")
+    rp.add_argument("--insert-ms", type=float, default=30.0, help="độ trễ cố định mỗi lần insert ClickHouse")
+    rp.add_argument("--row-us", type=float, default=5.0, help="độ trễ thêm mỗi dòng insert")
+    rp.add_argument("--format", choices=["json", "avro"], default="json")
+    rp.add_argument("--max-defects", type=int, default=10)
+    rp.add_argument("--repeat", type=int, default=3)
+    rp.add_argument("--seed", type=int, default=0)
+
+    H.add_compare_parser(sub)
+
+    args = ap.parse_args()
+    if args.cmd == "compare":
+        return 1 if H.compare(args.base, args.new, args.threshold, args.mem_threshold) else 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Micro-benchmark cho aoi.vision và YoloV8DetONNX trên ảnh PCB tổng hợp (không cần weights thật).
+
+    python benchmarks/bench_vision.py run --out data/bench/vision_base.json
+    python benchmarks/bench_vision.py run --out data/bench/vision_new.json --width 4000 --height 3000
+    python benchmarks/bench_vision.py compare data/bench/vision_base.json data/bench/vision_new.json
+"""
+from __future__ import annotations
+from typing import Dict, List
+import argparse
+import tempfile
+
+import _harness as H
+
+import numpy as np
+import cv2
+
+
+def synth_pcb(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Ảnh board giả: nền xanh, đường mạch, pad, via và chữ (đủ feature cho ORB)."""
+    rng = np.random.RandomState(seed)
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    img[:] = (40, 90, 20)
+    for _ in range(max(50, (width * height) // 40000)):
+        x1, y1 = int(rng.randint(0, width)), int(rng.randint(0, height))
+        if rng.rand() < 0.5:
+            x2, y2 = int(rng.randint(0, width)), y1
+        else:
+            x2, y2 = x1, int(rng.randint(0, height))
+        cv2.line(img, (x1, y1), (x2, y2), (60, 170, 200), int(rng.randint(2, 8)))
+    for _ in range(max(100, (width * height) // 20000)):
+        x, y = int(rng.randint(0, width - 40)), int(rng.randint(0, height - 40))
+        w, h = int(rng.randint(8, 40)), int(rng.randint(8, 40))
+        cv2.rectangle(img, (x, y), (x + w, y + h), (190, 190, 200), -1)
+    for _ in range(max(50, (width * height) // 50000)):
+        x, y = int(rng.randint(0, width)), int(rng.randint(0, height))
+        cv2.circle(img, (x, y), int(rng.randint(3, 10)), (30, 30, 30), -1)
+    for i in range(0, width, 400):
+        for j in range(0, height, 300):
+            cv2.putText(img, f"R{i // 40}{j // 30}", (i + 20, j + 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0,
+                        (240, 240, 240), 2, cv2.LINE_AA)
+    return img
+
+
+def synth_captured(template: np.ndarray, seed: int = 1) -> np.ndarray:
+    """Ảnh chụp giả: lệch/xoay nhẹ + nhiễu so với template."""
+    rng = np.random.RandomState(seed)
+    h, w = template.shape[:2]
+    M = cv2.getRotationMatrix2D((w / 2, h / 2), float(rng.uniform(-2, 2)), 1.0)
+    M[:, 2] += rng.uniform(-15, 15, size=2)
+    img = cv2.warpAffine(template, M, (w, h), borderMode=cv2.BORDER_REPLICATE)
+    noise = rng.randint(-8, 9, size=img.shape).astype(np.int16)
+    return np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def synth_tile_preds(tiles: List[Dict], dets_per_tile: int, labels: List[str], seed: int = 2) -> List[Dict]:
+    rng = np.random.RandomState(seed)
+    out = []
+    for t in tiles:
+        s = t["tile"].shape[0]
+        dets = []
+        for _ in range(dets_per_tile):
+            w, h = int(rng.randint(10, 120)), int(rng.randint(10, 120))
+            dets.append({
+                "cls": labels[int(rng.randint(0, len(labels)))],
+                "score": float(rng.uniform(0.25, 1.0)),
+                "bbox": {"x": int(rng.randint(0, s - w)), "y": int(rng.randint(0, s - h)), "w": w, "h": h},
+            })
+        out.append({"xy0": t["xy0"], "dets": dets})
+    return out
+
+
+def run(args) -> int:
+    from aoi.vision import tile_960, merge_tiles, draw_overlay, register_to_template
+    from aoi.models import YoloV8DetONNX
+    from tiny_onnx import build_tiny_yolov8, DEFAULT_LABELS
+
+    template = synth_pcb(args.width, args.height, seed=args.seed)
+    captured = synth_captured(template, seed=args.seed + 1)
+    tiles = tile_960(captured, tile_size=args.imgsz, overlap=args.overlap)
+    tile_preds = synth_tile_preds(tiles, args.dets_per_tile, DEFAULT_LABELS, seed=args.seed + 2)
+    defects = merge_tiles(tile_preds, iou_thres=0.5, per_class_nms=True)
+
+    tmp = tempfile.TemporaryDirectory(prefix="aoi_bench_")
+    onnx_path = build_tiny_yolov8(tmp.name, imgsz=args.imgsz, seed=args.seed)
+    runner = YoloV8DetONNX(str(onnx_path), str(onnx_path.parent / "labels.txt"),
+                           providers=("CPUExecutionProvider",), imgsz=args.imgsz)
+    tile0 = tiles[0]["tile"]
+
+    def pipeline():
+        preds = [{"xy0": t["xy0"], "dets": runner.predict_tile(t["tile"])} for t in tiles]
+        d = merge_tiles(preds, iou_thres=0.5, per_class_nms=True)
+        draw_overlay(captured, d)
+
+    R = args.repeat
+    cases = [
+        ("tile_960", lambda: tile_960(captured, tile_size=args.imgsz, overlap=args.overlap), R),
+        ("merge_tiles.per_class", lambda: merge_tiles(tile_preds, iou_thres=0.5, per_class_nms=True), R),
+        ("merge_tiles.global", lambda: merge_tiles(tile_preds, iou_thres=0.5, per_class_nms=False), R),
+        ("draw_overlay", lambda: draw_overlay(captured, defects), R),
+        ("register_to_template.orb", lambda: register_to_template(captured, template, method="orb"), max(3, R // 4)),
+        ("yolo.preprocess", lambda: runner._preprocess_bgr(tile0), R),
+        ("yolo.predict_tile", lambda: runner.predict_tile(tile0), R),
+        ("pipeline.tiles+merge+overlay", pipeline, max(3, R // 4)),
+    ]
+    if args.only:
+        cases = [c for c in cases if args.only in c[0]]
+
+    results = []
+    for name, fn, rep in cases:
+        results.append(H.bench(name, fn, repeat=rep, warmup=1, trace_memory=not args.no_memory))
+        print(f"  done {name}")
+    tmp.cleanup()
+
+    H.print_table(results)
+    params = {
+        "width": args.width, "height": args.height, "imgsz": args.imgsz, "overlap": args.overlap,
+        "tiles": len(tiles), "dets_per_tile": args.dets_per_tile, "merged_defects": len(defects),
+        "seed": args.seed, "ort_providers": runner.session.get_providers(),
+    }
+    if args.out:
+        H.save_results(args.out, "vision", results, params)
+        print(f"[OK] results -> {args.out}")
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="aoi.vision / YoloV8DetONNX micro-benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    rp = sub.add_parser("run", help="chạy benchmark")
+    rp.add_argument("--out", default=None, help="file JSON kết quả")
+    rp.add_argument("--width", type=int, default=3000)
+    rp.add_argument("--height", type=int, default=2000)
+    rp.add_argument("--imgsz", type=int, default=960)
+    rp.add_argument("--overlap", type=int, default=64)
+    rp.add_argument("--dets-per-tile", type=int, default=25)
+    rp.add_argument("--repeat", type=int, default=20)
+    rp.add_argument("--seed", type=int, default=0)
+    rp.add_argument("--only", default=None, help="chỉ chạy benchmark có tên chứa chuỗi này")
+    rp.add_argument("--no-memory", action="store_true", help="bỏ đo peak memory (tracemalloc)")
+
+    H.add_compare_parser(sub)
+
+    args = ap.parse_args()
+    if args.cmd == "compare":
+        return 1 if H.compare(args.base, args.new, args.threshold, args.mem_threshold) else 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,57 @@
+from __future__ import annotations
+from typing import List
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_LABELS: List[str] = ["SH", "SP", "SC", "OP", "MB", "HB", "CS", "CFO", "BMFO"]
+
+
+def build_tiny_yolov8(out_dir: str | Path, imgsz: int = 960, labels: List[str] | None = None,
+                      stride: int = 32, seed: int = 0) -> Path:
+    """Sinh model ONNX rất nhỏ có cùng layout output với YOLOv8-det: [1, 4 + nc, N].
+
+    images[1,3,S,S] -> AveragePool(stride) -> Conv1x1 -> Sigmoid -> scale -> Reshape.
+    Giá trị box/score là ngẫu nhiên (nhưng hợp lệ) nên decode + NMS vẫn có việc để làm.
+    Ghi model.onnx và labels.txt vào out_dir, trả về đường dẫn model.
+    """
+    try:
+        import onnx
+        from onnx import helper, TensorProto, numpy_helper
+    except Exception as e:
+        raise RuntimeError("tiny ONNX model requires onnx. Install: pip install onnx") from e
+
+    labels = labels or DEFAULT_LABELS
+    nc = len(labels)
+    C = 4 + nc
+    S = int(imgsz)
+    rng = np.random.RandomState(seed)
+
+    W = rng.randn(C, 3, 1, 1).astype(np.float32) * 4.0
+    B = rng.randn(C).astype(np.float32)
+    scale = np.array([S, S, S / 10.0, S / 10.0] + [1.0] * nc, dtype=np.float32).reshape(1, C, 1, 1)
+    shape = np.array([1, C, -1], dtype=np.int64)
+
+    nodes = [
+        helper.make_node("AveragePool", ["images"], ["pooled"], kernel_shape=[stride, stride], strides=[stride, stride]),
+        helper.make_node("Conv", ["pooled", "W", "B"], ["conv"]),
+        helper.make_node("Sigmoid", ["conv"], ["sig"]),
+        helper.make_node("Mul", ["sig", "scale"], ["scaled"]),
+        helper.make_node("Reshape", ["scaled", "shape"], ["output0"]),
+    ]
+    graph = helper.make_graph(
+        nodes, "tiny_yolov8_det",
+        [helper.make_tensor_value_info("images", TensorProto.FLOAT, [1, 3, S, S])],
+        [helper.make_tensor_value_info("output0", TensorProto.FLOAT, [1, C, (S // stride) ** 2])],
+        [numpy_helper.from_array(W, "W"), numpy_helper.from_array(B, "B"),
+         numpy_helper.from_array(scale, "scale"), numpy_helper.from_array(shape, "shape")],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    onnx.save(model, str(out / "model.onnx"))
+    (out / "labels.txt").write_text("\n".join(labels) + "\n", encoding="utf-8")
+    return out / "model.onnx"
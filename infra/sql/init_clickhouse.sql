@@ -24,12 +24,20 @@ CREATE TABLE IF NOT EXISTS aoi.aoi_inspections
     defects_json       String,
     image_overlay_url  String,
     image_raw_url      String,
+    spec_version       String DEFAULT '',
 
     ingested_at        DateTime DEFAULT now()
 )
 ENGINE = MergeTree
 ORDER BY (ts, product_code, station_id, event_id)
-SETTINGS index_granularity = 8192;
+SETTINGS index_granularity = 8192,
+         non_replicated_deduplication_window = 1000;   -- dedup insert theo insert_deduplication_token (writer)
+-- Token theo batch: chỉ chặn trùng khi writer gửi lại đúng batch cũ (retry / replay spill). Message Kafka giao lại
+-- sau crash rơi vào batch khác -> có thể trùng event_id; query cần chính xác dùng LIMIT 1 BY event_id / uniqExact.
+
+-- bảng tạo từ trước khi có spec_version / dedup
+ALTER TABLE aoi.aoi_inspections ADD COLUMN IF NOT EXISTS spec_version String DEFAULT '' AFTER image_raw_url;
+ALTER TABLE aoi.aoi_inspections MODIFY SETTING non_replicated_deduplication_window = 1000;
 
 
 CREATE TABLE IF NOT EXISTS aoi.yield_5m
@@ -89,3 +97,29 @@ SELECT
     station_id,
     sum_latency_ms / NULLIF(toFloat64(total_cnt), 0) AS avg_latency_ms
 FROM aoi.latency_avg_5m;
+
+
+-- What-if: các dòng đổi quyết định khi áp spec ứng viên (scripts/reevaluate_spec.py)
+CREATE TABLE IF NOT EXISTS aoi.aql_whatif
+(
+    run_id             String,
+    run_ts             DateTime DEFAULT now(),
+    product_code       String,
+    candidate_version  String,
+
+    ts_ms              UInt64,
+    event_id           String,
+    station_id         String,
+    spec_version       String,
+
+    old_decision       String,
+    new_decision       String,
+    old_reason         Nullable(String),
+    new_reason         Nullable(String),
+    new_severity       Nullable(String),
+    defect_count       UInt16
+)
+ENGINE = MergeTree
+ORDER BY (run_id, product_code, ts_ms, event_id)
+TTL run_ts + INTERVAL 90 DAY
+SETTINGS index_granularity = 8192;
@@ -23,11 +23,17 @@ CREATE TABLE IF NOT EXISTS aoi.aoi_inspections
     defects_json       String,
     image_overlay_url  String,
     image_raw_url      String,
+    spec_version       String DEFAULT '',
 
     ingested_at        DateTime DEFAULT now()
 )
 ENGINE = MergeTree(ts, (ts, product_code, station_id, event_id), 8192);
 
+-- bảng tạo từ trước khi có spec_version
+ALTER TABLE aoi.aoi_inspections ADD COLUMN IF NOT EXISTS spec_version String DEFAULT '' AFTER image_raw_url;
+-- bảng cú pháp MergeTree cũ không có SETTINGS -> không dedup theo insert_deduplication_token;
+-- đặt clickhouse.dedup_token: false hoặc chuyển sang init_clickhouse.sql
+
 
 CREATE TABLE IF NOT EXISTS aoi.yield_5m
 (
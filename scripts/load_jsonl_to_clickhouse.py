@@ -1,17 +1,17 @@
 
-import os
 import sys
 import json
 import argparse
 from pathlib import Path
-from typing import Dict, Any, Iterable, Optional
+from typing import Dict, Any, Iterable, List, Optional
 
 from pipelines.clickhouse_writer import ClickHouseWriter
+from aoi.io.jsonl_writer import jsonl_segments, open_jsonl
 
 
 
 def read_jsonl(path: Path) -> Iterable[Dict[str, Any]]:
-    with path.open("r", encoding="utf-8") as f:
+    with open_jsonl(path) as f:
         for ln, line in enumerate(f, start=1):
             line = line.strip()
             if not line:
@@ -19,7 +19,7 @@ def read_jsonl(path: Path) -> Iterable[Dict[str, Any]]:
             try:
                 yield json.loads(line)
             except Exception as e:
-                print(f"[WARN] invalid json at line {ln}: {e}", file=sys.stderr)
+                print(f"[WARN] invalid json at {path.name}:{ln}: {e}", file=sys.stderr)
 
 
 
@@ -151,69 +151,64 @@ def writer_add_row(writer: Any, row: Dict[str, Any]) -> bool:
 def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Load AOI JSONL into ClickHouse (aoi.aoi_inspections)")
     ap.add_argument("--stream-cfg", required=True, help="Path to streaming.yaml (ClickHouse writer config)")
-    ap.add_argument("--jsonl", required=True, help="Path to JSONL file to load")
+    ap.add_argument("--jsonl", required=True,
+                    help="Path to JSONL file to load (rotated <stem>.<ts>.<seq>.jsonl[.zst] segments are included)")
+    ap.add_argument("--no-rotated", action="store_true", help="Only load --jsonl itself, not its rotated segments")
     ap.add_argument("--project-root", default=".", help="(unused; kept for compatibility/logging)")
     # NEW: explicit auth override
     ap.add_argument("--user", default=None, help="ClickHouse user (override ENV/YAML)")
     ap.add_argument("--password", default=None, help="ClickHouse password (override ENV/YAML)")
     return ap.parse_args()
 
-def _apply_credentials(ck: Any, user: str, password: str) -> None:
-    """
-    Try common attribute names so we don't depend on the writer's exact field names.
-    """
-    for attr_user in ("user", "username", "login"):
-        if hasattr(ck, attr_user):
-            setattr(ck, attr_user, user)
-    for attr_pwd in ("password", "passwd", "secret"):
-        if hasattr(ck, attr_pwd):
-            setattr(ck, attr_pwd, password)
-    # also try a setter if available
-    if hasattr(ck, "set_auth") and callable(getattr(ck, "set_auth")):
-        try:
-            ck.set_auth(user=user, password=password)  # type: ignore
-        except Exception:
-            pass
-
 def main() -> int:
     args = parse_args()
     stream_cfg_path = str(Path(args.stream_cfg).resolve())
     jsonl_path = Path(args.jsonl).resolve()
 
-    if not jsonl_path.exists():
+    segments = [jsonl_path] if args.no_rotated else jsonl_segments(jsonl_path)
+    segments = [p for p in segments if p.exists()]
+    if not segments:
         print(f"[ERROR] file not found: {jsonl_path}", file=sys.stderr)
         return 2
 
-    # Build writer strictly with one-argument signature
+    # Credentials: CLI > ENV > YAML; truyền vào lúc tạo writer vì auth gắn với client HTTP dùng chung
     try:
-        ck = ClickHouseWriter.from_yaml(stream_cfg_path)
+        # không spill: tool offline không được mở chung spill dir (SegmentLog) với stream processor;
+        # insert lỗi -> báo lỗi ngay thay vì "Done" khi dữ liệu chỉ mới nằm trên đĩa
+        ck = ClickHouseWriter.from_yaml(stream_cfg_path, spill=False,
+                                           user=args.user, password=args.password)
     except TypeError as e:
         print(f"[ERROR] from_yaml signature mismatch: {e}", file=sys.stderr)
         return 3
 
-    # Resolve credentials (CLI > ENV > empty)
-    user = args.user or os.environ.get("CLICKHOUSE_USER", "default")
-    password = args.password or os.environ.get("CLICKHOUSE_PASSWORD", "")
-
-    _apply_credentials(ck, user, password)
+    print(f"[INFO] target ClickHouse writer ready (user='{ck.user}', cfg='{stream_cfg_path}')", file=sys.stderr)
+    try:
+        return _load(ck, segments)
+    finally:
+        try:
+            ck.close()
+        except Exception as e:
+            print(f"[WARN] writer close failed: {e}", file=sys.stderr)
 
-    print(f"[INFO] target ClickHouse writer ready (user='{user}', cfg='{stream_cfg_path}')", file=sys.stderr)
 
+def _load(ck: ClickHouseWriter, segments: List[Path]) -> int:
     inserted = 0
     skipped = 0
 
-    for raw in read_jsonl(jsonl_path):
-        row = normalize_record(raw)
-        if row is None:
-            skipped += 1
-            continue
+    for seg in segments:
+        print(f"[INFO] loading {seg.name}", file=sys.stderr)
+        for raw in read_jsonl(seg):
+            row = normalize_record(raw)
+            if row is None:
+                skipped += 1
+                continue
 
-        if not writer_add_row(ck, row):
-            print("[ERROR] ClickHouseWriter has no add_row/append/add", file=sys.stderr)
-            skipped += 1
-            continue
+            if not writer_add_row(ck, row):
+                print("[ERROR] ClickHouseWriter has no add_row/append/add", file=sys.stderr)
+                skipped += 1
+                continue
 
-        inserted += 1
+            inserted += 1
 
     # Flush once at the end
     try:
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Load generator cho /v1/infer: đo latency/throughput và ước lượng số station một node phục vụ được.
+
+Open-loop (tốc độ đến cố định, không phụ thuộc server nhanh hay chậm):
+    python scripts/loadgen.py --images data/samples --mode open --rates 1,2,4,8 --duration 30 --takt-s 6
+
+Closed-loop (N client, mỗi client gửi tiếp ngay khi nhận response):
+    python scripts/loadgen.py --images data/samples --mode closed --concurrency 1,2,4,8 --duration 30
+"""
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+from pathlib import Path
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+
+import httpx
+
+
+def list_images(root: Path) -> List[Path]:
+    exts = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+    return [p for p in sorted(root.rglob("*")) if p.suffix.lower() in exts and p.is_file()]
+
+
+def synth_jpeg(width: int, height: int, seed: int = 0) -> bytes:
+    import numpy as np
+    import cv2
+    rng = np.random.RandomState(seed)
+    img = np.zeros((height, width, 3), dtype=np.uint8)
+    img[:] = (40, 90, 20)
+    for _ in range(400):
+        x, y = int(rng.randint(0, width - 40)), int(rng.randint(0, height - 40))
+        cv2.rectangle(img, (x, y), (x + int(rng.randint(8, 40)), y + int(rng.randint(8, 40))), (190, 190, 200), -1)
+    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
+    if not ok:
+        raise RuntimeError("Failed to encode synthetic image")
+    return buf.tobytes()
+
+
+def percentile(sorted_vals: List[float], q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(q / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+@dataclass
+class StepStats:
+    label: str
+    started: float = 0.0
+    finished: float = 0.0
+    sent: int = 0
+    dropped: int = 0
+    ok: int = 0
+    status: Dict[str, int] = field(default_factory=dict)
+    lat_ms: List[float] = field(default_factory=list)
+    server_ms: List[float] = field(default_factory=list)
+    degraded: int = 0
+    by_station: Dict[str, List[float]] = field(default_factory=dict)
+
+    def report(self, slo_ms: float, max_error_rate: float) -> Dict[str, Any]:
+        dur = max(1e-9, self.finished - self.started)
+        lat = sorted(self.lat_ms)
+        # open-loop: arrival bị bỏ (generator không gửi kịp) tính là lỗi, nếu không bước quá tải vẫn "đạt SLO"
+        attempted = self.sent + self.dropped
+        errors = attempted - self.ok
+        err_rate = errors / attempted if attempted else 0.0
+        p95 = percentile(lat, 95)
+        return {
+            "step": self.label,
+            "duration_s": round(dur, 2),
+            "sent": self.sent,
+            "dropped_arrivals": self.dropped,
+            "ok": self.ok,
+            "errors": errors,
+            "error_rate": round(err_rate, 4),
+            "status": dict(sorted(self.status.items())),
+            "throughput_rps": round(self.ok / dur, 3),
+            "offered_rps": round(attempted / dur, 3),
+            "latency_ms": {
+                "p50": _r(percentile(lat, 50)), "p95": _r(p95), "p99": _r(percentile(lat, 99)),
+                "max": _r(lat[-1] if lat else None), "mean": _r(sum(lat) / len(lat) if lat else None),
+            },
+            "server_latency_ms_p50": _r(percentile(sorted(self.server_ms), 50)),
+            "degraded_responses": self.degraded,
+            "stations": {k: {"ok": len(v), "p95_ms": _r(percentile(sorted(v), 95))}
+                         for k, v in sorted(self.by_station.items())},
+            "meets_slo": bool(self.ok and p95 is not None and p95 <= slo_ms and err_rate <= max_error_rate),
+        }
+
+
+def _r(v: Optional[float]) -> Optional[float]:
+    return None if v is None else round(float(v), 2)
+
+
+class LoadGen:
+    def __init__(self, args):
+        self.args = args
+        self.stations = [s.strip() for s in args.stations.split(",") if s.strip()]
+        self.virtual = [f"VS{i + 1:02d}" for i in range(max(1, args.virtual_stations))]
+        self.station_of = {vs: self.stations[i % len(self.stations)] for i, vs in enumerate(self.virtual)}
+        self._serial = itertools.count(1)
+
+        if args.images:
+            paths = list_images(Path(args.images))
+            if not paths:
+                raise SystemExit(f"[ERR] No images found in {args.images}")
+            self.images = [(p.name, p.read_bytes()) for p in paths[: args.max_images]]
+        else:
+            w, h = (int(x) for x in args.synthetic.lower().split("x"))
+            self.images = [("synthetic.jpg", synth_jpeg(w, h))]
+        self._img_iter = itertools.cycle(self.images)
+
+    async def one(self, client: httpx.AsyncClient, vs: str, st: StepStats) -> None:
+        name, data = next(self._img_iter)
+        form = {
+            "product_code": self.args.product,
+            "station_id": self.station_of[vs],
+            "board_serial": f"{vs}_{next(self._serial):06d}",
+        }
+        if self.args.deadline_ms:
+            form["deadline_ms"] = str(self.args.deadline_ms)
+        st.sent += 1
+        t0 = time.perf_counter()
+        try:
+            r = await client.post(self.args.api, data=form, files={"image": (name, data, "image/jpeg")})
+            code = str(r.status_code)
+        except Exception as e:
+            code = type(e).__name__
+            r = None
+        dt_ms = (time.perf_counter() - t0) * 1000.0
+        st.status[code] = st.status.get(code, 0) + 1
+        if r is not None and r.status_code == 200:
+            st.ok += 1
+            st.lat_ms.append(dt_ms)
+            st.by_station.setdefault(vs, []).append(dt_ms)
+            try:
+                body = r.json()
+                st.server_ms.append(float(body.get("latency_ms", 0)))
+                if (body.get("degradation") or {}).get("level", 0):
+                    st.degraded += 1
+            except Exception:
+                pass
+
+    async def open_loop(self, client: httpx.AsyncClient, rate: float, duration: float) -> StepStats:
+        st = StepStats(label=f"open rate={rate:g}/s")
+        tasks = set()
+        vs_cycle = itertools.cycle(self.virtual)
+        st.started = time.perf_counter()
+        next_t = st.started
+        end = st.started + duration
+        while next_t < end:
+            now = time.perf_counter()
+            if next_t > now:
+                await asyncio.sleep(next_t - now)
+            gap = random.expovariate(rate) if self.args.poisson else 1.0 / rate
+            next_t += gap
+            if len(tasks) >= self.args.max_outstanding:
+                # client đã bão hoà: ghi nhận arrival bị bỏ thay vì làm trễ lịch gửi
+                st.dropped += 1
+                continue
+            t = asyncio.create_task(self.one(client, next(vs_cycle), st))
+            tasks.add(t)
+            t.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        st.finished = time.perf_counter()
+        return st
+
+    async def closed_loop(self, client: httpx.AsyncClient, concurrency: int, duration: float) -> StepStats:
+        st = StepStats(label=f"closed clients={concurrency}")
+        st.started = time.perf_counter()
+        end = st.started + duration
+
+        async def worker(i: int):
+            vs = self.virtual[i % len(self.virtual)]
+            while time.perf_counter() < end:
+                await self.one(client, vs, st)
+                if self.args.think_ms:
+                    await asyncio.sleep(self.args.think_ms / 1000.0)
+
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        st.finished = time.perf_counter()
+        return st
+
+    async def run(self) -> Dict[str, Any]:
+        a = self.args
+        limits = httpx.Limits(max_connections=a.max_outstanding, max_keepalive_connections=a.max_outstanding)
+        steps: List[Dict[str, Any]] = []
+        async with httpx.AsyncClient(timeout=a.timeout, limits=limits) as client:
+            if a.warmup:
+                await asyncio.gather(*(self.one(client, vs, StepStats("warmup")) for vs in self.virtual[:2]))
+            levels = [float(x) for x in (a.rates if a.mode == "open" else a.concurrency).split(",") if x.strip()]
+            for lv in levels:
+                if a.mode == "open":
+                    st = await self.open_loop(client, lv, a.duration)
+                else:
+                    st = await self.closed_loop(client, int(lv), a.duration)
+                rep = st.report(a.slo_ms, a.max_error_rate)
+                steps.append(rep)
+                _print_step(rep)
+                if a.cooldown:
+                    await asyncio.sleep(a.cooldown)
+        return {"config": _cfg_dict(a, self), "steps": steps, "capacity": capacity(steps, a.takt_s)}
+
+
+def capacity(steps: List[Dict[str, Any]], takt_s: float) -> Dict[str, Any]:
+    """Throughput bền vững = throughput lớn nhất của các bước đạt SLO; mỗi station cần 1/takt_s req/s."""
+    good = [s for s in steps if s["meets_slo"]]
+    best = max(good, key=lambda s: s["throughput_rps"]) if good else None
+    sustainable = best["throughput_rps"] if best else 0.0
+    return {
+        "takt_s": takt_s,
+        "per_station_rps": round(1.0 / takt_s, 4) if takt_s > 0 else None,
+        "sustainable_rps": sustainable,
+        "best_step": best["step"] if best else None,
+        "stations_per_node": int(sustainable * takt_s) if takt_s > 0 else None,
+        "saturated": bool(steps and not steps[-1]["meets_slo"]),
+    }
+
+
+def _cfg_dict(a, lg: "LoadGen") -> Dict[str, Any]:
+    return {
+        "api": a.api, "mode": a.mode, "duration_s": a.duration, "rates": a.rates, "concurrency": a.concurrency,
+        "virtual_stations": len(lg.virtual), "stations": lg.stations, "images": len(lg.images),
+        "slo_ms": a.slo_ms, "max_error_rate": a.max_error_rate, "deadline_ms": a.deadline_ms,
+        "poisson": a.poisson,
+    }
+
+
+def _print_step(r: Dict[str, Any]) -> None:
+    lat = r["latency_ms"]
+    print(f"[{r['step']:>22s}] sent={r['sent']} dropped={r['dropped_arrivals']} ok={r['ok']} "
+          f"err={r['error_rate'] * 100:.1f}% "
+          f"thr={r['throughput_rps']:.2f}/s p50={lat['p50']} p95={lat['p95']} p99={lat['p99']} "
+          f"status={r['status']} slo={'OK' if r['meets_slo'] else 'MISS'}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Async load generator for /v1/infer")
+    ap.add_argument("--api", default="http://127.0.0.1:8000/v1/infer")
+    ap.add_argument("--images", default=None, help="Folder ảnh input (mặc định: ảnh tổng hợp)")
+    ap.add_argument("--synthetic", default="3000x2000", help="Kích thước ảnh tổng hợp WxH khi không có --images")
+    ap.add_argument("--max-images", type=int, default=50, help="Số ảnh tối đa nạp vào RAM")
+    ap.add_argument("--product", default="PCB_A")
+    ap.add_argument("--stations", default="ST01", help="station_id thật (cấu hình trên server), phân cách bởi dấu phẩy")
+    ap.add_argument("--virtual-stations", type=int, default=4, help="Số station ảo, gán vòng tròn vào --stations")
+    ap.add_argument("--mode", choices=["open", "closed"], default="open")
+    ap.add_argument("--rates", default="1,2,4", help="open-loop: các mức req/s tổng (sweep)")
+    ap.add_argument("--poisson", action="store_true", help="open-loop: khoảng cách đến theo phân phối mũ")
+    ap.add_argument("--concurrency", default="1,2,4", help="closed-loop: các mức số client (sweep)")
+    ap.add_argument("--think-ms", type=float, default=0.0, help="closed-loop: nghỉ giữa 2 request của 1 client")
+    ap.add_argument("--duration", type=float, default=30.0, help="Thời gian mỗi bước (s)")
+    ap.add_argument("--cooldown", type=float, default=2.0, help="Nghỉ giữa các bước (s)")
+    ap.add_argument("--warmup", action="store_true", help="Gửi vài request trước khi đo")
+    ap.add_argument("--max-outstanding", type=int, default=64, help="Số request đang bay tối đa của client")
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument("--deadline-ms", type=int, default=None, help="Gửi kèm deadline_ms (latency budget)")
+    ap.add_argument("--takt-s", type=float, default=6.0, help="Takt time của 1 station (s/board)")
+    ap.add_argument("--slo-ms", type=float, default=2000.0, help="SLO latency p95 (ms)")
+    ap.add_argument("--max-error-rate", type=float, default=0.01)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=None, help="Ghi báo cáo JSON")
+    args = ap.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(LoadGen(args).run())
+
+    cap = report["capacity"]
+    print("=== CAPACITY ===")
+    print(f"sustainable throughput : {cap['sustainable_rps']} req/s (step: {cap['best_step']})")
+    print(f"takt per station       : {cap['takt_s']} s -> {cap['per_station_rps']} req/s")
+    print(f"stations per node      : {cap['stations_per_node']}"
+          + ("" if cap["saturated"] else "  (chưa bão hoà: tăng --rates/--concurrency để tìm giới hạn)"))
+    if args.out:
+        out = Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"[OK] report -> {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""What-if: áp 1 spec ứng viên lên lịch sử kiểm tra trong ClickHouse, xem quyết định/yield thay đổi ra sao.
+
+    python scripts/reevaluate_spec.py --stream-cfg configs/streaming.yaml \\
+        --product PCB_A --spec specs/PCB_A.candidate.json --since 2026-10-01 --until 2026-10-19
+
+- Đọc ``defects_json`` của ``aoi.aoi_inspections`` theo luồng (HTTP JSONEachRow, từng chunk ``--chunk-rows``),
+  không nạp cả khoảng thời gian vào RAM.
+- Mỗi chunk được đánh giá bằng engine AQL compile sẵn (``CompiledSpec.evaluate_many``).
+- Dòng đổi quyết định (PASS<->FAIL; thêm FAIL đổi reason nếu ``--include-reason-changes``) được ghi vào
+  ``aoi.aql_whatif`` với ``run_id``; ``--dry-run`` chỉ in tổng kết.
+
+Lưu ý: ClickHouse không lưu ``measures`` nên rule threshold không được đánh giá lại. Dòng có ``fail_reason``
+chứa ``thresholds:`` (FAIL do threshold) không biết được kết quả dưới spec mới -> bị loại khỏi yield,
+transitions và bảng diff, chỉ đếm riêng ở ``rows_threshold_excluded``.
+"""
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from pipelines.clickhouse_writer import ClickHouseWriter
+from aoi.aql.engine import CompiledSpec, compile_spec
+
+_SELECT_COLS = ["ts_ms", "event_id", "station_id", "aql_final_decision", "fail_reason", "spec_version", "defects_json"]
+_WHATIF_COLS = [
+    "run_id", "product_code", "candidate_version", "ts_ms", "event_id", "station_id", "spec_version",
+    "old_decision", "new_decision", "old_reason", "new_reason", "new_severity", "defect_count",
+]
+
+
+def _parse_ts_ms(v: Optional[str], default: int) -> int:
+    if not v:
+        return default
+    if v.isdigit():
+        return int(v)
+    d = datetime.fromisoformat(v)
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=timezone.utc)
+    return int(d.timestamp() * 1000)
+
+
+def stream_inspections(ck: ClickHouseWriter, product: str, since_ms: int, until_ms: int,
+                       chunk_rows: int, limit: int = 0) -> Iterator[List[Dict[str, Any]]]:
+    """Đọc theo luồng các dòng inspection của 1 product, trả về từng chunk."""
+    sql = (f"SELECT {', '.join(_SELECT_COLS)} FROM {ck.database}.{ck.table} "
+           "WHERE product_code = {product:String} AND ts_ms >= {since:UInt64} AND ts_ms < {until:UInt64} "
+           "ORDER BY ts_ms" + (f" LIMIT {int(limit)}" if limit else "") + " FORMAT JSONEachRow")
+    with ck.http.query(sql, params={"product": product, "since": since_ms, "until": until_ms},
+                       settings={"output_format_json_quote_64bit_integers": 0},
+                       stream=True, timeout=(10, 600)) as r:
+        chunk: List[Dict[str, Any]] = []
+        for line in r.iter_lines():
+            if not line:
+                continue
+            chunk.append(json.loads(line))
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def insert_whatif(ck: ClickHouseWriter, table: str, rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    body = "".join(json.dumps({k: r.get(k) for k in _WHATIF_COLS}, ensure_ascii=False) + "\n" for r in rows)
+    sql = f"INSERT INTO {ck.database}.{table} ({', '.join(_WHATIF_COLS)}) FORMAT JSONEachRow"
+    ck.http.insert(sql, body.encode("utf-8"))
+
+
+def _defects(raw: Any) -> List[Dict[str, Any]]:
+    if isinstance(raw, list):
+        return raw
+    try:
+        v = json.loads(raw or "[]")
+    except Exception:
+        return []
+    return v if isinstance(v, list) else []
+
+
+def parse_args() -> argparse.Namespace:
+    ap = argparse.ArgumentParser(description="Re-evaluate stored inspections against a candidate AQL spec (what-if)")
+    ap.add_argument("--stream-cfg", required=True, help="Path to streaming.yaml (ClickHouse config)")
+    ap.add_argument("--product", required=True, help="product_code cần đánh giá lại")
+    ap.add_argument("--spec", required=True, help="file JSON spec ứng viên")
+    ap.add_argument("--since", default=None, help="ISO date/datetime hoặc ts_ms (mặc định: 7 ngày trước)")
+    ap.add_argument("--until", default=None, help="ISO date/datetime hoặc ts_ms (mặc định: bây giờ)")
+    ap.add_argument("--chunk-rows", type=int, default=50000, help="số dòng mỗi chunk đọc/đánh giá")
+    ap.add_argument("--limit", type=int, default=0, help="giới hạn số dòng (0 = không)")
+    ap.add_argument("--run-id", default=None, help="mặc định: <product>-<yyyymmddTHHMMSS>-<rand>")
+    ap.add_argument("--table", default="aql_whatif", help="bảng diff đích")
+    ap.add_argument("--include-reason-changes", action="store_true",
+                    help="ghi cả dòng FAIL->FAIL có reason khác")
+    ap.add_argument("--dry-run", action="store_true", help="không ghi bảng diff, chỉ in tổng kết")
+    ap.add_argument("--out", default=None, help="ghi tổng kết ra file JSON")
+    return ap.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    spec_path = Path(args.spec)
+    if not spec_path.exists():
+        print(f"[ERROR] spec not found: {spec_path}", file=sys.stderr)
+        return 2
+    candidate = json.loads(spec_path.read_text(encoding="utf-8"))
+    engine = compile_spec(candidate)
+
+    # không spill: tool offline không được mở chung spill dir (SegmentLog) với stream processor
+    ck = ClickHouseWriter.from_yaml(str(Path(args.stream_cfg).resolve()), spill=False)
+    try:
+        return _run(args, engine, ck)
+    finally:
+        ck.close()
+
+
+def _run(args: argparse.Namespace, engine: CompiledSpec, ck: ClickHouseWriter) -> int:
+    now_ms = int(time.time() * 1000)
+    since_ms = _parse_ts_ms(args.since, now_ms - 7 * 86400 * 1000)
+    until_ms = _parse_ts_ms(args.until, now_ms)
+    run_id = args.run_id or f"{args.product}-{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:6]}"
+
+    print(f"[INFO] run_id={run_id} product={args.product} candidate_version={engine.spec_hash} "
+          f"range=[{since_ms}, {until_ms}) dry_run={args.dry_run}", file=sys.stderr)
+
+    total = old_pass = new_pass = written = reason_changed = thr_excluded = 0
+    transitions: Dict[str, int] = {}
+    by_station: Dict[str, Dict[str, int]] = {}
+    versions: Dict[str, int] = {}
+    t0 = time.perf_counter()
+
+    for chunk in stream_inspections(ck, args.product, since_ms, until_ms, args.chunk_rows, args.limit):
+        results = engine.evaluate_many([_defects(r.get("defects_json")) for r in chunk])
+        diffs: List[Dict[str, Any]] = []
+        for row, res in zip(chunk, results):
+            if "thresholds:" in (row.get("fail_reason") or ""):
+                thr_excluded += 1
+                continue
+            old = str(row.get("aql_final_decision") or "")
+            new = res.decision
+            st = by_station.setdefault(str(row.get("station_id", "")), {"total": 0, "old_pass": 0, "new_pass": 0})
+            st["total"] += 1
+            st["old_pass"] += old == "PASS"
+            st["new_pass"] += new == "PASS"
+            total += 1
+            old_pass += old == "PASS"
+            new_pass += new == "PASS"
+            sv = str(row.get("spec_version") or "")
+            versions[sv] = versions.get(sv, 0) + 1
+
+            changed = old != new
+            if not changed and new == "FAIL" and (row.get("fail_reason") or "") != res.reason:
+                reason_changed += 1
+                changed = args.include_reason_changes
+            if not changed:
+                continue
+            if old != new:
+                key = f"{old or '?'}->{new}"
+                transitions[key] = transitions.get(key, 0) + 1
+            diffs.append({
+                "run_id": run_id,
+                "product_code": args.product,
+                "candidate_version": engine.spec_hash,
+                "ts_ms": int(row["ts_ms"]),
+                "event_id": str(row.get("event_id", "")),
+                "station_id": str(row.get("station_id", "")),
+                "spec_version": sv,
+                "old_decision": old,
+                "new_decision": new,
+                "old_reason": row.get("fail_reason"),
+                "new_reason": None if new == "PASS" else res.reason,
+                "new_severity": res.severity,
+                "defect_count": len(_defects(row.get("defects_json"))),
+            })
+        if diffs and not args.dry_run:
+            insert_whatif(ck, args.table, diffs)
+            written += len(diffs)
+        print(f"[INFO] processed={total} threshold_excluded={thr_excluded} changed_written={written}",
+              file=sys.stderr)
+
+    elapsed = time.perf_counter() - t0
+    summary = {
+        "run_id": run_id,
+        "product_code": args.product,
+        "candidate_version": engine.spec_hash,
+        "since_ms": since_ms,
+        "until_ms": until_ms,
+        "rows": total,
+        "rows_threshold_excluded": thr_excluded,
+        "yield_old": round(old_pass / total, 6) if total else None,
+        "yield_new": round(new_pass / total, 6) if total else None,
+        "transitions": transitions,
+        "fail_reason_changed": reason_changed,
+        "diff_rows_written": written,
+        "row_spec_versions": versions,
+        "by_station": {
+            s: {"total": v["total"], "yield_old": round(v["old_pass"] / v["total"], 6),
+                "yield_new": round(v["new_pass"] / v["total"], 6)}
+            for s, v in sorted(by_station.items())
+        },
+        "rows_per_s": round(total / elapsed, 1) if elapsed > 0 else None,
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,13 +1,20 @@
-
 from __future__ import annotations
-from .models.yolo_runner import YoloV8DetONNX, DetBox
-from .vision.registration import register_to_template
-from .vision.tiling import tile_960
-from .vision.postproc import merge_tiles
-from .vision.overlay import draw_overlay
-from .io.minio_client import MinIOClient
-from .io.schema import build_inference_payload 
-from .aql.mini import quick_decision 
+from typing import TYPE_CHECKING
+
+from ._lazy import attach
+
+# PEP 562: chỉ import submodule (kéo theo onnxruntime / cv2 / minio) khi thuộc tính được dùng lần đầu
+_LAZY = {
+    "YoloV8DetONNX": ".models.yolo_runner",
+    "DetBox": ".models.yolo_runner",
+    "register_to_template": ".vision.registration",
+    "tile_960": ".vision.tiling",
+    "merge_tiles": ".vision.postproc",
+    "draw_overlay": ".vision.overlay",
+    "MinIOClient": ".io.minio_client",
+    "build_inference_payload": ".io.schema",
+    "quick_decision": ".aql.mini",
+}
 
 __all__ = [
     "YoloV8DetONNX", "DetBox",
@@ -15,3 +22,17 @@ __all__ = [
     "MinIOClient", "build_inference_payload",
     "quick_decision",
 ]
+
+
+__getattr__, __dir__ = attach(__name__, _LAZY, __all__)
+
+
+if TYPE_CHECKING:
+    from .models.yolo_runner import YoloV8DetONNX, DetBox
+    from .vision.registration import register_to_template
+    from .vision.tiling import tile_960
+    from .vision.postproc import merge_tiles
+    from .vision.overlay import draw_overlay
+    from .io.minio_client import MinIOClient
+    from .io.schema import build_inference_payload
+    from .aql.mini import quick_decision
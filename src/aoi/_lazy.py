@@ -0,0 +1,23 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Sequence, Tuple
+import importlib
+import sys
+
+
+def attach(package: str, lazy: Dict[str, str], names: Sequence[str]) -> Tuple[Callable, Callable]:
+    """PEP 562 cho 1 package: trả về ``(__getattr__, __dir__)`` import submodule (tương đối, trong ``lazy``)
+    khi thuộc tính được dùng lần đầu rồi cache vào globals của package."""
+    all_names = set(names)
+
+    def __getattr__(name: str):
+        mod = lazy.get(name)
+        if mod is None:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(mod, package), name)
+        setattr(sys.modules[package], name, value)
+        return value
+
+    def __dir__() -> List[str]:
+        return sorted(set(vars(sys.modules[package])) | all_names)
+
+    return __getattr__, __dir__
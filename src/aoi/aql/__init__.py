@@ -1,5 +1,23 @@
-
 from __future__ import annotations
-from .mini import quick_decision, DEFAULT_RULES
+from typing import TYPE_CHECKING
+
+from .._lazy import attach
+
+_LAZY = {
+    "quick_decision": ".mini",
+    "DEFAULT_RULES": ".mini",
+    "CompiledSpec": ".engine",
+    "compile_spec": ".engine",
+    "compile_rules": ".engine",
+    "spec_hash": ".engine",
+}
+
+__all__ = ["quick_decision", "DEFAULT_RULES", "CompiledSpec", "compile_spec", "compile_rules", "spec_hash"]
+
+
+__getattr__, __dir__ = attach(__name__, _LAZY, __all__)
+
 
-__all__ = ["quick_decision", "DEFAULT_RULES"]
+if TYPE_CHECKING:
+    from .mini import quick_decision, DEFAULT_RULES
+    from .engine import CompiledSpec, compile_spec, compile_rules, spec_hash
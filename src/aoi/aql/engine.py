@@ -0,0 +1,300 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from collections import Counter
+import hashlib
+import json
+import threading
+
+# Engine AQL dùng chung cho apply_aql (stream processor) và quick_decision (inference API).
+# Spec được compile 1 lần thành CompiledSpec (cache theo id object + hash nội dung);
+# mỗi message chỉ còn 1 lượt lấy class, đếm bằng Counter và so với limit đã ép kiểu sẵn.
+# Reason string chỉ được format khi cần (FAIL và có người đọc .reason).
+
+SEV_ORDER = {"CRITICAL": 3, "MAJOR": 2, "MINOR": 1, "INFO": 0}
+_SEV_NAME = {v: k for k, v in SEV_ORDER.items()}
+_MAJOR = SEV_ORDER["MAJOR"]
+_MINOR = SEV_ORDER["MINOR"]
+
+# (khóa threshold, khóa measure, nhãn reason, so sánh min (<) hay max (>), severity)
+_THRESHOLDS = (
+    ("clearance_um_min", "clearance_um", "clearance<", True, _MAJOR),
+    ("trace_width_um_min", "trace_width_um", "trace_width<", True, _MAJOR),
+    ("pad_offset_um_max", "pad_offset_um", "pad_offset>", False, _MINOR),
+)
+
+
+def spec_hash(spec: Optional[Dict[str, Any]]) -> str:
+    """Hash nội dung spec (không phụ thuộc thứ tự key), dùng làm khóa cache / version."""
+    raw = json.dumps(spec or {}, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class AqlResult:
+    """Kết quả đánh giá; ``reason`` được format lần đầu khi truy cập."""
+
+    __slots__ = ("decision", "severity", "_engine", "_n", "_banned", "_total", "_exceeded", "_thr", "_reason")
+
+    def __init__(self, decision: str, severity: Optional[str], engine: Optional["CompiledSpec"] = None,
+                 n: int = 0, banned: Optional[List[Any]] = None, total: bool = False,
+                 exceeded: Optional[List[Tuple[str, int, Any]]] = None, thr: Optional[List[int]] = None,
+                 reason: Optional[str] = None):
+        self.decision = decision
+        self.severity = severity
+        self._engine = engine
+        self._n = n
+        self._banned = banned
+        self._total = total
+        self._exceeded = exceeded
+        self._thr = thr
+        self._reason = reason
+
+    @property
+    def reason(self) -> str:
+        if self._reason is None:
+            self._reason = self._format()
+        return self._reason
+
+    def _format(self) -> str:
+        parts: List[str] = []
+        if self._banned:
+            parts.append("banned:" + ",".join(self._banned))
+        if self._total:
+            parts.append(f"too_many_defects(total={self._n}>{self._engine.max_defects})")
+        if self._exceeded:
+            parts.append("exceed_by_class(" + ",".join(f"{c}:{n}>{lim}" for c, n, lim in self._exceeded) + ")")
+        if self._thr:
+            thr = self._engine._thr
+            parts.append("thresholds:" + ",".join(f"{thr[i][2]}{thr[i][4]}" for i in self._thr))
+        return "; ".join(parts) if parts else "ok"
+
+    def as_tuple(self) -> Tuple[str, str, Optional[str]]:
+        return self.decision, self.reason, self.severity
+
+
+_PASS = AqlResult("PASS", None, reason="ok")
+
+
+class CompiledSpec:
+    """Spec AQL đã compile: set/limit/severity tính sẵn, đánh giá 1 payload không cấp phát lại chúng."""
+
+    __slots__ = ("spec_hash", "banned", "max_defects", "min_score", "thresholds_always",
+                 "_ban_rank", "_limits", "_min_limit", "_thr", "_empty")
+
+    def __init__(
+        self,
+        banned_classes: Iterable[Any] = (),
+        max_defects: int = 999999,
+        max_by_class: Optional[Dict[str, Any]] = None,
+        thresholds: Optional[Dict[str, Any]] = None,
+        severity_by_class: Optional[Dict[str, Any]] = None,
+        min_score: Optional[float] = None,
+        thresholds_always: bool = True,
+        spec_hash: str = "",
+    ):
+        self.spec_hash = spec_hash
+        # severity không hợp lệ -> MINOR
+        sev = {k: SEV_ORDER.get(v, _MINOR) for k, v in (severity_by_class or {}).items()}
+        self.banned = frozenset(banned_classes or ())
+        self._ban_rank = {c: sev.get(c, _MAJOR) for c in self.banned}
+        self.max_defects = int(max_defects)
+        # (class, limit int, limit như trong spec (cho reason), severity rank)
+        self._limits = tuple((c, int(lim), lim, sev.get(str(c).split(":")[0], _MINOR))
+                             for c, lim in (max_by_class or {}).items())
+        self._min_limit = min((lim for _, lim, _, _ in self._limits), default=None)
+        thr = thresholds or {}
+        self._thr = tuple((mkey, float(thr[tkey]), label, is_min, thr[tkey], rank)
+                          for tkey, mkey, label, is_min, rank in _THRESHOLDS if tkey in thr)
+        self.min_score = None if min_score is None else float(min_score)
+        # quick_decision chỉ xét threshold khi có measures; apply_aql luôn xét (measures or {})
+        self.thresholds_always = bool(thresholds_always)
+        # kết quả khi không có defect và không có measure: tính 1 lần
+        self._empty = None
+        self._empty = self._evaluate([], None)
+
+    # ---------------- build ----------------
+    @classmethod
+    def from_spec(cls, spec: Optional[Dict[str, Any]], h: Optional[str] = None) -> "CompiledSpec":
+        """Spec của stream processor (specs/<product>.json)."""
+        s = spec or {}
+        return cls(
+            banned_classes=s.get("banned_classes") or [],
+            max_defects=s.get("max_defects", 999999),
+            max_by_class=s.get("max_by_class") or {},
+            thresholds=s.get("thresholds") or {},
+            severity_by_class=s.get("severity_by_class") or {},
+            spec_hash=h or spec_hash(s),
+        )
+
+    @classmethod
+    def from_rules(cls, rules: Dict[str, Any], h: Optional[str] = None) -> "CompiledSpec":
+        """Rules của quick_decision (đã merge DEFAULT_RULES)."""
+        return cls(
+            banned_classes=rules.get("banned_classes") or [],
+            max_defects=rules.get("max_defects", 0),
+            max_by_class=rules.get("max_by_class") or {},
+            thresholds=rules.get("measure_thresholds") or {},
+            min_score=rules.get("min_score"),
+            thresholds_always=False,
+            spec_hash=h or spec_hash(rules),
+        )
+
+    # ---------------- evaluate ----------------
+    def _filter(self, defects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        ms = self.min_score
+        return [d for d in defects if float(d.get("score", 0.0)) >= ms]
+
+    def evaluate(self, defects: Optional[List[Dict[str, Any]]], measures: Optional[Dict[str, Any]] = None) -> AqlResult:
+        defects = defects or []
+        if self.min_score is not None:
+            defects = self._filter(defects)
+        if not defects and self._empty is not None and (not measures or not self._thr):
+            return self._empty
+        return self._evaluate(defects, measures)
+
+    def _evaluate(self, defects: List[Dict[str, Any]], measures: Optional[Dict[str, Any]]) -> AqlResult:
+        n = len(defects)
+        rank = -1
+        banned_hit = None
+        exceeded = None
+        thr_hit = None
+
+        classes = [d.get("cls") for d in defects] if n else []
+        if self.banned and n:
+            hit = self.banned.intersection(classes)
+            if hit:
+                banned_hit = sorted(hit)
+                for c in banned_hit:
+                    r = self._ban_rank[c]
+                    if r > rank:
+                        rank = r
+
+        total = n > self.max_defects
+        if total and _MAJOR > rank:
+            rank = _MAJOR
+
+        # count <= n nên khi n <= limit nhỏ nhất thì không class nào vượt được -> khỏi đếm
+        if self._limits and n > self._min_limit:
+            counts = Counter(classes)
+            if any(k.__class__ is not str for k in counts):
+                counts = Counter(map(str, classes))
+            for c, lim, lim_raw, r in self._limits:
+                cnt = counts.get(c, 0)
+                if cnt > lim:
+                    if exceeded is None:
+                        exceeded = []
+                    exceeded.append((c, cnt, lim_raw))
+                    if r > rank:
+                        rank = r
+
+        if self._thr and (measures or self.thresholds_always):
+            m = measures or {}
+            for i, (mkey, lim, _label, is_min, _raw, r) in enumerate(self._thr):
+                v = m.get(mkey)
+                if v is None:
+                    continue
+                v = float(v)
+                if (v < lim) if is_min else (v > lim):
+                    if thr_hit is None:
+                        thr_hit = []
+                    thr_hit.append(i)
+                    if r > rank:
+                        rank = r
+
+        if banned_hit is None and not total and exceeded is None and thr_hit is None:
+            return _PASS
+        return AqlResult("FAIL", _SEV_NAME.get(rank), self, n, banned_hit, total, exceeded, thr_hit)
+
+    def evaluate_many(self, batch: List[Optional[List[Dict[str, Any]]]],
+                      measures: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[AqlResult]:
+        """Đánh giá cả batch với cùng spec (re-evaluation): bind method/attr 1 lần, board rỗng dùng kết quả tính sẵn."""
+        ev = self._evaluate
+        empty = self._empty
+        flt = self._filter if self.min_score is not None else None
+        out: List[AqlResult] = []
+        append = out.append
+        if measures is None:
+            for defects in batch:
+                d = defects or []
+                if flt is not None:
+                    d = flt(d)
+                append(ev(d, None) if d or empty is None else empty)
+        else:
+            for defects, m in zip(batch, measures):
+                d = defects or []
+                if flt is not None:
+                    d = flt(d)
+                append(empty if not d and empty is not None and (not m or not self._thr) else ev(d, m))
+        return out
+
+    def decide(self, defects: Optional[List[Dict[str, Any]]], measures: Optional[Dict[str, Any]] = None) -> str:
+        """Chỉ cần PASS/FAIL: dừng ở vi phạm đầu tiên, không tính severity/reason."""
+        defects = defects or []
+        if self.min_score is not None:
+            defects = self._filter(defects)
+        n = len(defects)
+        if self.banned and n and not self.banned.isdisjoint([d.get("cls") for d in defects]):
+            return "FAIL"
+        if n > self.max_defects:
+            return "FAIL"
+        if self._limits and n > self._min_limit:
+            classes = [d.get("cls") for d in defects]
+            counts = Counter(classes)
+            if any(k.__class__ is not str for k in counts):
+                counts = Counter(map(str, classes))
+            for c, lim, _raw, _r in self._limits:
+                if counts.get(c, 0) > lim:
+                    return "FAIL"
+        if self._thr and (measures or self.thresholds_always):
+            m = measures or {}
+            for mkey, lim, _label, is_min, _raw, _r in self._thr:
+                v = m.get(mkey)
+                if v is not None and ((float(v) < lim) if is_min else (float(v) > lim)):
+                    return "FAIL"
+        return "PASS"
+
+
+# ---------------- cache ----------------
+# Spec trả về từ SpecRepository là cùng 1 dict cho tới khi hết TTL -> tra theo id trước (O(1), không hash);
+# spec mới (reload) mà nội dung không đổi vẫn dùng lại bản compile qua hash nội dung.
+# Spec được coi là bất biến sau khi đưa vào engine.
+_MAX_CACHE = 1024
+_BY_ID: Dict[Tuple[str, int], Tuple[Any, CompiledSpec]] = {}
+_BY_HASH: Dict[Tuple[str, str], CompiledSpec] = {}
+_LOCK = threading.Lock()
+
+
+def _compiled(kind: str, obj: Dict[str, Any], build) -> CompiledSpec:
+    key = (kind, id(obj))
+    ent = _BY_ID.get(key)
+    if ent is not None and ent[0] is obj:
+        return ent[1]
+    h = spec_hash(obj)
+    with _LOCK:
+        cs = _BY_HASH.get((kind, h))
+        if cs is None:
+            cs = build(h)
+            if len(_BY_HASH) >= _MAX_CACHE:
+                _BY_HASH.clear()
+            _BY_HASH[(kind, h)] = cs
+        if len(_BY_ID) >= _MAX_CACHE:
+            _BY_ID.clear()
+        # giữ ref tới obj để id không bị tái sử dụng khi còn trong cache
+        _BY_ID[key] = (obj, cs)
+    return cs
+
+
+def compile_spec(spec: Optional[Dict[str, Any]]) -> CompiledSpec:
+    """CompiledSpec cho spec của stream processor (cache theo object + hash nội dung)."""
+    if spec is None:
+        spec = {}
+    return _compiled("spec", spec, lambda h: CompiledSpec.from_spec(spec, h))
+
+
+def compile_rules(rules: Optional[Dict[str, Any]], defaults: Optional[Dict[str, Any]] = None) -> CompiledSpec:
+    """CompiledSpec cho rules của quick_decision; ``defaults`` được merge trước (như DEFAULT_RULES)."""
+    r = rules or {}
+    return _compiled("rules", r, lambda h: CompiledSpec.from_rules({**(defaults or {}), **r}, h))
+
+
+def cache_info() -> Dict[str, int]:
+    return {"by_id": len(_BY_ID), "by_hash": len(_BY_HASH)}
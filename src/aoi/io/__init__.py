@@ -1,6 +1,28 @@
-
 from __future__ import annotations
-from .minio_client import MinIOClient
-from .schema import build_inference_payload # type: ignore
+from typing import TYPE_CHECKING
+
+from .._lazy import attach
+
+_LAZY = {
+    "MinIOClient": ".minio_client",
+    "build_inference_payload": ".schema",
+    "SegmentLog": ".segments",
+    "RotatingJsonlWriter": ".jsonl_writer",
+    "iter_jsonl": ".jsonl_writer",
+    "AvroEncoder": ".avro_codec",
+    "compile_decoder": ".avro_codec",
+}
+
+__all__ = ["MinIOClient", "build_inference_payload", "SegmentLog", "RotatingJsonlWriter", "iter_jsonl",
+           "AvroEncoder", "compile_decoder"]
+
+
+__getattr__, __dir__ = attach(__name__, _LAZY, __all__)
+
 
-__all__ = ["MinIOClient", "build_inference_payload"]
+if TYPE_CHECKING:
+    from .minio_client import MinIOClient
+    from .schema import build_inference_payload
+    from .segments import SegmentLog
+    from .jsonl_writer import RotatingJsonlWriter, iter_jsonl
+    from .avro_codec import AvroEncoder, compile_decoder
@@ -0,0 +1,453 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from pathlib import Path
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+import threading
+
+try:
+    import fastavro  # type: ignore
+except Exception:
+    fastavro = None  # type: ignore
+
+log = logging.getLogger("aoi.io.avro_codec")
+
+MAGIC_BYTE = 0
+_MISSING = object()
+_PACK_F = struct.Struct("<f").pack
+_PACK_D = struct.Struct("<d").pack
+
+Encoder = Callable[[bytearray, Any], None]
+
+
+# ---------------- pure-Python encoder (compile 1 lần, dùng closure) ----------------
+def _write_long(out: bytearray, n: int) -> None:
+    n = (n << 1) ^ (n >> 63)
+    while n & ~0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _enc_null(out: bytearray, v: Any) -> None:
+    if v is not None:
+        raise ValueError(f"expected null, got {type(v).__name__}")
+
+
+def _enc_boolean(out: bytearray, v: Any) -> None:
+    out.append(1 if v else 0)
+
+
+def _enc_long(out: bytearray, v: Any) -> None:
+    _write_long(out, int(v))
+
+
+def _enc_float(out: bytearray, v: Any) -> None:
+    out += _PACK_F(float(v))
+
+
+def _enc_double(out: bytearray, v: Any) -> None:
+    out += _PACK_D(float(v))
+
+
+def _enc_string(out: bytearray, v: Any) -> None:
+    b = v.encode("utf-8")
+    _write_long(out, len(b))
+    out += b
+
+
+def _enc_bytes(out: bytearray, v: Any) -> None:
+    _write_long(out, len(v))
+    out += v
+
+
+_PRIMITIVES: Dict[str, Encoder] = {
+    "null": _enc_null, "boolean": _enc_boolean, "int": _enc_long, "long": _enc_long,
+    "float": _enc_float, "double": _enc_double, "string": _enc_string, "bytes": _enc_bytes,
+}
+
+# kiểu Python hợp lệ cho từng nhánh union (chọn nhánh đầu tiên khớp, giống fastavro)
+_PY_TYPES: Dict[str, Tuple[type, ...]] = {
+    "null": (type(None),), "boolean": (bool,), "int": (int,), "long": (int,),
+    "float": (int, float), "double": (int, float), "string": (str,), "bytes": (bytes, bytearray),
+    "record": (dict,), "map": (dict,), "array": (list, tuple), "enum": (str,),
+}
+
+
+def _type_name(schema: Any) -> str:
+    if isinstance(schema, str):
+        return schema
+    if isinstance(schema, dict):
+        return str(schema["type"])
+    return "union"
+
+
+def _fullname(name: str, namespace: Optional[str]) -> str:
+    return name if ("." in name or not namespace) else f"{namespace}.{name}"
+
+
+def _compile(schema: Any, named: Dict[str, Any], namespace: Optional[str]) -> Encoder:
+    if isinstance(schema, str):
+        if schema in _PRIMITIVES:
+            return _PRIMITIVES[schema]
+        key = schema if schema in named else _fullname(schema, namespace)
+        if key not in named:
+            raise ValueError(f"unknown Avro type {schema!r}")
+        # tham chiếu tới named type (có thể đệ quy) -> tra lúc encode
+        return lambda out, v, _k=key: named[_k][0](out, v)
+
+    if isinstance(schema, list):
+        branches = [(_compile(s, named, namespace), _type_name(s)) for s in schema]
+        if len(schema) == 2 and schema[0] == "null":
+            enc_val = branches[1][0]
+
+            def enc_nullable(out: bytearray, v: Any) -> None:
+                if v is None:
+                    out.append(0)
+                else:
+                    out.append(2)
+                    enc_val(out, v)
+            return enc_nullable
+
+        def enc_union(out: bytearray, v: Any) -> None:
+            for i, (enc, tname) in enumerate(branches):
+                types = _PY_TYPES.get(tname)
+                resolved = named.get(tname) or named.get(_fullname(tname, namespace))
+                if types is None and resolved is not None:
+                    types = _PY_TYPES.get(resolved[1])
+                if types is not None and isinstance(v, types) and not (tname in ("int", "long") and isinstance(v, bool)):
+                    _write_long(out, i)
+                    enc(out, v)
+                    return
+            raise ValueError(f"value of type {type(v).__name__} matches no branch of union {schema}")
+        return enc_union
+
+    t = schema["type"]
+    if t in _PRIMITIVES:
+        return _PRIMITIVES[t]
+
+    if t == "record":
+        full = _fullname(schema["name"], schema.get("namespace", namespace))
+        ns = full.rsplit(".", 1)[0] if "." in full else None
+        slot: List[Any] = [None, "record"]
+        named[full] = slot
+        named.setdefault(schema["name"], slot)
+        fields = [
+            (f["name"], _compile(f["type"], named, ns), f.get("default", _MISSING))
+            for f in schema["fields"]
+        ]
+
+        def enc_record(out: bytearray, v: Any) -> None:
+            get = v.get
+            for name, enc, default in fields:
+                x = get(name, _MISSING)
+                if x is _MISSING:
+                    if default is _MISSING:
+                        raise ValueError(f"{full}: missing required field {name!r}")
+                    x = default
+                enc(out, x)
+        slot[0] = enc_record
+        return enc_record
+
+    if t == "array":
+        enc_item = _compile(schema["items"], named, namespace)
+
+        def enc_array(out: bytearray, v: Any) -> None:
+            if v:
+                _write_long(out, len(v))
+                for x in v:
+                    enc_item(out, x)
+            out.append(0)
+        return enc_array
+
+    if t == "map":
+        enc_val = _compile(schema["values"], named, namespace)
+
+        def enc_map(out: bytearray, v: Any) -> None:
+            if v:
+                _write_long(out, len(v))
+                for k, x in v.items():
+                    _enc_string(out, k)
+                    enc_val(out, x)
+            out.append(0)
+        return enc_map
+
+    if t == "enum":
+        full = _fullname(schema["name"], schema.get("namespace", namespace))
+        index = {s: i for i, s in enumerate(schema["symbols"])}
+
+        def enc_enum(out: bytearray, v: Any) -> None:
+            _write_long(out, index[v])
+        named[full] = [enc_enum, "enum"]
+        return enc_enum
+
+    if t == "fixed":
+        full = _fullname(schema["name"], schema.get("namespace", namespace))
+
+        def enc_fixed(out: bytearray, v: Any) -> None:
+            out += v
+        named[full] = [enc_fixed, "fixed"]
+        return enc_fixed
+
+    raise ValueError(f"unsupported Avro type {t!r}")
+
+
+def compile_encoder(schema: Dict[str, Any] | str) -> Encoder:
+    """Biên dịch schema thành hàm ``enc(out: bytearray, record)`` (Avro binary, không header)."""
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+    return _compile(schema, {}, None)
+
+
+# ---------------- pure-Python decoder ----------------
+Decoder = Callable[[bytes, int], Tuple[Any, int]]
+_UNPACK_F = struct.Struct("<f").unpack_from
+_UNPACK_D = struct.Struct("<d").unpack_from
+
+
+def _read_long(buf: bytes, pos: int) -> Tuple[int, int]:
+    b = buf[pos]
+    pos += 1
+    n = b & 0x7F
+    shift = 7
+    while b & 0x80:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        shift += 7
+    return (n >> 1) ^ -(n & 1), pos
+
+
+def _dec_null(buf: bytes, pos: int) -> Tuple[Any, int]:
+    return None, pos
+
+
+def _dec_boolean(buf: bytes, pos: int) -> Tuple[Any, int]:
+    return buf[pos] != 0, pos + 1
+
+
+def _dec_float(buf: bytes, pos: int) -> Tuple[Any, int]:
+    return _UNPACK_F(buf, pos)[0], pos + 4
+
+
+def _dec_double(buf: bytes, pos: int) -> Tuple[Any, int]:
+    return _UNPACK_D(buf, pos)[0], pos + 8
+
+
+def _dec_string(buf: bytes, pos: int) -> Tuple[Any, int]:
+    n, pos = _read_long(buf, pos)
+    return buf[pos:pos + n].decode("utf-8"), pos + n
+
+
+def _dec_bytes(buf: bytes, pos: int) -> Tuple[Any, int]:
+    n, pos = _read_long(buf, pos)
+    return bytes(buf[pos:pos + n]), pos + n
+
+
+_PRIMITIVE_DEC: Dict[str, Decoder] = {
+    "null": _dec_null, "boolean": _dec_boolean, "int": _read_long, "long": _read_long,
+    "float": _dec_float, "double": _dec_double, "string": _dec_string, "bytes": _dec_bytes,
+}
+
+
+def _compile_dec(schema: Any, named: Dict[str, Any], namespace: Optional[str]) -> Decoder:
+    if isinstance(schema, str):
+        if schema in _PRIMITIVE_DEC:
+            return _PRIMITIVE_DEC[schema]
+        key = schema if schema in named else _fullname(schema, namespace)
+        if key not in named:
+            raise ValueError(f"unknown Avro type {schema!r}")
+        return lambda buf, pos, _k=key: named[_k][0](buf, pos)
+
+    if isinstance(schema, list):
+        branches = [_compile_dec(s, named, namespace) for s in schema]
+
+        def dec_union(buf: bytes, pos: int) -> Tuple[Any, int]:
+            i, pos = _read_long(buf, pos)
+            return branches[i](buf, pos)
+        return dec_union
+
+    t = schema["type"]
+    if t in _PRIMITIVE_DEC:
+        return _PRIMITIVE_DEC[t]
+
+    if t == "record":
+        full = _fullname(schema["name"], schema.get("namespace", namespace))
+        ns = full.rsplit(".", 1)[0] if "." in full else None
+        slot: List[Any] = [None]
+        named[full] = slot
+        named.setdefault(schema["name"], slot)
+        fields = [(f["name"], _compile_dec(f["type"], named, ns)) for f in schema["fields"]]
+
+        def dec_record(buf: bytes, pos: int) -> Tuple[Any, int]:
+            d: Dict[str, Any] = {}
+            for name, dec in fields:
+                d[name], pos = dec(buf, pos)
+            return d, pos
+        slot[0] = dec_record
+        return dec_record
+
+    if t in ("array", "map"):
+        dec_item = _compile_dec(schema["items" if t == "array" else "values"], named, namespace)
+        is_map = t == "map"
+
+        def dec_blocks(buf: bytes, pos: int) -> Tuple[Any, int]:
+            out: Any = {} if is_map else []
+            while True:
+                n, pos = _read_long(buf, pos)
+                if n == 0:
+                    return out, pos
+                if n < 0:
+                    n = -n
+                    _, pos = _read_long(buf, pos)  # block size (bytes), không cần
+                for _ in range(n):
+                    if is_map:
+                        k, pos = _dec_string(buf, pos)
+                        out[k], pos = dec_item(buf, pos)
+                    else:
+                        v, pos = dec_item(buf, pos)
+                        out.append(v)
+        return dec_blocks
+
+    if t == "enum":
+        symbols = list(schema["symbols"])
+
+        def dec_enum(buf: bytes, pos: int) -> Tuple[Any, int]:
+            i, pos = _read_long(buf, pos)
+            return symbols[i], pos
+        named[_fullname(schema["name"], schema.get("namespace", namespace))] = [dec_enum]
+        return dec_enum
+
+    if t == "fixed":
+        size = int(schema["size"])
+
+        def dec_fixed(buf: bytes, pos: int) -> Tuple[Any, int]:
+            return bytes(buf[pos:pos + size]), pos + size
+        named[_fullname(schema["name"], schema.get("namespace", namespace))] = [dec_fixed]
+        return dec_fixed
+
+    raise ValueError(f"unsupported Avro type {t!r}")
+
+
+def compile_decoder(schema: Dict[str, Any] | str) -> Decoder:
+    """Biên dịch writer schema thành ``dec(buf, pos) -> (record, pos)`` (không resolve reader schema)."""
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+    return _compile_dec(schema, {}, None)
+
+
+# ---------------- encoder wire-format Confluent ----------------
+class AvroEncoder:
+    """Encode record theo Confluent wire format: 0x00 + schema_id (u32 BE) + Avro binary.
+
+    Schema được parse/compile 1 lần. backend="python" (mặc định) dùng encoder closure ở trên,
+    không cần thư viện ngoài và nhanh hơn fastavro.schemaless_writer với record nhỏ
+    (xem benchmarks/bench_avro.py); "fastavro" dùng schemaless_writer với schema đã parse.
+    """
+
+    def __init__(self, schema: Dict[str, Any] | str, schema_id: int, backend: str = "python"):
+        self.schema = json.loads(schema) if isinstance(schema, str) else schema
+        self.schema_id = int(schema_id)
+        self._header = struct.pack(">bI", MAGIC_BYTE, self.schema_id)
+        if backend == "fastavro":
+            if fastavro is None:
+                raise RuntimeError("backend=fastavro requires fastavro. Install: pip install fastavro")
+            self._parsed = fastavro.parse_schema(self.schema)
+        elif backend == "python":
+            self._enc = compile_encoder(self.schema)
+        else:
+            raise ValueError(f"backend must be python|fastavro, got {backend!r}")
+        self.backend = backend
+
+    def encode(self, record: Dict[str, Any]) -> bytes:
+        if self.backend == "fastavro":
+            buf = io.BytesIO()
+            buf.write(self._header)
+            fastavro.schemaless_writer(buf, self._parsed, record)
+            return buf.getvalue()
+        out = bytearray(self._header)
+        self._enc(out, record)
+        return bytes(out)
+
+    def __call__(self, record: Dict[str, Any], ctx: Any = None) -> bytes:
+        # cùng chữ ký với AvroSerializer(obj, ctx) để thay thế trực tiếp
+        return self.encode(record)
+
+
+# ---------------- cache schema ID ----------------
+def schema_fingerprint(schema: Dict[str, Any] | str) -> str:
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+    canonical = json.dumps(schema, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SchemaIdCache:
+    """File JSON nhỏ: (registry, subject, fingerprint) -> schema ID, để khởi động không cần gọi registry."""
+
+    _lock = threading.Lock()
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    @staticmethod
+    def _key(registry_url: str, subject: str, fingerprint: str) -> str:
+        return f"{registry_url.rstrip('/')}|{subject}|{fingerprint}"
+
+    def _load(self) -> Dict[str, int]:
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            log.warning("ignoring unreadable schema-id cache %s: %s", self.path, e)
+            return {}
+
+    def get(self, registry_url: str, subject: str, fingerprint: str) -> Optional[int]:
+        v = self._load().get(self._key(registry_url, subject, fingerprint))
+        return int(v) if v is not None else None
+
+    def put(self, registry_url: str, subject: str, fingerprint: str, schema_id: int) -> None:
+        with self._lock:
+            data = self._load()
+            data[self._key(registry_url, subject, fingerprint)] = int(schema_id)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(data, indent=2, sort_keys=True), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def resolve_schema_id(
+    schema_str: str,
+    subject: str,
+    registry_url: str,
+    cache_path: Optional[str | Path] = None,
+    sr_client: Any = None,
+) -> int:
+    """Schema ID cho (subject, schema): lấy từ cache local nếu có, nếu không thì đăng ký với registry
+    (giống auto.register.schemas của AvroSerializer) rồi ghi cache."""
+    fp = schema_fingerprint(schema_str)
+    cache = SchemaIdCache(cache_path) if cache_path else None
+    if cache is not None:
+        sid = cache.get(registry_url, subject, fp)
+        if sid is not None:
+            return sid
+
+    if sr_client is None:
+        try:
+            from confluent_kafka.schema_registry import SchemaRegistryClient  # type: ignore
+        except Exception as e:
+            raise RuntimeError("schema registry lookup requires confluent_kafka. "
+                               "Install: pip install 'confluent-kafka[avro]'") from e
+        sr_client = SchemaRegistryClient({"url": registry_url})
+    from confluent_kafka.schema_registry import Schema  # type: ignore
+
+    sid = int(sr_client.register_schema(subject, Schema(schema_str, "AVRO")))
+    log.info("registered schema subject=%s id=%d", subject, sid)
+    if cache is not None:
+        cache.put(registry_url, subject, fp, sid)
+    return sid
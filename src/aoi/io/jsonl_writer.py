@@ -0,0 +1,232 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional
+from pathlib import Path
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+try:
+    import zstandard as zstd  # type: ignore
+except Exception:
+    zstd = None  # type: ignore
+
+log = logging.getLogger("aoi.io.jsonl_writer")
+
+# <stem>.<YYYYmmddTHHMMSS>.<seq><suffix>[.zst]
+_ROTATED_RE = re.compile(r"^(?P<stem>.+)\.(?P<stamp>\d{8}T\d{6})\.(?P<seq>\d{6})(?P<suffix>\.[^.]+)(?P<zst>\.zst)?$")
+
+
+class RotatingJsonlWriter:
+    """Ghi JSONL qua 1 file handle mở sẵn, gom nhiều event rồi mới ghi (group commit).
+
+    - Buffer trong RAM được ghi xuống khi đạt ``flush_bytes`` hoặc sau ``flush_interval_s``
+      (thread nền), nên publish() chỉ là encode + append vào bytearray.
+    - File đang ghi luôn là ``path``; khi vượt ``rotate_bytes`` hoặc ``rotate_interval_s`` nó
+      được đổi tên thành ``<stem>.<YYYYmmddTHHMMSS>.<seq>.jsonl`` và (tuỳ chọn) nén zstd
+      thành ``.jsonl.zst``. Dùng ``jsonl_segments``/``iter_jsonl`` để đọc lại theo thứ tự.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        flush_bytes: int = 64 * 1024,
+        flush_interval_s: float = 0.2,
+        rotate_bytes: int = 256 * 1024 * 1024,
+        rotate_interval_s: float = 0.0,
+        compress: str = "none",
+        zstd_level: int = 3,
+        fsync: bool = False,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.flush_bytes = max(1, int(flush_bytes))
+        self.flush_interval_s = max(0.0, float(flush_interval_s))
+        self.rotate_bytes = int(rotate_bytes)
+        self.rotate_interval_s = float(rotate_interval_s)
+        self.compress = (compress or "none").lower()
+        if self.compress not in ("none", "zstd"):
+            raise ValueError(f"compress must be none|zstd, got {compress!r}")
+        if self.compress == "zstd" and zstd is None:
+            log.warning("zstandard is not installed; rotated segments stay uncompressed. Install: pip install zstandard")
+            self.compress = "none"
+        self.zstd_level = int(zstd_level)
+        self.fsync = bool(fsync)
+
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._buf = bytearray()
+        self._seq = max((int(m.group("seq")) for m in map(_ROTATED_RE.match, (q.name for q in jsonl_segments(self.path)))
+                         if m is not None), default=0)
+        self._f = open(self.path, "ab")
+        self._opened_at = time.time()
+        self._written = self._f.tell()
+        self.events = 0
+        self.flushes = 0
+        self.rotations = 0
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if self.flush_interval_s > 0:
+            self._thread = threading.Thread(target=self._run, name=f"aoi-jsonl-{self.path.stem}", daemon=True)
+            self._thread.start()
+
+    def write(self, obj: Dict[str, Any]) -> None:
+        line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._buf += line
+            self.events += 1
+            full = len(self._buf) >= self.flush_bytes or self.flush_interval_s <= 0
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._io_lock:
+            with self._lock:
+                if not self._buf:
+                    data = b""
+                else:
+                    data = bytes(self._buf)
+                    self._buf.clear()
+            if data:
+                self._f.write(data)
+                self._f.flush()
+                if self.fsync:
+                    os.fsync(self._f.fileno())
+                self._written += len(data)
+                self.flushes += 1
+            if self._should_rotate():
+                self._rotate()
+
+    def _should_rotate(self) -> bool:
+        if self._written <= 0:
+            return False
+        if self.rotate_bytes > 0 and self._written >= self.rotate_bytes:
+            return True
+        return self.rotate_interval_s > 0 and (time.time() - self._opened_at) >= self.rotate_interval_s
+
+    def _rotate(self) -> None:
+        self._f.close()
+        self._seq += 1
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}.{self._seq:06d}{self.path.suffix}")
+        os.replace(self.path, rotated)
+        self._f = open(self.path, "ab")
+        self._opened_at = time.time()
+        self._written = 0
+        self.rotations += 1
+        log.info("rotated %s -> %s", self.path, rotated.name)
+        if self.compress == "zstd":
+            threading.Thread(target=_compress_segment, args=(rotated, self.zstd_level), daemon=True).start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval_s):
+            try:
+                self.flush()
+            except Exception as e:
+                log.error("jsonl flush failed (%s): %s", self.path, e)
+
+    def healthy(self) -> bool:
+        return not self._f.closed
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self.flush()
+        with self._io_lock:
+            self._f.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "events": self.events,
+            "flushes": self.flushes,
+            "rotations": self.rotations,
+            "buffered_bytes": len(self._buf),
+            "compress": self.compress,
+        }
+
+    @classmethod
+    def from_config(cls, path: str | Path, cfg: Optional[Dict[str, Any]]) -> "RotatingJsonlWriter":
+        c = cfg or {}
+        return cls(
+            path,
+            flush_bytes=int(c.get("flush_kb", 64)) * 1024,
+            flush_interval_s=float(c.get("flush_interval_ms", 200)) / 1000.0,
+            rotate_bytes=int(float(c.get("rotate_mb", 256)) * 1024 * 1024),
+            rotate_interval_s=float(c.get("rotate_interval_s", 0)),
+            compress=str(c.get("compress", "none")),
+            zstd_level=int(c.get("zstd_level", 3)),
+            fsync=bool(c.get("fsync", False)),
+        )
+
+
+def _compress_segment(path: Path, level: int = 3) -> Optional[Path]:
+    out = path.with_name(path.name + ".zst")
+    tmp = out.with_name(out.name + ".tmp")
+    try:
+        cctx = zstd.ZstdCompressor(level=level)
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            cctx.copy_stream(src, dst)
+        os.replace(tmp, out)
+        path.unlink()
+        return out
+    except Exception as e:
+        log.error("zstd compression of %s failed: %s", path, e)
+        try:
+            tmp.unlink()
+        except OSError:
+            pass
+        return None
+
+
+def jsonl_segments(path: str | Path) -> List[Path]:
+    """Các segment của 1 JSONL đã xoay vòng, theo thứ tự ghi: segment cũ (.jsonl / .jsonl.zst) rồi file đang ghi.
+
+    Nếu ``path`` là 1 segment cụ thể (vd. file .zst) thì chỉ trả về chính nó.
+    """
+    p = Path(path)
+    if p.name.endswith(".zst") or _ROTATED_RE.match(p.name):
+        return [p]
+    segs: Dict[tuple, Path] = {}
+    for q in p.parent.glob(f"{p.stem}.*"):
+        m = _ROTATED_RE.match(q.name)
+        if m is None or m.group("stem") != p.stem or m.group("suffix") != p.suffix:
+            continue
+        # cùng segment có thể tồn tại ở cả 2 dạng trong lúc đang nén -> ưu tiên bản gốc
+        key = (m.group("stamp"), m.group("seq"))
+        if key not in segs or not m.group("zst"):
+            segs[key] = q
+    out = [segs[k] for k in sorted(segs)]
+    if p.exists():
+        out.append(p)
+    return out
+
+
+def open_jsonl(path: str | Path) -> io.TextIOBase:
+    p = Path(path)
+    if p.name.endswith(".zst"):
+        if zstd is None:
+            raise RuntimeError(f"{p} is zstd-compressed. Install: pip install zstandard")
+        raw = zstd.ZstdDecompressor().stream_reader(open(p, "rb"), closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8")
+    return open(p, "r", encoding="utf-8")
+
+
+def iter_jsonl(path: str | Path, include_rotated: bool = True) -> Iterator[Dict[str, Any]]:
+    """Đọc JSONL (kể cả segment đã xoay/nén); dòng hỏng được log và bỏ qua."""
+    paths = jsonl_segments(path) if include_rotated else [Path(path)]
+    for seg in paths:
+        with open_jsonl(seg) as f:
+            for ln, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except Exception as e:
+                    log.warning("invalid json at %s:%d: %s", seg.name, ln, e)
@@ -1,12 +1,11 @@
 from __future__ import annotations
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 import io
 import time
 import datetime as dt
 
-import cv2
 from minio import Minio # type: ignore
-from minio.error import S3Error # type: ignore
+from minio.error import S3Error, ServerError # type: ignore
 
 
 class MinIOClient:
@@ -33,6 +32,8 @@ class MinIOClient:
             bucket = self.default_bucket
         self._ensure_bucket(bucket)
 
+        import cv2  # lazy: tránh kéo OpenCV khi chỉ cần put_bytes/spec
+
         ok, buf = cv2.imencode(".jpg", img_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality_jpeg)])
         if not ok:
             raise RuntimeError("Failed to encode image as JPEG.")
@@ -75,6 +76,32 @@ class MinIOClient:
             return url
         return f"s3://{bucket}/{key}"
 
+    def get_bytes_if_changed(self, key: str, etag: Optional[str] = None,
+                             bucket: Optional[str] = None) -> Tuple[Optional[bytes], Optional[str]]:
+        """GET có điều kiện (If-None-Match). Trả (data, etag); (None, etag cũ) nếu 304 Not Modified.
+
+        Object không tồn tại -> S3Error (code NoSuchKey).
+        """
+        bucket = bucket or self.default_bucket
+        if not bucket:
+            raise ValueError("Bucket is not provided and default_bucket is None.")
+        headers = {"If-None-Match": etag} if etag else None
+        try:
+            resp = self.client.get_object(bucket, key, request_headers=headers)
+        except ServerError as e:
+            if getattr(e, "status_code", None) == 304:
+                return None, etag
+            raise
+        try:
+            return resp.read(), resp.headers.get("ETag")
+        finally:
+            resp.close()
+            resp.release_conn()
+
+    def list_keys(self, prefix: str, bucket: Optional[str] = None) -> List[str]:
+        bucket = bucket or self.default_bucket
+        return [o.object_name for o in self.client.list_objects(bucket, prefix=prefix, recursive=True)]
+
     @staticmethod
     def make_overlay_key(product_code: str, event_id: str, ts: Optional[int] = None) -> str:
 
@@ -0,0 +1,257 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pathlib import Path
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock
+    fcntl = None
+
+log = logging.getLogger("aoi.io.segments")
+
+# record = <u32 len><u32 crc32(payload)><payload>
+_HDR = struct.Struct("<II")
+
+Position = Tuple[int, int]  # (segment seq, byte offset)
+
+
+class SegmentLog:
+    """Log append-only trên đĩa, chia segment theo kích thước, có cursor đọc bền vững.
+
+    - ``append`` ghi record có độ dài + CRC; segment đầy thì xoay sang file mới.
+    - ``fsync``: "always" (mỗi append), "interval" (tối đa 1 lần / fsync_interval_s), "never" (để OS lo).
+    - ``read`` trả về record từ cursor theo đúng thứ tự ghi; ``ack`` đẩy cursor và xoá segment đã đọc hết.
+    - Khi mở lại, đuôi segment cuối bị ghi dở (crash) được cắt bỏ.
+    - Mỗi thư mục chỉ 1 instance (``flock`` độc quyền trên ``LOCK``); mở lần 2 -> RuntimeError.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        segment_bytes: int = 64 * 1024 * 1024,
+        fsync: str = "interval",
+        fsync_interval_s: float = 1.0,
+    ):
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"fsync must be always|interval|never, got {fsync!r}")
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._lockf = self._acquire_dir_lock()
+        self.segment_bytes = max(4096, int(segment_bytes))
+        self.fsync = fsync
+        self.fsync_interval_s = float(fsync_interval_s)
+        self._lock = threading.RLock()
+        self._last_sync = time.monotonic()
+        self._dirty = False
+
+        self._segments: List[int] = sorted(int(p.stem) for p in self.dir.glob("*.seg") if p.stem.isdigit())
+        self._cursor: Position = self._load_cursor()
+        if not self._segments:
+            self._segments = [max(1, self._cursor[0])]
+            self._path(self._segments[0]).touch()
+        if self._cursor[0] < self._segments[0]:
+            self._cursor = (self._segments[0], 0)
+
+        self._truncate_torn_tail(self._segments[-1])
+        self._w = open(self._path(self._segments[-1]), "ab")
+        self._pending = self._count_from(self._cursor)
+        if self._pending:
+            log.info("segment log %s: %d pending record(s) in %d segment(s)",
+                     self.dir, self._pending, len(self._segments))
+
+    # ---------- files ----------
+    def _acquire_dir_lock(self):
+        # 2 process cùng thư mục sẽ cắt đuôi segment của nhau và replay/ack trùng record
+        f = open(self.dir / "LOCK", "a+")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                raise RuntimeError(f"segment log {self.dir} is already open by another process or instance")
+        return f
+
+    def _path(self, seq: int) -> Path:
+        return self.dir / f"{seq:020d}.seg"
+
+    def _load_cursor(self) -> Position:
+        p = self.dir / "cursor.json"
+        try:
+            d = json.loads(p.read_text(encoding="utf-8"))
+            return int(d["segment"]), int(d["offset"])
+        except FileNotFoundError:
+            return (self._segments[0] if self._segments else 1), 0
+        except Exception as e:
+            log.error("invalid cursor file %s (%s); replaying from the oldest segment", p, e)
+            return (self._segments[0] if self._segments else 1), 0
+
+    def _save_cursor(self) -> None:
+        p = self.dir / "cursor.json"
+        tmp = p.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": self._cursor[0], "offset": self._cursor[1]}, f)
+            if self.fsync != "never":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, p)
+
+    def _iter_file(self, seq: int, offset: int):
+        """Yield (payload, end_offset) từ offset; dừng ở record hỏng/ghi dở."""
+        with open(self._path(seq), "rb") as f:
+            f.seek(offset)
+            pos = offset
+            while True:
+                hdr = f.read(_HDR.size)
+                if len(hdr) < _HDR.size:
+                    return
+                n, crc = _HDR.unpack(hdr)
+                data = f.read(n)
+                if len(data) < n or (zlib.crc32(data) & 0xFFFFFFFF) != crc:
+                    if seq != self._segments[-1]:
+                        log.error("corrupt record in %s at offset %d; skipping rest of segment", self._path(seq), pos)
+                    return
+                pos += _HDR.size + n
+                yield data, pos
+
+    def _truncate_torn_tail(self, seq: int) -> None:
+        path = self._path(seq)
+        end = 0
+        for _, end in self._iter_file(seq, 0):
+            pass
+        size = path.stat().st_size
+        if size > end:
+            log.warning("truncating torn tail of %s: %d -> %d bytes", path, size, end)
+            with open(path, "r+b") as f:
+                f.truncate(end)
+
+    def _count_from(self, pos: Position) -> int:
+        n = 0
+        for seq in self._segments:
+            if seq < pos[0]:
+                continue
+            for _ in self._iter_file(seq, pos[1] if seq == pos[0] else 0):
+                n += 1
+        return n
+
+    def _maybe_sync(self, force: bool = False) -> None:
+        self._w.flush()
+        if self.fsync == "never":
+            return
+        now = time.monotonic()
+        if force or self.fsync == "always" or (now - self._last_sync) >= self.fsync_interval_s:
+            os.fsync(self._w.fileno())
+            self._last_sync = now
+            self._dirty = False
+        else:
+            self._dirty = True
+
+    def _rotate(self) -> None:
+        self._maybe_sync(force=True)
+        self._w.close()
+        seq = self._segments[-1] + 1
+        self._segments.append(seq)
+        self._w = open(self._path(seq), "ab")
+
+    # ---------- API ----------
+    def append(self, data: bytes) -> None:
+        self.append_many((data,))
+
+    def append_many(self, records: Iterable[bytes]) -> int:
+        n = 0
+        with self._lock:
+            for data in records:
+                self._w.write(_HDR.pack(len(data), zlib.crc32(data) & 0xFFFFFFFF))
+                self._w.write(data)
+                n += 1
+                if self._w.tell() >= self.segment_bytes:
+                    self._rotate()
+            self._pending += n
+            self._maybe_sync()
+        return n
+
+    def read(self, max_records: int = 500) -> Tuple[List[bytes], Position]:
+        """Đọc tối đa max_records từ cursor (không đẩy cursor). Trả về (records, vị trí sau record cuối)."""
+        out: List[bytes] = []
+        with self._lock:
+            if not self._w.closed:
+                self._w.flush()
+            pos = self._cursor
+            for seq in self._segments:
+                if seq < pos[0]:
+                    continue
+                start = pos[1] if seq == pos[0] else 0
+                pos = (seq, start)
+                for data, end in self._iter_file(seq, start):
+                    out.append(data)
+                    pos = (seq, end)
+                    if len(out) >= max_records:
+                        return out, pos
+                if seq != self._segments[-1]:
+                    pos = (seq + 1, 0)
+        return out, pos
+
+    def ack(self, pos: Position, count: int) -> None:
+        """Đánh dấu đã xử lý xong tới pos (``count`` record); xoá segment cũ."""
+        with self._lock:
+            self._cursor = pos
+            self._pending = max(0, self._pending - int(count))
+            self._save_cursor()
+            while len(self._segments) > 1 and self._segments[0] < pos[0]:
+                seq = self._segments.pop(0)
+                try:
+                    self._path(seq).unlink()
+                except OSError as e:
+                    log.warning("cannot delete segment %s: %s", self._path(seq), e)
+
+    def pending(self) -> int:
+        return self._pending
+
+    def backlog(self) -> Dict[str, Any]:
+        with self._lock:
+            if not self._w.closed:
+                self._w.flush()
+            size = 0
+            for seq in self._segments:
+                if seq >= self._cursor[0]:
+                    try:
+                        size += self._path(seq).stat().st_size
+                    except OSError:
+                        pass
+            size -= self._cursor[1]
+            return {
+                "records": self._pending,
+                "bytes": max(0, size),
+                "segments": len(self._segments),
+                "dir": str(self.dir),
+            }
+
+    def sync(self, only_if_dirty: bool = False) -> None:
+        with self._lock:
+            if self._w.closed or (only_if_dirty and not self._dirty):
+                return
+            self._maybe_sync(force=True)
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._w.closed:
+                self._maybe_sync(force=True)
+                self._w.close()
+            if not self._lockf.closed:
+                self._lockf.close()  # đóng fd -> nhả flock
+
+    @classmethod
+    def from_config(cls, cfg: Optional[Dict[str, Any]], default_dir: str | Path) -> "SegmentLog":
+        c = cfg or {}
+        return cls(
+            directory=c.get("dir") or default_dir,
+            segment_bytes=int(float(c.get("segment_mb", 64)) * 1024 * 1024),
+            fsync=str(c.get("fsync", "interval")),
+            fsync_interval_s=float(c.get("fsync_interval_ms", 1000)) / 1000.0,
+        )
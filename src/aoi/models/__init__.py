@@ -1,4 +1,18 @@
 from __future__ import annotations
-from .yolo_runner import YoloV8DetONNX, DetBox
+from typing import TYPE_CHECKING
 
-__all__ = ["YoloV8DetONNX", "DetBox"]
\ No newline at end of file
+from .._lazy import attach
+
+_LAZY = {
+    "YoloV8DetONNX": ".yolo_runner",
+    "DetBox": ".yolo_runner",
+}
+
+__all__ = ["YoloV8DetONNX", "DetBox"]
+
+
+__getattr__, __dir__ = attach(__name__, _LAZY, __all__)
+
+
+if TYPE_CHECKING:
+    from .yolo_runner import YoloV8DetONNX, DetBox
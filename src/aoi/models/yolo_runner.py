@@ -69,6 +69,16 @@ class YoloV8DetONNX:
             keep_indices = self._nms_global(dets, iou_thres)
 
         kept = [dets[i].as_dict() for i in keep_indices]
+
+        # tile lớn hơn imgsz (vd. chế độ degrade) -> đưa bbox về toạ độ của tile gốc
+        th, tw = img_bgr_tile.shape[:2]
+        if th != self.imgsz or tw != self.imgsz:
+            sx = tw / float(self.imgsz)
+            sy = th / float(self.imgsz)
+            for d in kept:
+                b = d["bbox"]
+                b["x"] = int(round(b["x"] * sx)); b["w"] = int(round(b["w"] * sx))
+                b["y"] = int(round(b["y"] * sy)); b["h"] = int(round(b["h"] * sy))
         return kept
 
 
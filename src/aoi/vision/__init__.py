@@ -1,7 +1,23 @@
 from __future__ import annotations
-from .registration import register_to_template
-from .tiling import tile_960
-from .postproc import merge_tiles
-from .overlay import draw_overlay
+from typing import TYPE_CHECKING
+
+from .._lazy import attach
+
+_LAZY = {
+    "register_to_template": ".registration",
+    "tile_960": ".tiling",
+    "merge_tiles": ".postproc",
+    "draw_overlay": ".overlay",
+}
 
 __all__ = ["register_to_template", "tile_960", "merge_tiles", "draw_overlay"]
+
+
+__getattr__, __dir__ = attach(__name__, _LAZY, __all__)
+
+
+if TYPE_CHECKING:
+    from .registration import register_to_template
+    from .tiling import tile_960
+    from .postproc import merge_tiles
+    from .overlay import draw_overlay
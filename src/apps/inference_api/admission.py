@@ -0,0 +1,200 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+import asyncio
+import logging
+import time
+
+log = logging.getLogger("aoi.inference_api.admission")
+
+
+class AdmissionRejected(Exception):
+
+    def __init__(self, status_code: int, reason: str, retry_after_s: int = 1):
+        super().__init__(reason)
+        self.status_code = int(status_code)
+        self.reason = reason
+        self.retry_after_s = max(1, int(retry_after_s))
+
+
+@dataclass
+class _StationState:
+    sem: asyncio.Semaphore
+    inflight: int = 0
+    queued: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    timeouts: int = 0
+    queue_wait_ms_total: float = 0.0
+    queue_wait_ms_max: float = 0.0
+
+
+@dataclass
+class _Counters:
+    accepted: int = 0
+    rejected_station: int = 0
+    rejected_global: int = 0
+    timeouts: int = 0
+    queue_wait_ms_total: float = 0.0
+    queue_wait_ms_max: float = 0.0
+    by_station: Dict[str, _StationState] = field(default_factory=dict)
+
+
+class AdmissionController:
+    """Giới hạn số request /v1/infer chạy đồng thời (global + theo station).
+
+    Mỗi request chờ slot của station trước, rồi mới chờ slot global, nên một
+    station chậm chỉ chiếm tối đa ``max_inflight_per_station`` slot global và
+    hàng đợi của nó không chen vào hàng đợi của station khác.
+    """
+
+    def __init__(
+        self,
+        max_inflight: int = 4,
+        max_inflight_per_station: int = 2,
+        max_queue: int = 16,
+        max_queue_per_station: int = 4,
+        queue_timeout_s: float = 2.0,
+        retry_after_s: int = 1,
+    ):
+        self.max_inflight = max(1, int(max_inflight))
+        self.max_inflight_per_station = max(1, int(max_inflight_per_station))
+        self.max_queue = max(0, int(max_queue))
+        self.max_queue_per_station = max(0, int(max_queue_per_station))
+        self.queue_timeout_s = float(queue_timeout_s)
+        self.retry_after_s = int(retry_after_s)
+
+        self._global = asyncio.Semaphore(self.max_inflight)
+        self._inflight = 0
+        self._queued = 0
+        self._c = _Counters()
+
+    def _station(self, station_id: str) -> _StationState:
+        st = self._c.by_station.get(station_id)
+        if st is None:
+            st = _StationState(sem=asyncio.Semaphore(self.max_inflight_per_station))
+            self._c.by_station[station_id] = st
+        return st
+
+    @staticmethod
+    async def _acquire_sem(sem: asyncio.Semaphore, deadline: float) -> None:
+        # slot trống -> lấy ngay, không qua wait_for (timeout=0 luôn raise TimeoutError kể cả khi semaphore rảnh);
+        # chỉ timeout khi thật sự phải chờ
+        if not sem.locked():
+            await sem.acquire()
+            return
+        await asyncio.wait_for(sem.acquire(), timeout=max(0.0, deadline - time.perf_counter()))
+
+    async def acquire(self, station_id: str) -> float:
+        """Chiếm 1 slot; trả về thời gian chờ (ms). Raise AdmissionRejected nếu quá tải."""
+        st = self._station(station_id)
+
+        if st.inflight + st.queued >= self.max_inflight_per_station + self.max_queue_per_station:
+            st.rejected += 1
+            self._c.rejected_station += 1
+            raise AdmissionRejected(429, f"station '{station_id}' queue is full", self.retry_after_s)
+
+        if self._inflight + self._queued >= self.max_inflight + self.max_queue:
+            st.rejected += 1
+            self._c.rejected_global += 1
+            raise AdmissionRejected(503, "inference queue is full", self.retry_after_s)
+
+        t0 = time.perf_counter()
+        deadline = t0 + self.queue_timeout_s
+        st.queued += 1
+        self._queued += 1
+        got_station = False
+        try:
+            await self._acquire_sem(st.sem, deadline)
+            got_station = True
+            await self._acquire_sem(self._global, deadline)
+        except asyncio.TimeoutError:
+            if got_station:
+                st.sem.release()
+            st.timeouts += 1
+            self._c.timeouts += 1
+            raise AdmissionRejected(503, "timed out waiting for an inference slot", self.retry_after_s)
+        except BaseException:
+            if got_station:
+                st.sem.release()
+            raise
+        finally:
+            st.queued -= 1
+            self._queued -= 1
+
+        wait_ms = (time.perf_counter() - t0) * 1000.0
+        st.inflight += 1
+        self._inflight += 1
+        st.accepted += 1
+        self._c.accepted += 1
+        st.queue_wait_ms_total += wait_ms
+        st.queue_wait_ms_max = max(st.queue_wait_ms_max, wait_ms)
+        self._c.queue_wait_ms_total += wait_ms
+        self._c.queue_wait_ms_max = max(self._c.queue_wait_ms_max, wait_ms)
+        return wait_ms
+
+    def release(self, station_id: str) -> None:
+        st = self._station(station_id)
+        st.inflight -= 1
+        self._inflight -= 1
+        self._global.release()
+        st.sem.release()
+
+    @asynccontextmanager
+    async def slot(self, station_id: str):
+        wait_ms = await self.acquire(station_id)
+        try:
+            yield wait_ms
+        finally:
+            self.release(station_id)
+
+    def queue_depth(self, station_id: Optional[str] = None) -> int:
+        if station_id is None:
+            return self._queued
+        st = self._c.by_station.get(station_id)
+        return st.queued if st else 0
+
+    def stats(self) -> Dict[str, Any]:
+        c = self._c
+        stations = {}
+        for sid, st in c.by_station.items():
+            stations[sid] = {
+                "inflight": st.inflight,
+                "queued": st.queued,
+                "accepted": st.accepted,
+                "rejected": st.rejected,
+                "timeouts": st.timeouts,
+                "queue_wait_ms_avg": round(st.queue_wait_ms_total / st.accepted, 2) if st.accepted else 0.0,
+                "queue_wait_ms_max": round(st.queue_wait_ms_max, 2),
+            }
+        return {
+            "limits": {
+                "max_inflight": self.max_inflight,
+                "max_inflight_per_station": self.max_inflight_per_station,
+                "max_queue": self.max_queue,
+                "max_queue_per_station": self.max_queue_per_station,
+                "queue_timeout_s": self.queue_timeout_s,
+            },
+            "inflight": self._inflight,
+            "queued": self._queued,
+            "accepted": c.accepted,
+            "rejected_station": c.rejected_station,
+            "rejected_global": c.rejected_global,
+            "timeouts": c.timeouts,
+            "queue_wait_ms_avg": round(c.queue_wait_ms_total / c.accepted, 2) if c.accepted else 0.0,
+            "queue_wait_ms_max": round(c.queue_wait_ms_max, 2),
+            "stations": stations,
+        }
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "AdmissionController":
+        a = cfg or {}
+        return cls(
+            max_inflight=int(a.get("max_inflight", 4)),
+            max_inflight_per_station=int(a.get("max_inflight_per_station", 2)),
+            max_queue=int(a.get("max_queue", 16)),
+            max_queue_per_station=int(a.get("max_queue_per_station", 4)),
+            queue_timeout_s=float(a.get("queue_timeout_s", 2.0)),
+            retry_after_s=int(a.get("retry_after_s", 1)),
+        )
@@ -33,6 +33,15 @@ def load_inference_config(path: str | Path, project_root: str | Path) -> Dict[st
     raw["kafka"]["brokers"] = _env_or(raw["kafka"].get("brokers", "kafka:9092"), "KAFKA_BROKERS")
     raw["kafka"]["schema_registry"] = _env_or(raw["kafka"].get("schema_registry", "http://schema-registry:8081"),
                                               "SCHEMA_REGISTRY_URL")
+    # cấu hình librdkafka cho producer (merge với DEFAULT_PRODUCER_CONFIG trong producer.py)
+    prod = raw["kafka"].setdefault("producer", {}) or {}
+    for key, env_key in (("linger.ms", "KAFKA_LINGER_MS"), ("batch.size", "KAFKA_BATCH_SIZE"),
+                         ("compression.type", "KAFKA_COMPRESSION")):
+        v = os.getenv(env_key)
+        if v not in (None, ""):
+            prod[key] = v if key == "compression.type" else int(v)
+    raw["kafka"]["producer"] = prod
+    raw["kafka"]["max_in_flight"] = int(_env_or(str(raw["kafka"].get("max_in_flight", 10000)), "KAFKA_MAX_IN_FLIGHT"))
     # MinIO
     raw.setdefault("minio", {})
     raw["minio"]["endpoint"] = _env_or(raw["minio"].get("endpoint", "minio:9000"), "MINIO_ENDPOINT")
@@ -45,6 +54,36 @@ def load_inference_config(path: str | Path, project_root: str | Path) -> Dict[st
     raw.setdefault("app", {})
     raw.setdefault("features", {})
 
+    # Admission control (/v1/infer)
+    raw.setdefault("admission", {})
+    adm = raw["admission"]
+    adm["max_inflight"] = int(_env_or(str(adm.get("max_inflight", 4)), "AOI_MAX_INFLIGHT"))
+    adm["max_inflight_per_station"] = int(_env_or(str(adm.get("max_inflight_per_station", 2)),
+                                                  "AOI_MAX_INFLIGHT_PER_STATION"))
+    adm["max_queue"] = int(_env_or(str(adm.get("max_queue", 16)), "AOI_MAX_QUEUE"))
+    adm["max_queue_per_station"] = int(_env_or(str(adm.get("max_queue_per_station", 4)),
+                                               "AOI_MAX_QUEUE_PER_STATION"))
+    adm["queue_timeout_s"] = float(_env_or(str(adm.get("queue_timeout_s", 2.0)), "AOI_QUEUE_TIMEOUT_S"))
+    adm["retry_after_s"] = int(adm.get("retry_after_s", 1))
+
+    # Deadline / graceful degradation
+    raw.setdefault("degradation", {})
+    deg = raw["degradation"]
+    deg["enabled"] = bool(deg.get("enabled", True))
+    deg["default_budget_ms"] = int(_env_or(str(deg.get("default_budget_ms", 0) or 0), "AOI_DEFAULT_BUDGET_MS"))
+
+    # Sampling profiler (bật/tắt được lúc chạy qua /admin/profiling)
+    raw.setdefault("profiling", {})
+    prof = raw["profiling"]
+    prof["enabled"] = _env_or(str(prof.get("enabled", False)), "AOI_PROFILING").lower() in ("1", "true", "yes")
+    prof["sample_every"] = int(_env_or(str(prof.get("sample_every", 100)), "AOI_PROFILING_SAMPLE_EVERY"))
+
+    # Đo peak memory theo stage: off | rss | tracemalloc
+    raw.setdefault("memory", {})
+    mem = raw["memory"]
+    mem["mode"] = _env_or(str(mem.get("mode", "off")), "AOI_MEMPROF").lower().strip()
+    mem["nframes"] = int(mem.get("nframes", 10))
+
     # ---- resolve template & models ----
     template_image = raw["app"].get("template_image")
     raw["app"]["template_image"] = _resolve_path(template_image, proj)
@@ -66,9 +105,15 @@ def load_inference_config(path: str | Path, project_root: str | Path) -> Dict[st
         if not labels or not Path(labels).exists():
             raise FileNotFoundError(f"labels.txt not found for station '{sid}': {labels}")
 
+        # model INT8 (tuỳ chọn) dùng khi degrade
+        onnx_int8 = _resolve_path(meta.get("onnx_int8"), proj)
+        if onnx_int8 and not Path(onnx_int8).exists():
+            raise FileNotFoundError(f"INT8 ONNX not found for station '{sid}': {onnx_int8}")
+
         normalized_stations[sid] = {
             "family": family,
             "onnx": onnx,
+            "onnx_int8": onnx_int8,
             "labels": labels,
             "imgsz": imgsz,
         }
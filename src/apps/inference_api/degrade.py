@@ -0,0 +1,127 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass
+import logging
+import threading
+
+log = logging.getLogger("aoi.inference_api.degrade")
+
+
+@dataclass(frozen=True)
+class DegradeLevel:
+    level: int
+    name: str
+    overlap: int = 64
+    tile_scale: float = 1.0      # tile = imgsz * tile_scale, runner resize về imgsz -> ít tile hơn
+    registration: bool = True
+    overlay: bool = True
+    int8: bool = False
+    cost: float = 1.0            # chi phí tương đối so với level 0
+
+
+DEFAULT_LEVELS: List[Dict[str, Any]] = [
+    {"name": "full", "overlap": 64, "cost": 1.0},
+    {"name": "no_overlap", "overlap": 0, "cost": 0.85},
+    {"name": "no_overlay", "overlap": 0, "registration": False, "overlay": False, "cost": 0.65},
+    {"name": "coarse", "overlap": 0, "tile_scale": 1.5, "registration": False, "overlay": False, "cost": 0.35},
+    {"name": "coarse_int8", "overlap": 0, "tile_scale": 1.5, "registration": False, "overlay": False,
+     "int8": True, "cost": 0.2},
+]
+
+
+class DegradationPolicy:
+    """Chọn mức degrade nhỏ nhất để request kịp latency budget.
+
+    Ước lượng chi phí mỗi station bằng EWMA của thời gian pipeline quy về
+    level 0 (ms / cost). Khi station còn request xếp hàng phía sau, budget
+    còn lại được chia cho cả backlog để hàng đợi kịp xả.
+    """
+
+    def __init__(
+        self,
+        levels: Optional[List[Dict[str, Any]]] = None,
+        default_budget_ms: int = 0,
+        ewma_alpha: float = 0.2,
+        enabled: bool = True,
+    ):
+        raw = levels or DEFAULT_LEVELS
+        self.levels: List[DegradeLevel] = [
+            DegradeLevel(
+                level=i,
+                name=str(lv.get("name", f"L{i}")),
+                overlap=int(lv.get("overlap", 64)),
+                tile_scale=max(1.0, float(lv.get("tile_scale", 1.0))),
+                registration=bool(lv.get("registration", True)),
+                overlay=bool(lv.get("overlay", True)),
+                int8=bool(lv.get("int8", False)),
+                cost=float(lv.get("cost", 1.0)),
+            )
+            for i, lv in enumerate(raw)
+        ]
+        self.default_budget_ms = int(default_budget_ms or 0)
+        self.alpha = float(ewma_alpha)
+        self.enabled = bool(enabled)
+        self._base_ms: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def choose(
+        self,
+        station_id: str,
+        budget_ms: Optional[int],
+        elapsed_ms: float,
+        backlog: int = 0,
+        slots: int = 1,
+        has_int8: bool = False,
+    ) -> Dict[str, Any]:
+        budget = int(budget_ms) if budget_ms else self.default_budget_ms
+        info: Dict[str, Any] = {
+            "level": 0, "name": self.levels[0].name,
+            "budget_ms": budget or None, "queue_ms": round(float(elapsed_ms), 3), "estimated_ms": None,
+        }
+        if not self.enabled or budget <= 0:
+            return info
+
+        base = self._base_ms.get(station_id)
+        if base is None:
+            # chưa có mẫu nào -> chạy full để học chi phí
+            return info
+
+        remaining = budget - float(elapsed_ms)
+        drain = 1.0 + max(0, int(backlog)) / max(1, int(slots))
+        usable = [lv for lv in self.levels if has_int8 or not lv.int8] or self.levels[:1]
+        chosen = usable[-1]
+        for lv in usable:
+            if base * lv.cost * drain <= remaining:
+                chosen = lv
+                break
+
+        info.update(level=chosen.level, name=chosen.name, estimated_ms=round(base * chosen.cost, 3))
+        return info
+
+    def level(self, n: int) -> DegradeLevel:
+        return self.levels[max(0, min(int(n), len(self.levels) - 1))]
+
+    def observe(self, station_id: str, level: int, pipeline_ms: float) -> None:
+        lv = self.level(level)
+        norm = float(pipeline_ms) / max(lv.cost, 1e-3)
+        with self._lock:
+            prev = self._base_ms.get(station_id)
+            self._base_ms[station_id] = norm if prev is None else (1 - self.alpha) * prev + self.alpha * norm
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "default_budget_ms": self.default_budget_ms,
+            "levels": [lv.name for lv in self.levels],
+            "base_ms": {k: round(v, 1) for k, v in self._base_ms.items()},
+        }
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "DegradationPolicy":
+        d = cfg or {}
+        return cls(
+            levels=d.get("levels") or None,
+            default_budget_ms=int(d.get("default_budget_ms", 0) or 0),
+            ewma_alpha=float(d.get("ewma_alpha", 0.2)),
+            enabled=bool(d.get("enabled", True)),
+        )
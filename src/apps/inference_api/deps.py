@@ -9,6 +9,10 @@ from .config_loader import load_inference_config
 from aoi.models import YoloV8DetONNX
 from aoi.io import MinIOClient
 from .producer import EventProducer
+from .admission import AdmissionController
+from .degrade import DegradationPolicy
+from .profiling import ProfilingHook
+from .memprof import MemoryProbe
 
 log = logging.getLogger("aoi.inference_api.deps")
 
@@ -16,15 +20,20 @@ log = logging.getLogger("aoi.inference_api.deps")
 _CFG: Dict[str, Any] | None = None
 _FLAGS: Dict[str, Any] | None = None
 _RUNNERS: Dict[str, YoloV8DetONNX] = {}
+_RUNNERS_INT8: Dict[str, YoloV8DetONNX] = {}
 _MINIO: Optional[MinIOClient] = None
 _MINIO_ENABLED: bool = True
 _PRODUCER: Optional[EventProducer] = None
 _IS_MOCK: bool = False
 _PROJECT_ROOT: Path | None = None
+_ADMISSION: Optional[AdmissionController] = None
+_DEGRADE: Optional[DegradationPolicy] = None
+_PROFILER: Optional[ProfilingHook] = None
+_MEMPROF: Optional[MemoryProbe] = None
 
 
 def init(config_path: str | Path, project_root: str | Path = ".") -> None:
-    global _CFG, _FLAGS, _RUNNERS, _MINIO, _MINIO_ENABLED, _PRODUCER, _IS_MOCK, _PROJECT_ROOT
+    global _CFG, _FLAGS, _RUNNERS, _MINIO, _MINIO_ENABLED, _PRODUCER, _IS_MOCK, _PROJECT_ROOT, _ADMISSION, _DEGRADE, _PROFILER, _MEMPROF
     _PROJECT_ROOT = Path(project_root).resolve()
     _CFG = load_inference_config(config_path, _PROJECT_ROOT)
     _FLAGS = _CFG.get("features", {}) or {}
@@ -50,6 +59,9 @@ def init(config_path: str | Path, project_root: str | Path = ".") -> None:
                     env_disable_minio, mcfg.get("enabled", True))
 
     kcfg = _CFG.get("kafka", {}) or {}
+    ocfg = dict(kcfg.get("outbox") or {})
+    if ocfg.get("dir") and not Path(ocfg["dir"]).is_absolute():
+        ocfg["dir"] = str(_PROJECT_ROOT / ocfg["dir"])
     topic = str(kcfg.get("topic_results", "aoi.inference_results"))
     _PRODUCER = EventProducer(
         brokers=str(kcfg.get("brokers", "localhost:9092")),
@@ -57,11 +69,21 @@ def init(config_path: str | Path, project_root: str | Path = ".") -> None:
         topic=topic,
         mock=None,
         jsonl_path=_PROJECT_ROOT / "data" / "processed" / "inference_results.jsonl",
+        producer_config=kcfg.get("producer") or {},
+        max_in_flight=int(kcfg.get("max_in_flight", 10000)),
+        block_timeout_s=float(kcfg.get("block_timeout_s", 5.0)),
+        outbox=ocfg,
+        jsonl_writer=kcfg.get("mock_jsonl") or {},
+        avro_encoder=str(kcfg.get("avro_encoder", "compiled")),
+        schema_id_cache=_PROJECT_ROOT / str(kcfg.get("schema_id_cache", "data/cache/schema_ids.json")),
+        outbox_dir=_PROJECT_ROOT / "data" / "outbox" / "inference_results",
+        partition_key=str(kcfg.get("partition_key", "station_id")),
     )
     _IS_MOCK = os.getenv("AOI_PRODUCER_MODE", "").lower().strip() == "mock"
 
 
     _RUNNERS.clear()
+    _RUNNERS_INT8.clear()
     stations = (_CFG.get("models", {}) or {}).get("stations", {}) or {}
     for sid, meta in stations.items():
         runner = YoloV8DetONNX(
@@ -71,13 +93,34 @@ def init(config_path: str | Path, project_root: str | Path = ".") -> None:
         )
         _RUNNERS[sid] = runner
         log.info("Loaded runner for station %s (imgsz=%s)", sid, runner.imgsz)
+        if meta.get("onnx_int8"):
+            _RUNNERS_INT8[sid] = YoloV8DetONNX(
+                onnx_path=meta["onnx_int8"],
+                labels_path=meta["labels"],
+                imgsz=int(meta.get("imgsz", 960)),
+            )
+            log.info("Loaded INT8 runner for station %s", sid)
+
+    _ADMISSION = AdmissionController.from_config(_CFG.get("admission", {}) or {})
+    log.info("Admission control: %s", _ADMISSION.stats()["limits"])
+    _DEGRADE = DegradationPolicy.from_config(_CFG.get("degradation", {}) or {})
+    _PROFILER = ProfilingHook.from_config(_CFG.get("profiling", {}) or {}, _PROJECT_ROOT)
+    _MEMPROF = MemoryProbe.from_config(_CFG.get("memory", {}) or {})
+    if _MEMPROF.enabled:
+        log.info("Memory instrumentation: mode=%s", _MEMPROF.mode)
 
     log.info("deps.init done. stations=%s mock_producer=%s minio_enabled=%s",
              list(_RUNNERS.keys()), _IS_MOCK, _MINIO_ENABLED)
 
 
 def shutdown() -> None:
-    pass
+    # flush message Kafka còn trong queue trước khi process thoát
+    if _PRODUCER is not None:
+        timeout = float((_CFG or {}).get("kafka", {}).get("flush_timeout_s", 10.0))
+        try:
+            _PRODUCER.close(timeout)
+        except Exception as e:
+            log.error("producer close failed: %s", e)
 
 
 
@@ -94,6 +137,10 @@ def get_runner(station_id: str) -> Optional[YoloV8DetONNX]:
     return _RUNNERS.get(station_id)
 
 
+def get_runner_int8(station_id: str) -> Optional[YoloV8DetONNX]:
+    return _RUNNERS_INT8.get(station_id)
+
+
 def get_station_model_cfg(station_id: str) -> Dict[str, Any]:
     models = (_CFG.get("models", {}) or {}).get("stations", {}) or {}
     return models.get(station_id, {})
@@ -112,12 +159,39 @@ def get_producer() -> EventProducer:
     return _PRODUCER
 
 
+def get_admission() -> AdmissionController:
+    assert _ADMISSION is not None
+    return _ADMISSION
+
+
+def get_degradation() -> DegradationPolicy:
+    assert _DEGRADE is not None
+    return _DEGRADE
+
+
+def get_profiler() -> ProfilingHook:
+    assert _PROFILER is not None
+    return _PROFILER
+
+
+def get_memprof() -> MemoryProbe:
+    assert _MEMPROF is not None
+    return _MEMPROF
+
+
 def is_mock_producer() -> bool:
     return _IS_MOCK
 
 
-def get_model_version(model_cfg: Dict[str, Any]) -> str:
-    onnx_path = Path(model_cfg["onnx"])
+def get_model_version(model_cfg: Dict[str, Any], int8: bool = False) -> str:
+    """Version từ model_card.json cạnh file ONNX (không có -> tên thư mục). ``int8``: model INT8 (degrade)
+    được dùng -> version đọc cạnh ``onnx_int8`` và thêm hậu tố ``-int8`` để không lẫn với FP32."""
+    if int8 and model_cfg.get("onnx_int8"):
+        return _card_version(Path(model_cfg["onnx_int8"])) + "-int8"
+    return _card_version(Path(model_cfg["onnx"]))
+
+
+def _card_version(onnx_path: Path) -> str:
     mc_path = onnx_path.parent / "model_card.json"
     if mc_path.exists():
         try:
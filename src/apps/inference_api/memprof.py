@@ -0,0 +1,145 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+import logging
+import os
+import threading
+import tracemalloc
+
+log = logging.getLogger("aoi.inference_api.memprof")
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except Exception:
+        return 0
+
+
+def _hwm_bytes() -> int:
+    try:
+        with open("/proc/self/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except Exception:
+        pass
+    return 0
+
+
+def _reset_hwm() -> bool:
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except Exception:
+        return False
+
+
+class MemoryProbe:
+    """Đo peak memory theo stage.
+
+    mode="tracemalloc": peak bytes do Python/numpy cấp phát (numpy và mảng
+    OpenCV trả về đều được tracemalloc theo dõi). mode="rss": peak RSS của
+    process (reset VmHWM qua /proc/self/clear_refs, Linux). Cả hai đều là số
+    liệu của cả process: chính xác khi max_inflight=1, xấp xỉ khi nhiều
+    request chạy song song.
+    """
+
+    def __init__(self, mode: str = "off", nframes: int = 10):
+        self.mode = (mode or "off").lower()
+        if self.mode not in ("off", "rss", "tracemalloc"):
+            raise ValueError(f"memory.mode must be off|rss|tracemalloc, got {mode!r}")
+        self.nframes = int(nframes)
+        self._can_reset_hwm = True
+        self._lock = threading.Lock()
+        self._stage_max: Dict[str, int] = {}
+        self._stage_sum: Dict[str, int] = {}
+        self._stage_n: Dict[str, int] = {}
+        self._req_max = 0
+        self._req_sum = 0
+        self._req_n = 0
+
+        if self.mode == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start(self.nframes)
+            log.info("tracemalloc started (nframes=%d)", self.nframes)
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def begin(self) -> int:
+        """Bắt đầu 1 cửa sổ đo; trả về mức memory hiện tại (baseline)."""
+        if self.mode == "tracemalloc":
+            cur, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            return cur
+        if self.mode == "rss":
+            if self._can_reset_hwm:
+                self._can_reset_hwm = _reset_hwm()
+            return _rss_bytes()
+        return 0
+
+    def peak(self) -> int:
+        """Peak tuyệt đối kể từ lần begin() gần nhất."""
+        if self.mode == "tracemalloc":
+            return tracemalloc.get_traced_memory()[1]
+        if self.mode == "rss":
+            return _hwm_bytes() if self._can_reset_hwm else _rss_bytes()
+        return 0
+
+    def record(self, stage_peaks: Dict[str, int], request_peak: int) -> None:
+        with self._lock:
+            for k, v in stage_peaks.items():
+                self._stage_max[k] = max(self._stage_max.get(k, 0), v)
+                self._stage_sum[k] = self._stage_sum.get(k, 0) + v
+                self._stage_n[k] = self._stage_n.get(k, 0) + 1
+            self._req_max = max(self._req_max, request_peak)
+            self._req_sum += request_peak
+            self._req_n += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {
+                k: {"max_bytes": self._stage_max[k], "avg_bytes": self._stage_sum[k] // max(1, self._stage_n[k])}
+                for k in self._stage_max
+            }
+            out: Dict[str, Any] = {
+                "mode": self.mode,
+                "requests": self._req_n,
+                "request_peak_max_bytes": self._req_max,
+                "request_peak_avg_bytes": self._req_sum // max(1, self._req_n),
+                "stages": stages,
+                "rss_bytes": _rss_bytes(),
+            }
+        if self.mode == "tracemalloc":
+            cur, _ = tracemalloc.get_traced_memory()
+            out["traced_current_bytes"] = cur
+        return out
+
+    def top(self, limit: int = 20, group_by: str = "lineno") -> List[Dict[str, Any]]:
+        if self.mode != "tracemalloc":
+            raise RuntimeError("top allocation sites require memory.mode=tracemalloc")
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        out = []
+        for st in snap.statistics(group_by)[: max(1, int(limit))]:
+            frame = st.traceback[0]
+            out.append({
+                "site": f"{frame.filename}:{frame.lineno}",
+                "size_bytes": st.size,
+                "count": st.count,
+                "traceback": [f"{f.filename}:{f.lineno}" for f in st.traceback][-5:],
+            })
+        return out
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "MemoryProbe":
+        m = cfg or {}
+        return cls(mode=str(m.get("mode", "off")), nframes=int(m.get("nframes", 10)))
@@ -0,0 +1,110 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, Optional, Tuple
+from contextlib import contextmanager
+import logging
+import time
+
+try:
+    from prometheus_client import (  # type: ignore
+        CollectorRegistry, Histogram, generate_latest, CONTENT_TYPE_LATEST,
+    )
+except Exception:
+    CollectorRegistry = None  # type: ignore
+
+log = logging.getLogger("aoi.inference_api.metrics")
+
+STAGES = ("decode", "register", "tile", "infer", "merge", "decision", "overlay", "upload", "publish")
+
+_BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 1 MiB .. 4 GiB
+_BUCKETS_BYTES = tuple(float(2 ** k) for k in range(20, 33))
+
+
+class StageTimer:
+    """Đo thời gian từng stage; nếu có ``mem`` (MemoryProbe) thì đo thêm peak bytes."""
+
+    def __init__(self, mem: Optional[Any] = None):
+        self.stages_ms: Dict[str, float] = {}
+        self.peak_bytes: Dict[str, int] = {}
+        self._t0 = time.perf_counter()
+        self._mem = mem if (mem is not None and mem.enabled) else None
+        self._mem_base = self._mem.begin() if self._mem is not None else 0
+        self._mem_peak_abs = self._mem_base
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        m0 = self._mem.begin() if self._mem is not None else 0
+        try:
+            yield
+        finally:
+            dt_ms = (time.perf_counter() - t0) * 1000.0
+            self.stages_ms[name] = self.stages_ms.get(name, 0.0) + dt_ms
+            if self._mem is not None:
+                peak = self._mem.peak()
+                self._mem_peak_abs = max(self._mem_peak_abs, peak)
+                self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), max(0, peak - m0))
+
+    def request_peak_bytes(self) -> int:
+        """Peak của cả request so với lúc tạo timer (0 nếu không bật đo memory)."""
+        if self._mem is None:
+            return 0
+        return max(0, self._mem_peak_abs - self._mem_base)
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {k: round(v, 3) for k, v in self.stages_ms.items()}
+
+
+if CollectorRegistry is not None:
+    REGISTRY = CollectorRegistry(auto_describe=True)
+    STAGE_SECONDS = Histogram(
+        "aoi_infer_stage_seconds", "Thời gian từng stage của /v1/infer",
+        ["stage", "station", "model_version"], buckets=_BUCKETS_S, registry=REGISTRY,
+    )
+    REQUEST_SECONDS = Histogram(
+        "aoi_infer_request_seconds", "Tổng thời gian xử lý /v1/infer (không tính hàng đợi)",
+        ["station", "model_version"], buckets=_BUCKETS_S, registry=REGISTRY,
+    )
+    STAGE_PEAK_BYTES = Histogram(
+        "aoi_infer_stage_peak_bytes", "Peak memory tăng thêm trong từng stage của /v1/infer",
+        ["stage", "station"], buckets=_BUCKETS_BYTES, registry=REGISTRY,
+    )
+    REQUEST_PEAK_BYTES = Histogram(
+        "aoi_infer_request_peak_bytes", "Peak memory tăng thêm của cả request /v1/infer",
+        ["station"], buckets=_BUCKETS_BYTES, registry=REGISTRY,
+    )
+else:
+    REGISTRY = None
+    STAGE_SECONDS = None
+    REQUEST_SECONDS = None
+    STAGE_PEAK_BYTES = None
+    REQUEST_PEAK_BYTES = None
+
+
+def enabled() -> bool:
+    return REGISTRY is not None
+
+
+def observe_request(station_id: str, model_version: str, stages_ms: Dict[str, float], total_ms: float) -> None:
+    if REGISTRY is None:
+        return
+    for stage, ms in stages_ms.items():
+        STAGE_SECONDS.labels(stage=stage, station=station_id, model_version=model_version).observe(ms / 1000.0)
+    REQUEST_SECONDS.labels(station=station_id, model_version=model_version).observe(total_ms / 1000.0)
+
+
+def observe_memory(station_id: str, peak_bytes: Dict[str, int], request_peak: int) -> None:
+    if REGISTRY is None:
+        return
+    for stage, b in peak_bytes.items():
+        STAGE_PEAK_BYTES.labels(stage=stage, station=station_id).observe(b)
+    REQUEST_PEAK_BYTES.labels(station=station_id).observe(request_peak)
+
+
+def render() -> Tuple[bytes, str]:
+    if REGISTRY is None:
+        raise RuntimeError("prometheus_client is not installed. Install: pip install prometheus-client")
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,224 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional
+from pathlib import Path
+import json
+import logging
+import threading
+import time
+
+from aoi.io.segments import SegmentLog
+
+log = logging.getLogger("aoi.inference_api.outbox")
+
+
+class PermanentPublishError(RuntimeError):
+    """Message không bao giờ gửi được dù broker sống (serialize lỗi / sai schema, quá lớn, record hỏng)."""
+
+
+class Outbox:
+    """Outbox trên đĩa đứng trước Kafka producer.
+
+    - Broker sẵn sàng và outbox rỗng: publish thẳng qua Kafka.
+    - Broker không tới được (lúc khởi động hoặc khi đang chạy), produce lỗi, hoặc
+      outbox còn backlog (giữ thứ tự): event được ghi vào SegmentLog.
+    - Thread nền dò broker định kỳ và replay backlog theo đúng thứ tự ghi, ack
+      cursor sau khi cả batch có delivery report thành công (at-least-once).
+
+    Event bị lỗi ở delivery report (sau khi đã produce) được ghi lại vào outbox nên
+    có thể đến muộn hơn các event sau nó.
+
+    Lỗi vĩnh viễn của 1 message (``PermanentPublishError``) không bị coi là broker down: message được
+    chuyển sang ``<outbox dir>/dead/`` để không chặn replay. Replay lỗi giữa chừng chỉ ack phần đầu batch
+    đã được xác nhận.
+    """
+
+    def __init__(
+        self,
+        seglog: SegmentLog,
+        factory: Callable[[Callable[[Dict[str, Any]], None]], Any],
+        replay_batch: int = 500,
+        probe_interval_s: float = 5.0,
+        probe_timeout_s: float = 2.0,
+        send_timeout_s: float = 30.0,
+    ):
+        self.log = seglog
+        self._factory = factory
+        self.replay_batch = max(1, int(replay_batch))
+        self.probe_interval_s = float(probe_interval_s)
+        self.probe_timeout_s = float(probe_timeout_s)
+        self.send_timeout_s = float(send_timeout_s)
+
+        self.kafka: Optional[Any] = None
+        self.available = False
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        self.spilled_total = 0
+        self.replayed_total = 0
+        self.replay_rate_msgs_s = 0.0
+        self.last_replay_ts_ms: Optional[int] = None
+        self.last_error: Optional[str] = None
+        self.dead_letters = 0
+
+        self._connect()
+        self._thread = threading.Thread(target=self._run, name="aoi-outbox-replay", daemon=True)
+        self._thread.start()
+
+    # ---------- kết nối ----------
+    def _connect(self) -> None:
+        if self.kafka is None:
+            try:
+                self.kafka = self._factory(self._on_failed)
+            except Exception as e:
+                self.last_error = f"init: {e}"
+                log.warning("Kafka producer init failed, buffering to outbox: %s", e)
+                return
+        self.available = bool(self.kafka.ping(self.probe_timeout_s))
+        if self.available:
+            if self.log.pending():
+                log.info("Kafka reachable, replaying %d outbox record(s)", self.log.pending())
+        elif self.last_error != "broker unreachable":
+            self.last_error = "broker unreachable"
+            log.warning("Kafka unreachable, buffering to outbox %s", self.log.dir)
+
+    def _spill(self, payload: Dict[str, Any]) -> None:
+        self.log.append(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        self.spilled_total += 1
+
+    def _dead_letter(self, rec: bytes, err: Exception, event_id: Any = None) -> None:
+        self.dead_letters += 1
+        dead = Path(self.log.dir) / "dead" / f"{int(time.time() * 1000)}-{event_id or self.dead_letters}.json"
+        try:
+            dead.parent.mkdir(parents=True, exist_ok=True)
+            dead.write_bytes(rec)
+        except Exception as e:
+            log.error("outbox dead-letter write failed (event_id=%s): %s", event_id, e)
+            return
+        log.error("event rejected permanently (event_id=%s): %s; moved to %s", event_id, err, dead)
+
+    def _dead_letter_payload(self, payload: Dict[str, Any], err: Exception) -> None:
+        rec = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self._dead_letter(rec, err, payload.get("event_id"))
+
+    def _on_failed(self, payload: Dict[str, Any], err: Any = None) -> None:
+        # delivery report lỗi (chạy trong poll/flush): ghi lại vào outbox và cho thread nền dò lại broker
+        if isinstance(err, PermanentPublishError):
+            self._dead_letter_payload(payload, err)
+            return
+        self.available = False
+        self._spill(payload)
+        self._wake.set()
+
+    # ---------- API producer ----------
+    def publish(self, payload: Dict[str, Any]) -> str:
+        with self._lock:
+            if self.kafka is not None and self.available and self.log.pending() == 0:
+                try:
+                    return self.kafka.publish(payload)
+                except PermanentPublishError as e:
+                    # lỗi của riêng message này, broker vẫn ổn
+                    self._dead_letter_payload(payload, e)
+                    return str(payload.get("event_id", ""))
+                except Exception as e:
+                    self.available = False
+                    self.last_error = str(e)
+                    log.warning("Kafka publish failed, buffering to outbox: %s", e)
+                    self._wake.set()
+            self._spill(payload)
+        return str(payload.get("event_id", ""))
+
+    def healthy(self) -> bool:
+        return bool(self.kafka is not None and self.available)
+
+    def flush(self, timeout: float = 10.0) -> int:
+        self.log.sync()
+        return self.kafka.flush(timeout) if self.kafka is not None else 0
+
+    def close(self, timeout: float = 10.0) -> None:
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout=timeout)
+        if self.kafka is not None:
+            self.kafka.close(timeout)
+        self.log.close()
+        backlog = self.log.backlog()
+        if backlog["records"]:
+            log.warning("outbox closed with %d pending record(s); they will be replayed on next start", backlog["records"])
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = self.kafka.stats() if self.kafka is not None else {"mode": "kafka"}
+        out["available"] = self.available
+        out["outbox"] = {
+            "backlog": self.log.backlog(),
+            "spilled_total": self.spilled_total,
+            "replayed_total": self.replayed_total,
+            "replay_rate_msgs_s": round(self.replay_rate_msgs_s, 1),
+            "last_replay_ts_ms": self.last_replay_ts_ms,
+            "last_error": self.last_error,
+            "dead_letters": self.dead_letters,
+        }
+        return out
+
+    # ---------- replay ----------
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            busy = self.available and self.log.pending() > 0
+            if not busy:
+                self._wake.wait(self.probe_interval_s)
+                self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                # fsync="interval": không để đuôi log nằm mãi trong page cache khi không còn append
+                self.log.sync(only_if_dirty=True)
+                if not self.available:
+                    self._connect()
+                if self.available and self.log.pending() > 0:
+                    self._replay_batch()
+            except Exception as e:
+                self.available = False
+                self.last_error = str(e)
+                log.error("outbox replay error: %s", e)
+
+    def _replay_batch(self) -> None:
+        records, pos = self.log.read(self.replay_batch)
+        if not records:
+            return
+        t0 = time.perf_counter()
+        items: List[Any] = []
+        for r in records:
+            try:
+                items.append(json.loads(r))
+            except ValueError as e:
+                items.append(PermanentPublishError(f"undecodable outbox record: {e}"))
+        results = iter(self.kafka.publish_batch_results([p for p in items if isinstance(p, dict)],
+                                                        timeout=self.send_timeout_s))
+        # ack phần đầu đã xác nhận (message lỗi vĩnh viễn -> dead-letter, vẫn tính là xong);
+        # dừng ở lỗi tạm đầu tiên để giữ thứ tự, phần sau gửi lại ở lần replay tới
+        done = dead = 0
+        for rec, item in zip(records, items):
+            res = next(results) if isinstance(item, dict) else item
+            if res is None:
+                done += 1
+                continue
+            if not isinstance(res, PermanentPublishError):
+                break
+            self._dead_letter(rec, res, item.get("event_id") if isinstance(item, dict) else None)
+            done += 1
+            dead += 1
+        if done:
+            ack_pos = pos if done == len(records) else self.log.read(done)[1]
+            self.log.ack(ack_pos, done)
+        if done < len(records):
+            self.available = False
+            self.last_error = f"replay: {len(records) - done}/{len(records)} message(s) not acknowledged"
+            log.warning("outbox %s; will retry", self.last_error)
+            self.replayed_total += done - dead
+            return
+        dt = max(1e-6, time.perf_counter() - t0)
+        self.replayed_total += done - dead
+        self.replay_rate_msgs_s = done / dt
+        self.last_replay_ts_ms = int(time.time() * 1000)
+        if self.log.pending() == 0:
+            log.info("outbox drained (replayed_total=%d)", self.replayed_total)
@@ -1,30 +1,114 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any
+from typing import Any, Callable, Dict, List, Optional
 from pathlib import Path
 import json
+import logging
 import time
 import os
 import threading
 
-class MockJsonlProducer:
-    def __init__(self, out_path: str | Path = "data/processed/inference_results.jsonl"):
-        self.path = Path(out_path)
-        self.path.parent.mkdir(parents=True, exist_ok=True)
+from aoi.io.avro_codec import AvroEncoder, resolve_schema_id
+from aoi.io.jsonl_writer import RotatingJsonlWriter
+from aoi.io.segments import SegmentLog
+from .outbox import Outbox, PermanentPublishError
+
+log = logging.getLogger("aoi.inference_api.producer")
+
+# librdkafka: gom message theo linger/batch, nén cả batch, idempotent để retry không sinh bản trùng
+DEFAULT_PRODUCER_CONFIG: Dict[str, Any] = {
+    "linger.ms": 20,
+    "batch.size": 262144,
+    "compression.type": "zstd",
+    "enable.idempotence": True,
+    "acks": "all",
+    "delivery.timeout.ms": 120000,
+    "queue.buffering.max.messages": 100000,
+}
+
+# lỗi librdkafka/broker mà gửi lại cũng không qua -> dead-letter thay vì coi là broker down
+_PERMANENT_ERRORS = frozenset({
+    "MSG_SIZE_TOO_LARGE", "_MSG_SIZE_TOO_LARGE", "INVALID_RECORD", "CORRUPT_MESSAGE",
+    "_INVALID_ARG", "_VALUE_SERIALIZATION", "_KEY_SERIALIZATION",
+})
+_NO_REPORT = "no delivery report before timeout"
+
+
+def _is_permanent(err: Any) -> bool:
+    name = getattr(err, "name", None)
+    return callable(name) and name() in _PERMANENT_ERRORS
+
+
+class DeliveryTracker:
+    """Đếm message đang bay / đã ack / lỗi dựa trên delivery report của librdkafka."""
+
+    def __init__(self):
         self._lock = threading.Lock()
+        self.produced = 0
+        self.acked = 0
+        self.failed = 0
+        self.last_error: Optional[str] = None
+        self.last_error_ts_ms: Optional[int] = None
 
-    def publish(self, payload: Dict[str, Any]) -> str:
+    @property
+    def in_flight(self) -> int:
+        return self.produced - self.acked - self.failed
+
+    def on_produce(self) -> None:
+        with self._lock:
+            self.produced += 1
+
+    def on_produce_error(self) -> None:
+        # produce() ném lỗi trước khi message vào queue -> không có delivery report
+        with self._lock:
+            self.failed += 1
+
+    def on_delivery(self, err, msg) -> None:
+        with self._lock:
+            if err is None:
+                self.acked += 1
+                return
+            self.failed += 1
+            self.last_error = str(err)
+            self.last_error_ts_ms = int(time.time() * 1000)
+        key = msg.key() if msg is not None else None
+        log.error("Kafka delivery failed (key=%s): %s", key, err)
 
+    def stats(self) -> Dict[str, Any]:
         with self._lock:
-            with self.path.open("a", encoding="utf-8") as f:
-                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            return {
+                "produced": self.produced,
+                "in_flight": self.in_flight,
+                "acked": self.acked,
+                "failed": self.failed,
+                "last_error": self.last_error,
+                "last_error_ts_ms": self.last_error_ts_ms,
+            }
+
+
+class MockJsonlProducer:
+    def __init__(self, out_path: str | Path = "data/processed/inference_results.jsonl",
+                 writer_config: Optional[Dict[str, Any]] = None):
+        self.path = Path(out_path)
+        self._writer = RotatingJsonlWriter.from_config(self.path, writer_config)
+
+    def publish(self, payload: Dict[str, Any]) -> str:
+        self._writer.write(payload)
         return str(payload.get("event_id", ""))
 
     def healthy(self) -> bool:
-        try:
-            self.path.touch(exist_ok=True)
-            return True
-        except Exception:
-            return False
+        return self._writer.healthy()
+
+    def flush(self, timeout: float = 10.0) -> int:
+        self._writer.flush()
+        return 0
+
+    def close(self, timeout: float = 10.0) -> None:
+        self._writer.close()
+
+    def stats(self) -> Dict[str, Any]:
+        out = self._writer.stats()
+        out["mode"] = "mock"
+        return out
 
 
 class KafkaAvroProducer:
@@ -87,13 +171,31 @@ class KafkaAvroProducer:
                 "type": "record", "name": "Meta",
                 "fields": [
                     {"name": "capture_id", "type": ["null","string"], "default": None},
-                    {"name": "notes", "type": ["null","string"], "default": None}
+                    {"name": "notes", "type": ["null","string"], "default": None},
+                    {"name": "stages_ms", "type": ["null", {"type": "map", "values": "double"}], "default": None},
+                    {"name": "degradation", "type": ["null", {
+                        "type": "record", "name": "Degradation",
+                        "fields": [
+                            {"name": "level", "type": "int"},
+                            {"name": "name", "type": "string"},
+                            {"name": "budget_ms", "type": ["null","int"], "default": None},
+                            {"name": "queue_ms", "type": "double"},
+                            {"name": "estimated_ms", "type": ["null","double"], "default": None}
+                        ]
+                    }], "default": None}
                 ]
             }}
         ]
     })
 
-    def __init__(self, brokers: str, schema_registry_url: str, topic: str):
+    def __init__(self, brokers: str, schema_registry_url: str, topic: str,
+                 producer_config: Optional[Dict[str, Any]] = None,
+                 max_in_flight: int = 10000,
+                 block_timeout_s: float = 5.0,
+                 on_failed: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 avro_encoder: str = "compiled",
+                 schema_id_cache: Optional[str | Path] = None,
+                 partition_key: str = "station_id"):
         try:
             from confluent_kafka.schema_registry import SchemaRegistryClient # type: ignore
             from confluent_kafka.serialization import StringSerializer # type: ignore
@@ -111,26 +213,120 @@ class KafkaAvroProducer:
 
         self.topic = topic
         self._sr = SchemaRegistryClient({"url": schema_registry_url})
-        self._value_serializer = AvroSerializer(self._sr, self._value_schema_str)
+        if avro_encoder == "compiled":
+            # schema ID lấy từ cache local (không cần registry lúc khởi động), encoder compile 1 lần
+            schema_id = resolve_schema_id(self._value_schema_str, f"{topic}-value", schema_registry_url,
+                                          cache_path=schema_id_cache, sr_client=self._sr)
+            self._value_serializer = AvroEncoder(self._value_schema_str, schema_id)
+        else:
+            self._value_serializer = AvroSerializer(self._sr, self._value_schema_str)
         self._key_serializer = StringSerializer("utf_8")
-        self._producer = Producer({"bootstrap.servers": brokers})
+        conf = dict(DEFAULT_PRODUCER_CONFIG)
+        conf.update(producer_config or {})
+        conf["bootstrap.servers"] = brokers
+        self._producer = Producer(conf)
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.block_timeout_s = float(block_timeout_s)
+        self.tracker = DeliveryTracker()
+        # gọi với payload gốc khi delivery thất bại (vd. đẩy vào outbox)
+        self.on_failed = on_failed
+        # message key quyết định partition: cùng station -> cùng partition -> cùng worker stream processor
+        self.partition_key = partition_key or "event_id"
+        log.info("Kafka producer: topic=%s linger.ms=%s batch.size=%s compression=%s idempotence=%s "
+                 "max_in_flight=%d avro_encoder=%s key=%s",
+                 topic, conf.get("linger.ms"), conf.get("batch.size"), conf.get("compression.type"),
+                 conf.get("enable.idempotence"), self.max_in_flight, avro_encoder, self.partition_key)
 
-    def publish(self, payload: Dict[str, Any]) -> str:
-        key = str(payload.get("event_id", ""))
+    def _key_of(self, payload: Dict[str, Any]) -> str:
+        k = payload.get(self.partition_key)
+        return str(k if k not in (None, "") else payload.get("event_id", ""))
 
-        def cb(err, msg):
+    def _wait_capacity(self) -> None:
+        # chặn (có timeout) khi quá nhiều message chưa có delivery report
+        deadline = time.monotonic() + self.block_timeout_s
+        while self.tracker.in_flight >= self.max_in_flight:
+            if time.monotonic() >= deadline:
+                raise BufferError(f"Kafka producer backlog full (in_flight={self.tracker.in_flight})")
+            self._producer.poll(0.05)
 
-            if err:
+    def _produce(self, key: str, value: bytes, cb: Callable) -> None:
+        self._wait_capacity()
+        # đếm trước produce(): delivery report có thể được thread khác poll() ngay sau đó
+        self.tracker.on_produce()
+        try:
+            try:
+                self._producer.produce(topic=self.topic, key=self._key_serializer(key, None), value=value,
+                                       on_delivery=cb)
+            except BufferError:
+                # queue nội bộ librdkafka đầy: phục vụ delivery report rồi thử lại 1 lần
+                self._producer.poll(min(1.0, self.block_timeout_s))
+                self._producer.produce(topic=self.topic, key=self._key_serializer(key, None), value=value,
+                                       on_delivery=cb)
+        except Exception as e:
+            self.tracker.on_produce_error()
+            err = e.args[0] if e.args else None
+            if _is_permanent(err):
+                raise PermanentPublishError(f"Kafka rejected message: {err}") from e
+            raise
+
+    def _serialize(self, payload: Dict[str, Any]) -> bytes:
+        # payload sai schema không bao giờ encode được, không phải lỗi broker
+        try:
+            return self._value_serializer(payload, None)
+        except Exception as e:
+            raise PermanentPublishError(f"value serialization failed: {e}") from e
+
+    def _failure(self, err: Any) -> Any:
+        return PermanentPublishError(str(err)) if _is_permanent(err) else err
+
+    def publish(self, payload: Dict[str, Any]) -> str:
+        key = self._key_of(payload)
+        value = self._serialize(payload)
 
-                pass
-        self._producer.produce(
-            topic=self.topic,
-            key=self._key_serializer(key, None),
-            value=self._value_serializer(payload, None),
-            on_delivery=cb
-        )
+        if self.on_failed is None:
+            cb = self.tracker.on_delivery
+        else:
+            def cb(err, msg, payload=payload):
+                self.tracker.on_delivery(err, msg)
+                if err is not None:
+                    self.on_failed(payload, self._failure(err))
+
+        self._produce(key, value, cb)
         self._producer.poll(0)
-        return key
+        return str(payload.get("event_id", ""))
+
+    def publish_batch_results(self, payloads: List[Dict[str, Any]], timeout: float = 30.0) -> List[Any]:
+        """Gửi cả batch và chờ delivery report; trả về kết quả từng message theo thứ tự: None = đã ack,
+        ``PermanentPublishError`` = không bao giờ gửi được, còn lại (lỗi Kafka / chưa có report) = lỗi tạm."""
+        results: List[Any] = [_NO_REPORT] * len(payloads)
+
+        for i, payload in enumerate(payloads):
+            def cb(err, msg, i=i):
+                self.tracker.on_delivery(err, msg)
+                results[i] = None if err is None else self._failure(err)
+
+            try:
+                self._produce(self._key_of(payload), self._serialize(payload), cb)
+            except PermanentPublishError as e:
+                results[i] = e
+            except Exception as e:
+                # lỗi tạm khi produce (queue đầy...): không gửi phần còn lại, chờ report của phần đã gửi
+                results[i] = e
+                break
+        self._producer.flush(timeout)
+        return results
+
+    def publish_batch_sync(self, payloads: List[Dict[str, Any]], timeout: float = 30.0) -> int:
+        """Như ``publish_batch_results``; trả về số message lỗi / chưa xác nhận (0 = thành công)."""
+        return sum(r is not None for r in self.publish_batch_results(payloads, timeout))
+
+    def ping(self, timeout: float = 2.0) -> bool:
+        """Broker có phản hồi metadata cho topic không."""
+        try:
+            md = self._producer.list_topics(topic=self.topic, timeout=timeout)
+            return bool(md.brokers)
+        except Exception:
+            return False
 
     def healthy(self) -> bool:
         try:
@@ -139,6 +335,32 @@ class KafkaAvroProducer:
         except Exception:
             return False
 
+    def flush(self, timeout: float = 10.0) -> int:
+        """Chờ delivery report; trả về số message còn trong queue sau timeout."""
+        return int(self._producer.flush(timeout))
+
+    def close(self, timeout: float = 10.0) -> None:
+        remaining = self.flush(timeout)
+        st = self.tracker.stats()
+        if remaining:
+            log.error("Kafka producer closed with %d undelivered message(s): %s", remaining, st)
+        else:
+            log.info("Kafka producer flushed: %s", st)
+
+    def stats(self) -> Dict[str, Any]:
+        out = self.tracker.stats()
+        out["mode"] = "kafka"
+        out["queue_len"] = len(self._producer)
+        out["max_in_flight"] = self.max_in_flight
+        return out
+
+
+def _kafka_client_available() -> bool:
+    try:
+        import confluent_kafka  # type: ignore  # noqa: F401
+        return True
+    except Exception:
+        return False
 
 
 class EventProducer:
@@ -148,19 +370,52 @@ class EventProducer:
                  schema_registry_url: str,
                  topic: str,
                  mock: Optional[bool] = None,
-                 jsonl_path: str | Path = "data/processed/inference_results.jsonl"):
+                 jsonl_path: str | Path = "data/processed/inference_results.jsonl",
+                 producer_config: Optional[Dict[str, Any]] = None,
+                 max_in_flight: int = 10000,
+                 block_timeout_s: float = 5.0,
+                 outbox: Optional[Dict[str, Any]] = None,
+                 outbox_dir: str | Path = "data/outbox/inference_results",
+                 jsonl_writer: Optional[Dict[str, Any]] = None,
+                 avro_encoder: str = "compiled",
+                 schema_id_cache: Optional[str | Path] = None,
+                 partition_key: str = "station_id"):
         mode_env = os.getenv("AOI_PRODUCER_MODE", "").lower().strip()
         if mock is None:
             mock = (mode_env == "mock")
 
+        def kafka_factory(on_failed=None) -> KafkaAvroProducer:
+            return KafkaAvroProducer(brokers, schema_registry_url, topic,
+                                     producer_config=producer_config,
+                                     max_in_flight=max_in_flight,
+                                     block_timeout_s=block_timeout_s,
+                                     on_failed=on_failed,
+                                     avro_encoder=avro_encoder,
+                                     schema_id_cache=schema_id_cache,
+                                     partition_key=partition_key)
+
+        ob = outbox or {}
         self._impl = None  
         if mock:
-            self._impl = MockJsonlProducer(jsonl_path)
+            self._impl = MockJsonlProducer(jsonl_path, jsonl_writer)
+        elif not _kafka_client_available():
+            log.warning("confluent_kafka is not installed; falling back to JSONL mock")
+            self._impl = MockJsonlProducer(jsonl_path, jsonl_writer)
+        elif bool(ob.get("enabled", True)):
+            self._impl = Outbox(
+                SegmentLog.from_config(ob, outbox_dir),
+                factory=kafka_factory,
+                replay_batch=int(ob.get("replay_batch", 500)),
+                probe_interval_s=float(ob.get("probe_interval_s", 5.0)),
+                probe_timeout_s=float(ob.get("probe_timeout_s", 2.0)),
+                send_timeout_s=float(ob.get("send_timeout_s", 30.0)),
+            )
         else:
             try:
-                self._impl = KafkaAvroProducer(brokers, schema_registry_url, topic)
-            except Exception:
-                self._impl = MockJsonlProducer(jsonl_path)
+                self._impl = kafka_factory()
+            except Exception as e:
+                log.warning("Kafka producer unavailable (%s); falling back to JSONL mock", e)
+                self._impl = MockJsonlProducer(jsonl_path, jsonl_writer)
 
     def publish(self, payload: Dict[str, Any]) -> str:
         assert self._impl is not None
@@ -169,3 +424,15 @@ class EventProducer:
     def healthy(self) -> bool:
         assert self._impl is not None
         return bool(self._impl.healthy())
+
+    def flush(self, timeout: float = 10.0) -> int:
+        assert self._impl is not None
+        return self._impl.flush(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        assert self._impl is not None
+        self._impl.close(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        assert self._impl is not None
+        return self._impl.stats()
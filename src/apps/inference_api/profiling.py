@@ -0,0 +1,153 @@
+from __future__ import annotations
+from typing import Any, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from pathlib import Path
+import itertools
+import logging
+import sys
+import threading
+import time
+
+log = logging.getLogger("aoi.inference_api.profiling")
+
+
+class StackSampler(threading.Thread):
+    """Sampling profiler cho đúng 1 thread: định kỳ đọc sys._current_frames() và đếm stack.
+
+    Kết quả ở dạng "folded stacks" (``a;b;c <count>``) dùng trực tiếp cho
+    flamegraph.pl / speedscope / inferno.
+    """
+
+    def __init__(self, target_tid: int, interval_s: float = 0.005):
+        super().__init__(name=f"aoi-profiler-{target_tid}", daemon=True)
+        self.target_tid = target_tid
+        self.interval_s = max(0.0005, float(interval_s))
+        self.counts: Dict[str, int] = {}
+        self.samples = 0
+        self._stop_evt = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_evt.wait(self.interval_s):
+            frame = sys._current_frames().get(self.target_tid)
+            if frame is None:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self) -> Dict[str, int]:
+        self._stop_evt.set()
+        self.join(timeout=1.0)
+        return self.counts
+
+
+class ProfilingHook:
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        sample_every: int = 100,
+        stations: Optional[List[str]] = None,
+        interval_ms: float = 5.0,
+        out_dir: str | Path = "data/profiles",
+        max_files: int = 200,
+    ):
+        self.enabled = bool(enabled)
+        self.sample_every = max(0, int(sample_every))
+        self.stations = set(stations or [])
+        self.interval_ms = float(interval_ms)
+        self.out_dir = Path(out_dir)
+        self.max_files = max(1, int(max_files))
+        self._seq = itertools.count(1)
+        self._lock = threading.Lock()
+        self._profiled = 0
+        self._last_files: List[str] = []
+
+    def should_profile(self, station_id: str) -> bool:
+        if not self.enabled:
+            return False
+        if station_id in self.stations:
+            return True
+        n = next(self._seq)
+        return self.sample_every > 0 and (n % self.sample_every) == 0
+
+    @contextmanager
+    def profile(self, station_id: str) -> Iterator[None]:
+        if not self.should_profile(station_id):
+            yield
+            return
+        sampler = StackSampler(threading.get_ident(), interval_s=self.interval_ms / 1000.0)
+        t0 = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            counts = sampler.stop()
+            wall_ms = (time.perf_counter() - t0) * 1000.0
+            try:
+                self._dump(station_id, counts, wall_ms)
+            except Exception as e:
+                log.warning("profile dump failed: %s", e)
+
+    def _dump(self, station_id: str, counts: Dict[str, int], wall_ms: float) -> None:
+        if not counts:
+            return
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}_{int(time.time() * 1000) % 1000:03d}_{station_id}_{int(wall_ms)}ms.folded"
+        path = self.out_dir / name
+        path.write_text("".join(f"{k} {v}\n" for k, v in counts.items()), encoding="utf-8")
+        with self._lock:
+            self._profiled += 1
+            self._last_files = ([name] + self._last_files)[:10]
+            files = sorted(self.out_dir.glob("*.folded"), key=lambda p: p.stat().st_mtime)
+            for old in files[: max(0, len(files) - self.max_files)]:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+        log.info("profile written: %s (%d samples)", path, sum(counts.values()))
+
+    def configure(self, **kwargs: Any) -> Dict[str, Any]:
+        with self._lock:
+            if kwargs.get("enabled") is not None:
+                self.enabled = bool(kwargs["enabled"])
+            if kwargs.get("sample_every") is not None:
+                self.sample_every = max(0, int(kwargs["sample_every"]))
+            if kwargs.get("stations") is not None:
+                self.stations = set(kwargs["stations"])
+            if kwargs.get("interval_ms") is not None:
+                self.interval_ms = max(0.5, float(kwargs["interval_ms"]))
+        log.info("profiling reconfigured: %s", self.status())
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "sample_every": self.sample_every,
+            "stations": sorted(self.stations),
+            "interval_ms": self.interval_ms,
+            "out_dir": str(self.out_dir),
+            "max_files": self.max_files,
+            "profiled": self._profiled,
+            "recent_files": list(self._last_files),
+        }
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any], project_root: Path) -> "ProfilingHook":
+        p = cfg or {}
+        out_dir = Path(p.get("out_dir", "data/profiles"))
+        if not out_dir.is_absolute():
+            out_dir = project_root / out_dir
+        return cls(
+            enabled=bool(p.get("enabled", False)),
+            sample_every=int(p.get("sample_every", 100)),
+            stations=list(p.get("stations") or []),
+            interval_ms=float(p.get("interval_ms", 5.0)),
+            out_dir=out_dir,
+            max_files=int(p.get("max_files", 200)),
+        )
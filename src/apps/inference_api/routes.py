@@ -1,15 +1,19 @@
 from __future__ import annotations
-import time, uuid, logging
+import time, uuid, logging, os, hmac
 from typing import Optional, List, Dict
 from pathlib import Path
 
 import numpy as np
 import cv2
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Header, Query
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 
-from .schemas import InferRequestMeta, InferResponse, HealthzResponse, DefectItem
+from .schemas import InferRequestMeta, InferResponse, HealthzResponse, DefectItem, ProfilingUpdate
 from . import deps
+from .admission import AdmissionRejected
+from . import metrics
+from .metrics import StageTimer
 from aoi import (
     register_to_template, tile_960, merge_tiles, draw_overlay,
     quick_decision, build_inference_payload
@@ -23,7 +27,59 @@ log = logging.getLogger("aoi.inference_api")
 async def healthz():
     ok_minio = "ok" if deps.minio_enabled() else ("disabled" if deps.get_minio() is None else "unknown")
     kafka_state = "mock" if deps.is_mock_producer() else ("ok" if deps.get_producer().healthy() else "down")
-    return HealthzResponse(status="ok", minio=ok_minio, kafka=kafka_state, details={})
+    return HealthzResponse(status="ok", minio=ok_minio, kafka=kafka_state,
+                           details={"producer": deps.get_producer().stats()},
+                           admission=deps.get_admission().stats())
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    if not metrics.enabled():
+        raise HTTPException(status_code=503, detail="prometheus_client is not installed")
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+def _check_admin(token: Optional[str]) -> None:
+    # không đặt AOI_ADMIN_TOKEN -> tắt hẳn các endpoint /admin (bật profiling ghi file ra đĩa)
+    expected = os.getenv("AOI_ADMIN_TOKEN", "")
+    if not expected:
+        raise HTTPException(status_code=404, detail="admin endpoints are disabled (AOI_ADMIN_TOKEN not set)")
+    if not hmac.compare_digest((token or "").encode("utf-8"), expected.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="invalid admin token")
+
+
+@router.get("/admin/profiling")
+async def profiling_status(x_admin_token: Optional[str] = Header(None)):
+    _check_admin(x_admin_token)
+    return deps.get_profiler().status()
+
+
+@router.post("/admin/profiling")
+async def profiling_update(body: ProfilingUpdate, x_admin_token: Optional[str] = Header(None)):
+    _check_admin(x_admin_token)
+    return deps.get_profiler().configure(**body.model_dump())
+
+
+@router.get("/admin/memory")
+async def memory_status(x_admin_token: Optional[str] = Header(None)):
+    _check_admin(x_admin_token)
+    return deps.get_memprof().stats()
+
+
+@router.get("/admin/memory/top")
+async def memory_top(
+    limit: int = Query(20, ge=1, le=500),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    x_admin_token: Optional[str] = Header(None),
+):
+    _check_admin(x_admin_token)
+    probe = deps.get_memprof()
+    if probe.mode != "tracemalloc":
+        raise HTTPException(status_code=409, detail="top allocation sites require memory.mode=tracemalloc")
+    # take_snapshot duyệt toàn bộ trace -> chạy ngoài event loop
+    top = await run_in_threadpool(probe.top, limit, group_by)
+    return {"mode": probe.mode, "group_by": group_by, "top": top, "stats": probe.stats()}
 
 
 def _save_overlay_local(product_code: str, event_id: str, ts_ms: int, overlay_bgr) -> str:
@@ -43,85 +99,134 @@ async def infer(
     product_code: str = Form(...),
     station_id: str = Form(...),
     board_serial: Optional[str] = Form(None),
+    deadline_ms: Optional[int] = Form(None, ge=0, description="Latency budget (ms) tính từ lúc nhận request"),
 ):
+    t_arrival = time.perf_counter()
+
     # 1) Parse metadata
     meta = InferRequestMeta(product_code=product_code, station_id=station_id, board_serial=board_serial)
 
-    # 2) Nạp ảnh
+    runner = deps.get_runner(meta.station_id)
+    if runner is None:
+        raise HTTPException(status_code=400, detail=f"station_id '{meta.station_id}' is not configured")
+
+    # 2) Admission control: chờ slot trước khi đọc/giải mã ảnh
     try:
-        raw_bytes = await image.read()
-        arr = np.frombuffer(raw_bytes, dtype=np.uint8)
-        img_bgr = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        if img_bgr is None:
-            raise ValueError("cv2.imdecode returned None")
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+        admission = deps.get_admission()
+        async with admission.slot(meta.station_id):
+            raw_bytes = await image.read()
+            # 2b) Deadline: chọn mức degrade theo budget còn lại và backlog của station
+            degradation = deps.get_degradation().choose(
+                meta.station_id,
+                budget_ms=deadline_ms,
+                elapsed_ms=(time.perf_counter() - t_arrival) * 1000.0,
+                backlog=admission.queue_depth(meta.station_id),
+                slots=admission.max_inflight_per_station,
+                has_int8=deps.get_runner_int8(meta.station_id) is not None,
+            )
+            resp = await run_in_threadpool(_run_pipeline_profiled, meta, runner, raw_bytes, degradation)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason,
+                            headers={"Retry-After": str(e.retry_after_s)})
+    return JSONResponse(status_code=200, content=resp.model_dump())
+
+
+def _run_pipeline_profiled(meta: InferRequestMeta, runner, raw_bytes: bytes, degradation: Dict) -> InferResponse:
+    # sampling profiler (opt-in) chạy trên đúng thread đang xử lý request
+    with deps.get_profiler().profile(meta.station_id):
+        return _run_pipeline(meta, runner, raw_bytes, degradation)
+
+
+def _run_pipeline(meta: InferRequestMeta, runner, raw_bytes: bytes, degradation: Dict) -> InferResponse:
+    mem = deps.get_memprof()
+    timer = StageTimer(mem=mem)
+    policy = deps.get_degradation()
+    lv = policy.level(degradation["level"])
+    int8_used = False
+    if lv.int8:
+        r8 = deps.get_runner_int8(meta.station_id)
+        if r8 is not None:
+            runner, int8_used = r8, True
+
+    # 3) Nạp ảnh
+    with timer.stage("decode"):
+        try:
+            arr = np.frombuffer(raw_bytes, dtype=np.uint8)
+            img_bgr = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+            if img_bgr is None:
+                raise ValueError("cv2.imdecode returned None")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
 
     cfg = deps.get_config()
     flags = deps.get_flags()
 
-    # 3) Runner
-    runner = deps.get_runner(meta.station_id)
-    if runner is None:
-        raise HTTPException(status_code=400, detail=f"station_id '{meta.station_id}' is not configured")
-
     t0 = time.perf_counter()
 
     # 4) Registration (optional)
     img_infer = img_bgr
-    if flags.get("enable_registration"):
+    if flags.get("enable_registration") and lv.registration:
         tpl_path = (cfg.get("app", {}) or {}).get("template_image")
         if tpl_path:
-            try:
-                tpl = cv2.imread(tpl_path)
-                if tpl is not None:
-                    img_infer, _H = register_to_template(img_bgr, tpl)
-            except Exception as e:
-                log.warning("registration failed: %s", e)
+            with timer.stage("register"):
+                try:
+                    tpl = cv2.imread(tpl_path)
+                    if tpl is not None:
+                        img_infer, _H = register_to_template(img_bgr, tpl)
+                except Exception as e:
+                    log.warning("registration failed: %s", e)
 
     # 5) Tiling + predict
-    tiles = tile_960(img_infer, tile_size=runner.imgsz, overlap=64)
+    with timer.stage("tile"):
+        tiles = tile_960(img_infer, tile_size=int(runner.imgsz * lv.tile_scale), overlap=lv.overlap)
     tile_preds: List[Dict] = []
-    for t in tiles:
-        dets_tile = runner.predict_tile(t["tile"])
-        tile_preds.append({"xy0": t["xy0"], "dets": dets_tile})
+    with timer.stage("infer"):
+        for t in tiles:
+            dets_tile = runner.predict_tile(t["tile"])
+            tile_preds.append({"xy0": t["xy0"], "dets": dets_tile})
 
     # 6) Merge
-    defects = merge_tiles(tile_preds, iou_thres=0.5, per_class_nms=True)
+    with timer.stage("merge"):
+        defects = merge_tiles(tile_preds, iou_thres=0.5, per_class_nms=True)
 
     # 7) AQL mini
-    decision = quick_decision(defects, measures=None, rules=None)
+    with timer.stage("decision"):
+        decision = quick_decision(defects, measures=None, rules=None)
 
-    # 8) Overlay & upload/save
-    overlay_bgr = draw_overlay(img_infer, defects)
+    # 8) Overlay & upload/save (bỏ qua nếu level degrade tắt overlay)
     event_id = str(uuid.uuid4())
     ts_ms = int(time.time() * 1000)
 
     raw_url = ""
     overlay_url = ""
 
-    if deps.minio_enabled():
-        minio = deps.get_minio()
-        try:
-            overlay_key = minio.make_overlay_key(meta.product_code, event_id, ts_ms)
-            overlay_url = minio.put_image(overlay_key, overlay_bgr, return_presigned=True)
-        except Exception as e:
-            log.error("MinIO upload failed: %s", e)
-    else:
-        try:
-            overlay_url = _save_overlay_local(meta.product_code, event_id, ts_ms, overlay_bgr)
-        except Exception as e:
-            log.error("Local overlay save failed: %s", e)
+    if lv.overlay:
+        with timer.stage("overlay"):
+            overlay_bgr = draw_overlay(img_infer, defects)
+        with timer.stage("upload"):
+            if deps.minio_enabled():
+                minio = deps.get_minio()
+                try:
+                    overlay_key = minio.make_overlay_key(meta.product_code, event_id, ts_ms)
+                    overlay_url = minio.put_image(overlay_key, overlay_bgr, return_presigned=True)
+                except Exception as e:
+                    log.error("MinIO upload failed: %s", e)
+            else:
+                try:
+                    overlay_url = _save_overlay_local(meta.product_code, event_id, ts_ms, overlay_bgr)
+                except Exception as e:
+                    log.error("Local overlay save failed: %s", e)
 
     latency_ms = int((time.perf_counter() - t0) * 1000)
 
-    # 9) Payload để ghi DB/Kafka
+    # 9) Payload để ghi DB/Kafka (stages_ms trong meta chưa gồm "publish")
     model_cfg = deps.get_station_model_cfg(meta.station_id)
+    model_version = deps.get_model_version(model_cfg, int8=int8_used)
     payload = build_inference_payload(
         product_code=meta.product_code,
         station_id=meta.station_id,
         model_family=model_cfg["family"],
-        model_version=deps.get_model_version(model_cfg),
+        model_version=model_version,
         latency_ms=latency_ms,
         defects=defects,
         raw_url=raw_url or overlay_url,
@@ -129,13 +234,26 @@ async def infer(
         board_serial=meta.board_serial,
         event_id=event_id,
         ts_ms=ts_ms,
+        meta={"capture_id": None, "notes": None, "stages_ms": timer.as_dict(), "degradation": degradation},
         aql_mini_decision=decision,
     )
 
-    try:
-        deps.get_producer().publish(payload)
-    except Exception as e:
-        log.error("Publish failed: %s", e)
+    with timer.stage("publish"):
+        try:
+            deps.get_producer().publish(payload)
+        except Exception as e:
+            log.error("Publish failed: %s", e)
+
+    stages_ms = timer.as_dict()
+    total_ms = timer.elapsed_ms()
+    metrics.observe_request(meta.station_id, model_version, stages_ms, total_ms)
+    policy.observe(meta.station_id, lv.level, total_ms)
+    mem_peak: Optional[Dict[str, int]] = None
+    if mem.enabled:
+        req_peak = timer.request_peak_bytes()
+        mem.record(timer.peak_bytes, req_peak)
+        metrics.observe_memory(meta.station_id, timer.peak_bytes, req_peak)
+        mem_peak = dict(timer.peak_bytes, request=req_peak)
 
     # 10) Response cho client
     preview = [DefectItem(**d) for d in (defects[:3] if defects else [])]
@@ -149,7 +267,10 @@ async def infer(
         product_code=meta.product_code,
         station_id=meta.station_id,
         model_family=model_cfg["family"],
-        model_version=deps.get_model_version(model_cfg),
+        model_version=model_version,
         defects_preview=preview or None,
+        stages_ms=stages_ms,
+        degradation=degradation,
+        mem_peak_bytes=mem_peak,
     )
-    return JSONResponse(status_code=200, content=resp.model_dump())
+    return resp
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any
 from pydantic import BaseModel, Field, ConfigDict
 
 
@@ -40,10 +40,23 @@ class InferResponse(BaseModel):
     model_version: str
 
     defects_preview: Optional[List[DefectItem]] = None
+    stages_ms: Optional[Dict[str, float]] = None
+    degradation: Optional[Dict[str, Any]] = None
+    mem_peak_bytes: Optional[Dict[str, int]] = None
 
 
 class HealthzResponse(BaseModel):
     status: str = "ok"
     kafka: str = "mock"
     minio: str = "unknown"
-    details: Dict[str, str] = {}
+    details: Dict[str, Any] = {}
+    admission: Optional[Dict[str, Any]] = None
+
+
+class ProfilingUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    sample_every: Optional[int] = Field(None, ge=0, description="Profile 1/N request (0 = chỉ theo station)")
+    stations: Optional[List[str]] = None
+    interval_ms: Optional[float] = Field(None, gt=0)
+
+    model_config = ConfigDict(extra="forbid")
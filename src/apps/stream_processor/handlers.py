@@ -1,9 +1,9 @@
 from __future__ import annotations
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 import json
 import logging
 import time
-from .rules import apply_aql 
+from .rules import compile_spec
 from .spec_loader import SpecRepository
 from src.pipelines.clickhouse_writer import ClickHouseWriter 
 
@@ -30,26 +30,18 @@ def _validate_payload(p: Dict[str, Any]) -> Tuple[bool, Optional[str]]:
     return True, None
 
 
-def handle_inference_result(
-    payload: Dict[str, Any],
-    ck_writer: ClickHouseWriter,
-    spec_repo: SpecRepository,
-    qc_event_producer=None,  
-) -> None:
-    """Xử lý 1 message inference_results."""
-    ok, err = _validate_payload(payload)
-    if not ok:
-        log.error("invalid payload: %s", err)
-        return
-
+def _evaluate(
+    payload: Dict[str, Any], spec: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Áp AQL cho 1 payload hợp lệ -> (row ClickHouse, qc_event hoặc None nếu PASS)."""
     product_code = str(payload["product_code"])
     station_id = str(payload["station_id"])
     event_id = str(payload["event_id"])
     ts_ms = int(payload["ts_ms"])
     defects = payload.get("defects") or []
     measures = payload.get("measures") or None
-    spec = spec_repo.load_spec(product_code)
-    final_decision, reason, severity = apply_aql(defects, measures, spec)
+    engine = compile_spec(spec)
+    final_decision, reason, severity = engine.evaluate(defects, measures).as_tuple()
     iu = payload.get("image_urls", {}) or {}
     overlay_url = str(iu.get("overlay_url", ""))
     raw_url = str(iu.get("raw_url") or overlay_url)
@@ -70,30 +62,106 @@ def handle_inference_result(
         "defects_json": defects,  
         "image_overlay_url": overlay_url,
         "image_raw_url": raw_url,
+        "spec_version": engine.spec_hash,
     }
 
-
-    ck_writer.insert_inspection(record)
-
-    if qc_event_producer and (final_decision == "FAIL"):
-        sev = severity or "MAJOR"
+    qc_event = None
+    if final_decision == "FAIL":
         qc_event = {
             "event_id": event_id,
             "ts_ms": ts_ms,
             "product_code": product_code,
             "station_id": station_id,
-            "severity": sev,
+            "severity": severity or "MAJOR",
             "reason": reason,
             "overlay_url": overlay_url,
             "defect_count": len(defects),
         }
-        try:
-            qc_event_producer.publish(qc_event)
-        except Exception as e:
-            log.warning("qc_event publish failed: %s", e)
+    return record, qc_event
+
 
+def _publish_qc(qc_event_producer, qc_event: Dict[str, Any]) -> None:
+    try:
+        qc_event_producer.publish(qc_event)
+    except Exception as e:
+        log.warning("qc_event publish failed: %s", e)
+
+
+def handle_inference_result(
+    payload: Dict[str, Any],
+    ck_writer: ClickHouseWriter,
+    spec_repo: SpecRepository,
+    qc_event_producer=None,  
+) -> None:
+    """Xử lý 1 message inference_results."""
+    if not isinstance(payload, dict):
+        log.error("invalid payload: expected JSON object, got %s", type(payload).__name__)
+        return
+    ok, err = _validate_payload(payload)
+    if not ok:
+        log.error("invalid payload: %s", err)
+        return
+
+    record, qc_event = _evaluate(payload, spec_repo.load_spec(str(payload["product_code"])))
+    ck_writer.insert_inspection(record)
+
+    if qc_event_producer and qc_event is not None:
+        _publish_qc(qc_event_producer, qc_event)
 
     log.info(
         "ingested event_id=%s product=%s station=%s defects=%d final=%s severity=%s",
-        event_id, product_code, station_id, len(defects), final_decision, severity or "-"
+        record["event_id"], record["product_code"], record["station_id"], record["defect_count"],
+        record["aql_final_decision"], (qc_event or {}).get("severity", "-"),
     )
+
+
+def handle_inference_batch(
+    payloads: List[Dict[str, Any]],
+    ck_writer: ClickHouseWriter,
+    spec_repo: SpecRepository,
+    qc_event_producer=None,
+    offsets: Optional[Dict[Tuple[str, int], int]] = None,
+) -> Dict[str, int]:
+    """Xử lý 1 batch inference_results: validate + AQL từng payload, ghi ClickHouse bằng 1 lần insert_many.
+
+    Spec được tra 1 lần cho mỗi product_code trong batch. Payload lỗi được log và bỏ qua.
+    ``offsets`` đi kèm batch vào writer và chỉ được commit sau khi batch đã flush vào ClickHouse.
+    """
+    specs: Dict[str, Dict[str, Any]] = {}
+    records: List[Dict[str, Any]] = []
+    qc_events: List[Dict[str, Any]] = []
+    invalid = 0
+    for payload in payloads:
+        # JSON hợp lệ nhưng không phải object (null, list, string) -> bỏ riêng message đó, không làm hỏng cả batch
+        if not isinstance(payload, dict):
+            log.error("invalid payload: expected JSON object, got %s", type(payload).__name__)
+            invalid += 1
+            continue
+        ok, err = _validate_payload(payload)
+        if not ok:
+            log.error("invalid payload (event_id=%s): %s", payload.get("event_id"), err)
+            invalid += 1
+            continue
+        try:
+            product_code = str(payload["product_code"])
+            spec = specs.get(product_code)
+            if spec is None:
+                spec = specs[product_code] = spec_repo.load_spec(product_code)
+            record, qc_event = _evaluate(payload, spec)
+        except Exception as e:
+            log.error("evaluate failed (event_id=%s): %s", payload.get("event_id"), e)
+            invalid += 1
+            continue
+        records.append(record)
+        if qc_event is not None:
+            qc_events.append(qc_event)
+
+    if qc_event_producer:
+        for ev in qc_events:
+            _publish_qc(qc_event_producer, ev)
+
+    if records or offsets:
+        ck_writer.insert_many(records, token=offsets or None)
+
+    log.debug("batch ingested=%d fail=%d invalid=%d", len(records), len(qc_events), invalid)
+    return {"ingested": len(records), "failed": len(qc_events), "invalid": invalid}
@@ -6,16 +6,16 @@ import time
 import logging
 from pathlib import Path
 
-from src.pipelines.kafka_consumer import KafkaJSONConsumer, load_streaming_config as load_stream_cfg
+from src.pipelines.kafka_consumer import KafkaJSONConsumer, OffsetTracker, load_streaming_config as load_stream_cfg
 from src.pipelines.clickhouse_writer import ClickHouseWriter 
 from src.apps.stream_processor.spec_loader import SpecRepository 
-from src.apps.stream_processor.handlers import handle_inference_result 
+from src.apps.stream_processor.handlers import handle_inference_batch
 from src.apps.stream_processor.producer import QCEventProducer 
 
 
 logging.basicConfig(
     level=os.getenv("AOI_LOG_LEVEL", "INFO"),
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+    format="%(asctime)s | %(levelname)s | %(processName)s | %(name)s | %(message)s",
 )
 log = logging.getLogger("aoi.stream_processor")
 
@@ -30,18 +30,43 @@ def _sig_handler(signum, frame):
 def main():
     cfg_path = os.getenv("AOI_STREAMING_CONFIG", "configs/streaming.yaml")
     cfg = load_stream_cfg(cfg_path)
+    workers = int(os.getenv("AOI_PROCESSOR_WORKERS", str((cfg.get("processor", {}) or {}).get("workers", 1))))
+    if workers > 1 and os.getenv("AOI_WORKER_ID") is None:
+        from src.apps.stream_processor.supervisor import run_supervisor
+        return run_supervisor(workers)
+    return run_worker(cfg_path, cfg)
+
+
+def run_worker(cfg_path: str, cfg: dict) -> int:
+    """1 consumer + writer + spec cache; nhiều worker cùng group chia nhau các partition."""
+    worker_id = os.getenv("AOI_WORKER_ID")
 
     # ---- Kafka consumer
-    consumer = KafkaJSONConsumer.from_yaml(cfg_path)
-    consumer.subscribe()
+    consumer = KafkaJSONConsumer.from_yaml(
+        cfg_path, extra={"client.id": f"aoi-processor-w{worker_id}"} if worker_id is not None else None)
 
-    # ---- ClickHouse writer
+    # ---- ClickHouse writer; offset chỉ được commit sau khi batch chứa nó đã flush
     ck_bulk_rows = int(os.getenv("AOI_CK_BULK_ROWS", "500"))
     ck_bulk_secs = float(os.getenv("AOI_CK_BULK_SECS", "2.0"))
-    ck = ClickHouseWriter.from_yaml(cfg_path, bulk_max_rows=ck_bulk_rows, bulk_max_seconds=ck_bulk_secs)
+    ck = ClickHouseWriter.from_yaml(cfg_path, bulk_max_rows=ck_bulk_rows, bulk_max_seconds=ck_bulk_secs,
+                                    spill_subdir=f"w{worker_id}" if worker_id is not None else None)
+    offsets = OffsetTracker(consumer, asynchronous=True)
+    ck.on_flush = offsets.on_flush
+
+    def _on_revoke(_consumer, partitions):
+        # trước khi mất partition: đẩy buffer vào ClickHouse và commit đồng bộ
+        try:
+            ck.flush()
+            offsets.commit(asynchronous=False)
+        except Exception as e:
+            log.error("flush on revoke failed (rows will be re-consumed): %s", e)
+        offsets.forget(partitions)
+
+    consumer.subscribe(on_revoke=_on_revoke)
 
     # ---- Spec repository
     spec_repo = SpecRepository.from_yaml(cfg_path)
+    log.info("Specs warmed: %d (mode=%s)", spec_repo.warm(), spec_repo.mode)
 
     # ---- Optional QC events producer
     kc = cfg.get("kafka", {}) or {}
@@ -53,58 +78,103 @@ def main():
             brokers=str(kc.get("brokers", "kafka:9092")),
             schema_registry_url=str(kc.get("schema_registry", "http://schema-registry:8081")),
             topic=qc_topic,
-            jsonl_path=Path("data/processed/qc_events.jsonl"),
+            # mỗi worker 1 file mock riêng (RotatingJsonlWriter không chia sẻ giữa process)
+            jsonl_path=Path("data/processed/qc_events.jsonl" if worker_id is None
+                            else f"data/processed/qc_events.w{worker_id}.jsonl"),
+            jsonl_writer=kc.get("mock_jsonl") or {},
+            avro_encoder=str(kc.get("avro_encoder", "compiled")),
+            schema_id_cache=Path(str(kc.get("schema_id_cache", "data/cache/schema_ids.json"))),
         )
 
     # ---- Signals
     signal.signal(signal.SIGINT, _sig_handler)
     signal.signal(signal.SIGTERM, _sig_handler)
 
-    log.info("Stream Processor started. bulk_rows=%s bulk_secs=%s alerts=%s",
-             ck_bulk_rows, ck_bulk_secs, alerts_enabled)
+    # ---- Batch consume
+    pc = cfg.get("processor", {}) or {}
+    batch_size = int(os.getenv("AOI_BATCH_SIZE", str(pc.get("batch_size", 500))))
+    batch_timeout = float(os.getenv("AOI_BATCH_TIMEOUT_MS", str(pc.get("batch_timeout_ms", 500)))) / 1000.0
+    stats_interval = float(pc.get("stats_interval_s", 30))
+
+    log.info("Stream Processor started. bulk_rows=%s bulk_secs=%s ck_background=%s alerts=%s batch_size=%s "
+             "batch_timeout=%.3fs", ck_bulk_rows, ck_bulk_secs, ck.background, alerts_enabled, batch_size,
+             batch_timeout)
 
-    idle_backoff = 0.2
     last_flush_ts = time.monotonic()
-    flush_interval = max(ck_bulk_secs, 2.0) if (ck_bulk_rows > 0 or ck_bulk_secs > 0) else 0.0
+    # writer background tự flush theo ngưỡng trên thread riêng; chế độ inline cần vòng lặp đẩy theo thời gian
+    inline_flush = (ck_bulk_rows > 0 or ck_bulk_secs > 0) and not ck.background
+
+    win_start = time.monotonic()
+    win_msgs = win_batches = win_invalid = 0
+    busy_s = 0.0
 
     try:
         while not _STOP:
-            msg = next(consumer.iter_messages(), None)
-            if not msg or not msg.get("payload"):
-                time.sleep(idle_backoff)
-
-                if flush_interval and (time.monotonic() - last_flush_ts) >= flush_interval:
+            msgs, batch_offsets = consumer.consume_batch(batch_size, batch_timeout)
+            if msgs or batch_offsets:
+                # batch toàn message hỏng vẫn mang offset để commit sau flush kế tiếp
+                t0 = time.monotonic()
+                try:
+                    res = handle_inference_batch(
+                        payloads=[m["payload"] for m in msgs],
+                        ck_writer=ck,
+                        spec_repo=spec_repo,
+                        qc_event_producer=qc_producer,
+                        offsets=batch_offsets,
+                    )
+                    win_invalid += res["invalid"]
+                except Exception as e:
+                    # lỗi trước insert_many: dòng + offset của batch KHÔNG vào writer (offset batch sau sẽ commit
+                    # vượt qua chúng); lỗi khi flush trong insert_many: dòng + offset đã ở buffer writer, thử lại sau
+                    log.exception("handle batch failed (n=%d): %s", len(msgs), e)
+                busy_s += time.monotonic() - t0
+                win_msgs += len(msgs)
+                win_batches += 1
+
+            now = time.monotonic()
+            # ck.bulk_max_seconds có thể tăng khi writer thích nghi theo số part / phút
+            if inline_flush and (now - last_flush_ts) >= max(ck.bulk_max_seconds, 2.0):
+                try:
                     ck.flush()
-                    last_flush_ts = time.monotonic()
-                continue
-
-            payload = msg["payload"]
-            try:
-                handle_inference_result(
-                    payload=payload,
-                    ck_writer=ck,
-                    spec_repo=spec_repo,
-                    qc_event_producer=qc_producer,
-                )
-                consumer.commit(msg["raw"])
-            except Exception as e:
-                log.exception("handle message failed: %s", e)
-
-            if flush_interval and (time.monotonic() - last_flush_ts) >= flush_interval:
-                ck.flush()
+                except Exception as e:
+                    log.error("ClickHouse flush failed (will retry): %s", e)
                 last_flush_ts = time.monotonic()
 
+            if now - win_start >= stats_interval:
+                elapsed = now - win_start
+                cs = ck.stats()
+                log.info("throughput %.1f msg/s (msgs=%d batches=%d avg_batch=%.1f invalid=%d busy=%.0f%%) "
+                         "ck pending=%d flush_p95=%sms parts/min=%s scale=%.2f errors=%d retries=%d dropped=%d "
+                         "blocked=%.1fs spill=%s",
+                         win_msgs / elapsed, win_msgs, win_batches, win_msgs / max(1, win_batches),
+                         win_invalid, 100.0 * busy_s / elapsed, cs["pending_rows"], cs["flush_ms_p95"],
+                         cs["parts_per_min"], cs["batch_scale"],
+                         cs["flush_errors"], cs["retries"], cs["dropped_rows"], cs["blocked_s"],
+                         "-" if cs["spill"] is None else
+                         f"{cs['spill']['backlog']['records']}b/{cs['spill']['replay_lag_ms']}ms")
+                win_start = now
+                win_msgs = win_batches = win_invalid = 0
+                busy_s = 0.0
+
     finally:
 
         try:
-            ck.flush()
-        except Exception:
-            pass
+            ck.close()
+            offsets.commit(asynchronous=False)
+        except Exception as e:
+            log.error("final flush failed; uncommitted rows will be re-consumed: %s", e)
         try:
             consumer.close()
         except Exception:
             pass
+        spec_repo.close()
+        if qc_producer is not None:
+            try:
+                qc_producer.close()
+            except Exception:
+                pass
         log.info("Stream Processor stopped.")
+    return 0
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -3,27 +3,26 @@ from typing import Optional, Dict, Any
 from pathlib import Path
 import json
 import os
-import threading
+
+from src.aoi.io.avro_codec import AvroEncoder, resolve_schema_id
+from src.aoi.io.jsonl_writer import RotatingJsonlWriter
 
 
 class MockQCEventProducer:
-    def __init__(self, out_path: str | Path = "data/processed/qc_events.jsonl"):
+    def __init__(self, out_path: str | Path = "data/processed/qc_events.jsonl",
+                 writer_config: Optional[Dict[str, Any]] = None):
         self.path = Path(out_path)
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        self._lock = threading.Lock()
+        self._writer = RotatingJsonlWriter.from_config(self.path, writer_config)
 
     def publish(self, event: Dict[str, Any]) -> str:
-        with self._lock:
-            with self.path.open("a", encoding="utf-8") as f:
-                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._writer.write(event)
         return str(event.get("event_id", ""))
 
     def healthy(self) -> bool:
-        try:
-            self.path.touch(exist_ok=True)
-            return True
-        except Exception:
-            return False
+        return self._writer.healthy()
+
+    def close(self) -> None:
+        self._writer.close()
 
 
 class KafkaAvroQCEventProducer:
@@ -43,7 +42,8 @@ class KafkaAvroQCEventProducer:
         ]
     })
 
-    def __init__(self, brokers: str, schema_registry_url: str, topic: str):
+    def __init__(self, brokers: str, schema_registry_url: str, topic: str,
+                 avro_encoder: str = "compiled", schema_id_cache: Optional[str | Path] = None):
         try:
             from confluent_kafka.schema_registry import SchemaRegistryClient 
             from confluent_kafka.serialization import StringSerializer
@@ -62,7 +62,12 @@ class KafkaAvroQCEventProducer:
 
         self.topic = topic
         self._sr = SchemaRegistryClient({"url": schema_registry_url})
-        self._value_serializer = AvroSerializer(self._sr, self._value_schema_str)
+        if avro_encoder == "compiled":
+            schema_id = resolve_schema_id(self._value_schema_str, f"{topic}-value", schema_registry_url,
+                                          cache_path=schema_id_cache, sr_client=self._sr)
+            self._value_serializer = AvroEncoder(self._value_schema_str, schema_id)
+        else:
+            self._value_serializer = AvroSerializer(self._sr, self._value_schema_str)
         self._key_serializer = StringSerializer("utf_8")
         self._producer = Producer({"bootstrap.servers": brokers})
 
@@ -97,22 +102,32 @@ class QCEventProducer:
         topic: str,
         mock: Optional[bool] = None,
         jsonl_path: str | Path = "data/processed/qc_events.jsonl",
+        jsonl_writer: Optional[Dict[str, Any]] = None,
+        avro_encoder: str = "compiled",
+        schema_id_cache: Optional[str | Path] = None,
     ):
         mode_env = os.getenv("AOI_QC_EVENTS_MODE", "").lower().strip()
         if mock is None:
             mock = (mode_env == "mock")
 
         if mock:
-            self._impl = MockQCEventProducer(jsonl_path)
+            self._impl = MockQCEventProducer(jsonl_path, jsonl_writer)
         else:
             try:
-                self._impl = KafkaAvroQCEventProducer(brokers, schema_registry_url, topic)
+                self._impl = KafkaAvroQCEventProducer(brokers, schema_registry_url, topic,
+                                                      avro_encoder=avro_encoder,
+                                                      schema_id_cache=schema_id_cache)
             except Exception:
                 # fallback mock nếu thiếu thư viện hoặc registry
-                self._impl = MockQCEventProducer(jsonl_path)
+                self._impl = MockQCEventProducer(jsonl_path, jsonl_writer)
 
     def publish(self, event: Dict[str, Any]) -> str:
         return self._impl.publish(event)
 
     def healthy(self) -> bool:
         return bool(self._impl.healthy())
+
+    def close(self) -> None:
+        close = getattr(self._impl, "close", None)
+        if close is not None:
+            close()
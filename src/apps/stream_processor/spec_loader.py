@@ -1,15 +1,27 @@
 from __future__ import annotations
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, TYPE_CHECKING
 from pathlib import Path
 import json
+import os
+import threading
 import time
 import logging
 import yaml
 
-from aoi.io import MinIOClient  
+if TYPE_CHECKING:
+    from aoi.io import MinIOClient
 
 log = logging.getLogger("aoi.stream_processor.spec_loader")
 
+# spec mặc định khi không có file/object; luôn là cùng 1 object (engine AQL cache theo id)
+DEFAULT_SPEC: Dict[str, Any] = {
+    "banned_classes": [],
+    "max_defects": 999999,
+    "max_by_class": {},
+    "thresholds": {},
+    "severity_by_class": {}
+}
+
 
 def load_streaming_config(path: str | Path) -> Dict[str, Any]:
     p = Path(path).resolve()
@@ -18,15 +30,38 @@ def load_streaming_config(path: str | Path) -> Dict[str, Any]:
     return yaml.safe_load(p.read_text(encoding="utf-8")) or {}
 
 
+class _Entry:
+    __slots__ = ("spec", "etag", "mtime", "checked_at", "source")
+
+    def __init__(self, spec: Dict[str, Any], etag: Optional[str] = None, mtime: Optional[int] = None,
+                 source: str = "default"):
+        self.spec = spec
+        self.etag = etag
+        self.mtime = mtime
+        self.checked_at = time.monotonic()
+        self.source = source
+
+
 class SpecRepository:
+    """Spec AQL theo product_code, stale-while-revalidate.
+
+    ``load_spec`` chỉ đọc cache (không I/O) trừ lần đầu gặp product; thread nền làm mới:
+    - local: theo dõi mtime/size của ``<local_dir>/<product>.json`` mỗi ``watch_interval_s``,
+      nạp lại khi file đổi (không còn TTL);
+    - minio: sau ``ttl_seconds`` revalidate bằng GET có If-None-Match (ETag), 304 giữ nguyên spec cũ.
+    Lỗi khi làm mới giữ spec đang dùng. Spec không đổi -> cùng object dict (engine AQL không compile lại).
+    """
+
     def __init__(
         self,
-        mode: str = "local",               
+        mode: str = "local",
         local_dir: str | Path = "configs/specs",
         minio_client: Optional[MinIOClient] = None,
         minio_bucket: Optional[str] = None,
         minio_prefix: str = "specs",
-        ttl_seconds: int = 600             
+        ttl_seconds: int = 600,
+        watch_interval_s: float = 1.0,
+        background: bool = True,
     ):
         self.mode = mode
         self.local_dir = Path(local_dir)
@@ -34,11 +69,23 @@ class SpecRepository:
         self.minio_bucket = minio_bucket
         self.minio_prefix = minio_prefix.strip("/")
         self.ttl = int(ttl_seconds)
+        self.watch_interval_s = max(0.05, float(watch_interval_s))
+        if self.mode == "minio" and (self.minio is None or not self.minio_bucket):
+            log.error("Spec mode=minio requires minio_client and bucket; using local_dir=%s", self.local_dir)
+            self.mode = "local"
 
-        self._cache: Dict[str, tuple[float, Dict[str, Any]]] = {}
+        self._cache: Dict[str, _Entry] = {}
+        self._load_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.not_modified = 0
+        self.errors = 0
 
-    def _is_fresh(self, ts: float) -> bool:
-        return (time.time() - ts) < self.ttl
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if background:
+            self.start()
 
     def _local_path(self, product_code: str) -> Path:
         return self.local_dir / f"{product_code}.json"
@@ -46,44 +93,156 @@ class SpecRepository:
     def _minio_key(self, product_code: str) -> str:
         return f"{self.minio_prefix}/{product_code}.json"
 
+    # ---------------- message path ----------------
     def load_spec(self, product_code: str) -> Dict[str, Any]:
+        e = self._cache.get(product_code)
+        if e is not None:
+            self.hits += 1
+            if self._thread is None and (time.monotonic() - e.checked_at) >= self.ttl:
+                # không có thread nền -> làm mới đồng bộ theo TTL như trước
+                self._cache[product_code] = self._fetch(product_code, e)
+                return self._cache[product_code].spec
+            return e.spec
+        # product mới: phải nạp đồng bộ 1 lần
+        self.misses += 1
+        with self._load_lock:
+            e = self._cache.get(product_code)
+            if e is None:
+                e = self._fetch(product_code, None)
+                self._cache[product_code] = e
+        return e.spec
 
-        if product_code in self._cache:
-            ts, data = self._cache[product_code]
-            if self._is_fresh(ts):
-                return data
+    # ---------------- fetch ----------------
+    def _fetch(self, product_code: str, prev: Optional[_Entry]) -> _Entry:
+        if self.mode == "minio":
+            return self._fetch_minio(product_code, prev)
+        return self._fetch_local(product_code, prev)
 
-        spec = None
-        if self.mode == "local":
-            p = self._local_path(product_code)
-            if p.exists():
-                try:
-                    spec = json.loads(p.read_text(encoding="utf-8"))
-                except Exception as e:
-                    log.warning("Spec parse failed for %s: %s", p, e)
-        elif self.mode == "minio":
-            if self.minio is None or not self.minio_bucket:
-                log.error("MinIO mode requires minio_client and bucket")
+    def _fetch_local(self, product_code: str, prev: Optional[_Entry]) -> _Entry:
+        p = self._local_path(product_code)
+        try:
+            st = os.stat(p)
+        except OSError:
+            if prev is not None and prev.source == "default":
+                prev.checked_at = time.monotonic()
+                return prev
+            if prev is not None:
+                log.warning("Spec file %s removed; using default spec", p)
+            return _Entry(DEFAULT_SPEC)
+        sig = (st.st_mtime_ns, st.st_size)
+        if prev is not None and prev.mtime == sig:
+            prev.checked_at = time.monotonic()
+            return prev
+        try:
+            spec = json.loads(p.read_text(encoding="utf-8"))
+        except Exception as e:
+            self.errors += 1
+            log.warning("Spec parse failed for %s: %s", p, e)
+            if prev is not None:
+                # giữ spec cũ, không thử lại tới khi file đổi tiếp
+                prev.mtime = sig
+                prev.checked_at = time.monotonic()
+                return prev
+            return _Entry(DEFAULT_SPEC, mtime=sig)
+        if prev is not None:
+            self.reloads += 1
+            log.info("Spec reloaded product=%s from %s", product_code, p)
+        return _Entry(spec, mtime=sig, source="local")
+
+    def _fetch_minio(self, product_code: str, prev: Optional[_Entry]) -> _Entry:
+        key = self._minio_key(product_code)
+        try:
+            data, etag = self.minio.get_bytes_if_changed(
+                key, etag=prev.etag if prev is not None else None, bucket=self.minio_bucket)
+        except Exception as e:
+            if getattr(e, "code", None) == "NoSuchKey":
+                if prev is not None and prev.source != "default":
+                    log.warning("Spec object s3://%s/%s removed; using default spec", self.minio_bucket, key)
+                return self._fetch_local(product_code, None)
+            self.errors += 1
+            if prev is not None:
+                log.warning("MinIO revalidate spec %s failed (serving cached): %s", key, e)
+                prev.checked_at = time.monotonic()
+                return prev
+            log.warning("MinIO get spec %s failed: %s. Fallback local.", key, e)
+            return self._fetch_local(product_code, None)
+        if data is None:
+            self.not_modified += 1
+            prev.checked_at = time.monotonic()
+            return prev
+        try:
+            spec = json.loads(data.decode("utf-8"))
+        except Exception as e:
+            self.errors += 1
+            log.warning("Spec parse failed for s3://%s/%s: %s", self.minio_bucket, key, e)
+            if prev is not None:
+                prev.checked_at = time.monotonic()
+                return prev
+            return _Entry(DEFAULT_SPEC)
+        if prev is not None:
+            self.reloads += 1
+            log.info("Spec reloaded product=%s etag=%s", product_code, etag)
+        return _Entry(spec, etag=etag, source="minio")
+
+    # ---------------- background refresh ----------------
+    def warm(self) -> int:
+        """Nạp trước mọi spec có sẵn để message đầu tiên của mỗi product không phải chờ I/O."""
+        try:
+            if self.mode == "minio":
+                names = [Path(k).stem for k in self.minio.list_keys(self.minio_prefix + "/", bucket=self.minio_bucket)
+                         if k.endswith(".json")]
             else:
-                key = self._minio_key(product_code)
-                try:
+                names = [p.stem for p in self.local_dir.glob("*.json")]
+        except Exception as e:
+            log.warning("Spec warm-up listing failed: %s", e)
+            return 0
+        for name in names:
+            self.load_spec(name)
+        return len(names)
+
+    def refresh(self) -> None:
+        """1 vòng làm mới (thread nền gọi; cũng dùng được trực tiếp)."""
+        now = time.monotonic()
+        for product_code, e in list(self._cache.items()):
+            if self.mode == "minio" and (now - e.checked_at) < self.ttl:
+                continue
+            try:
+                ne = self._fetch(product_code, e)
+            except Exception as ex:
+                self.errors += 1
+                log.warning("Spec refresh failed product=%s: %s", product_code, ex)
+                continue
+            if ne is not e:
+                self._cache[product_code] = ne
 
-                    log.warning("Spec mode=minio yêu cầu MinIOClient.get_object (chưa implement). Fallback local.")
-                except Exception as e:
-                    log.warning("MinIO get spec failed: %s", e)
+    def _run(self) -> None:
+        interval = self.watch_interval_s if self.mode == "local" else min(max(1.0, self.ttl / 4.0), 30.0)
+        while not self._stop.wait(interval):
+            self.refresh()
 
-        if spec is None:
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="aoi-spec-refresh", daemon=True)
+        self._thread.start()
 
-            spec = {
-                "banned_classes": [],
-                "max_defects": 999999,
-                "max_by_class": {},
-                "thresholds": {},
-                "severity_by_class": {}
-            }
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
 
-        self._cache[product_code] = (time.time(), spec)
-        return spec
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "specs": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+        }
 
     @classmethod
     def from_yaml(cls, path: str | Path, minio_client: Optional[MinIOClient] = None):
@@ -95,6 +254,17 @@ class SpecRepository:
         if mode == "minio":
             mcfg = cfg.get("minio", {}) or {}
             bucket = mcfg.get("bucket", "aoi")
+            if minio_client is None:
+                try:
+                    from aoi.io.minio_client import MinIOClient as _MinIO
+                except ImportError:  # chạy dạng src.apps.*
+                    from src.aoi.io.minio_client import MinIOClient as _MinIO
+                minio_client = _MinIO(
+                    endpoint=os.getenv("MINIO_ENDPOINT", str(mcfg.get("endpoint", "127.0.0.1:9000"))),
+                    access_key=os.getenv("MINIO_ACCESS_KEY", str(mcfg.get("access_key", ""))),
+                    secret_key=os.getenv("MINIO_SECRET_KEY", str(mcfg.get("secret_key", ""))),
+                    secure=bool(mcfg.get("secure", False)),
+                )
         return cls(
             mode=mode,
             local_dir=local_dir,
@@ -102,4 +272,6 @@ class SpecRepository:
             minio_bucket=bucket,
             minio_prefix=sc.get("prefix", "specs"),
             ttl_seconds=int(sc.get("ttl_seconds", 600)),
+            watch_interval_s=float(sc.get("watch_interval_s", 1.0)),
+            background=bool(sc.get("background_refresh", True)),
         )
@@ -0,0 +1,104 @@
+from __future__ import annotations
+from typing import Dict, List, Optional
+import multiprocessing as mp
+import os
+import signal
+import time
+import logging
+
+log = logging.getLogger("aoi.stream_processor.supervisor")
+
+_STOP = False
+
+
+def _sig_handler(signum, frame):
+    global _STOP
+    log.info("Received signal %s → stopping workers...", signum)
+    _STOP = True
+
+
+def _worker_entry(worker_id: int) -> None:
+    os.environ["AOI_WORKER_ID"] = str(worker_id)
+    from src.apps.stream_processor.main import main
+    raise SystemExit(main())
+
+
+class Supervisor:
+    """Chạy N worker stream processor, mỗi worker 1 process (spawn) trong cùng consumer group.
+
+    Kafka chia partition cho các worker; mỗi worker có consumer, ClickHouseWriter và spec cache riêng,
+    nên 1 insert chậm chỉ chặn partition của worker đó. Worker chết bất thường được khởi động lại
+    với backoff tăng dần; worker đã chạy ổn định quá ``stable_s`` (mặc định = max_backoff_s) thì
+    bộ đếm restart về 0, lần chết sau lại bắt đầu từ backoff ngắn.
+    """
+
+    def __init__(self, workers: int, max_backoff_s: float = 30.0, stop_timeout_s: float = 30.0,
+                 stable_s: Optional[float] = None):
+        self.workers = max(1, int(workers))
+        self.max_backoff_s = float(max_backoff_s)
+        self.stable_s = float(stable_s if stable_s is not None else self.max_backoff_s)
+        self.stop_timeout_s = float(stop_timeout_s)
+        self._ctx = mp.get_context("spawn")
+        self._procs: Dict[int, mp.process.BaseProcess] = {}
+        self._restarts: Dict[int, int] = {}
+        self._next_start: Dict[int, float] = {}
+        self._started_at: Dict[int, float] = {}
+
+    def _start(self, wid: int) -> None:
+        p = self._ctx.Process(target=_worker_entry, args=(wid,), name=f"worker-{wid}", daemon=False)
+        p.start()
+        self._procs[wid] = p
+        self._started_at[wid] = time.monotonic()
+        log.info("worker %d started pid=%s", wid, p.pid)
+
+    def run(self) -> int:
+        for wid in range(self.workers):
+            self._start(wid)
+
+        while not _STOP:
+            time.sleep(0.5)
+            now = time.monotonic()
+            for wid in range(self.workers):
+                p = self._procs.get(wid)
+                if _STOP or (p is not None and p.is_alive()):
+                    continue
+                if p is not None:
+                    if now - self._started_at.get(wid, now) > self.stable_s:
+                        self._restarts[wid] = 0  # đã chạy ổn định: lỗi lần này không cộng dồn từ các lần cũ
+                    n = self._restarts.get(wid, 0) + 1
+                    self._restarts[wid] = n
+                    delay = min(self.max_backoff_s, 2.0 ** min(n, 10))
+                    log.error("worker %d exited code=%s; restart #%d in %.0fs", wid, p.exitcode, n, delay)
+                    self._procs.pop(wid)
+                    self._next_start[wid] = now + delay
+                if now >= self._next_start.get(wid, 0.0):
+                    self._start(wid)
+
+        self.stop()
+        return 0
+
+    def stop(self) -> None:
+        alive: List[mp.process.BaseProcess] = [p for p in self._procs.values() if p.is_alive()]
+        for p in alive:
+            try:
+                os.kill(p.pid, signal.SIGTERM)
+            except OSError:
+                pass
+        # worker flush ClickHouse + commit offset trước khi thoát
+        deadline = time.monotonic() + self.stop_timeout_s
+        for p in alive:
+            p.join(max(0.0, deadline - time.monotonic()))
+        for p in alive:
+            if p.is_alive():
+                log.warning("worker %s did not stop in %.0fs; killing", p.name, self.stop_timeout_s)
+                p.kill()
+                p.join(5.0)
+        log.info("all workers stopped")
+
+
+def run_supervisor(workers: int, stop_timeout_s: Optional[float] = None) -> int:
+    signal.signal(signal.SIGINT, _sig_handler)
+    signal.signal(signal.SIGTERM, _sig_handler)
+    log.info("Stream Processor supervisor: %d worker(s)", workers)
+    sup = Supervisor(workers, stop_timeout_s=float(stop_timeout_s or os.getenv("AOI_WORKER_STOP_TIMEOUT_S", "30")))
+    return sup.run()
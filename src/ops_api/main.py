@@ -3,16 +3,22 @@ import os
 import json
 from datetime import timedelta
 
-import requests
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from minio import Minio
 
+try:
+    from pipelines.clickhouse_http import ClickHouseHTTP, ClickHouseHTTPError
+except ImportError:  # chạy dạng src.ops_api.main
+    from src.pipelines.clickhouse_http import ClickHouseHTTP, ClickHouseHTTPError
+
 CLICKHOUSE_URL = os.getenv("CLICKHOUSE_URL", "http://127.0.0.1:8123")
 CLICKHOUSE_USER = os.getenv("CLICKHOUSE_USER", "default")
 CLICKHOUSE_PASSWORD = os.getenv("CLICKHOUSE_PASSWORD", "")
 
+CLICKHOUSE_COMPRESSION = os.getenv("CLICKHOUSE_COMPRESSION", "gzip")
+
 MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "http://127.0.0.1:9002")
 MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
@@ -30,6 +36,16 @@ minio_client = Minio(
     secure=_minio_secure,
 )
 
+# 1 client dùng chung cho mọi request: giữ kết nối keep-alive, response được nén
+ch = ClickHouseHTTP(
+    CLICKHOUSE_URL,
+    user=CLICKHOUSE_USER,
+    password=CLICKHOUSE_PASSWORD,
+    database="aoi",
+    compression=CLICKHOUSE_COMPRESSION,
+    pool_maxsize=int(os.getenv("CLICKHOUSE_POOL_MAXSIZE", "8")),
+)
+
 app = FastAPI(title="AOI Ops API")
 
 app.add_middleware(
@@ -43,19 +59,12 @@ app.add_middleware(
 
 def ch_select(sql: str):
 
-    url = f"{CLICKHOUSE_URL}/"
-    params = {"database": "aoi"}
-    auth = (CLICKHOUSE_USER, CLICKHOUSE_PASSWORD) if CLICKHOUSE_PASSWORD else None
-
-    r = requests.post(url, params=params, data=sql + " FORMAT JSONEachRow", auth=auth)
-    if r.status_code == 401:
-        raise HTTPException(status_code=500, detail="ClickHouse unauthorized")
-    r.raise_for_status()
-
-    rows = []
-    for line in r.text.strip().splitlines():
-        rows.append(json.loads(line))
-    return rows
+    try:
+        return ch.select_json(sql)
+    except ClickHouseHTTPError as e:
+        if e.status_code == 401:
+            raise HTTPException(status_code=500, detail="ClickHouse unauthorized")
+        raise
 
 
 def ch_exists_table(table_name: str) -> bool:
@@ -105,6 +114,7 @@ def healthz():
         "status": "ok" if (ch_ok and minio_ok) else "degraded",
         "clickhouse": "ok" if ch_ok else "down",
         "minio": "ok" if minio_ok else "down",
+        "clickhouse_http": ch.stats(),
     }
 
 
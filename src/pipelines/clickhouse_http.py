@@ -0,0 +1,190 @@
+# src/pipelines/clickhouse_http.py
+from __future__ import annotations
+from typing import Any, Dict, List, Optional
+import gzip
+import json
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import zstandard as zstd
+except Exception:  # optional
+    zstd = None
+
+log = logging.getLogger("aoi.clickhouse_http")
+
+_DEFAULT_LEVEL = {"gzip": 1, "zstd": 3}
+
+
+class ClickHouseHTTPError(RuntimeError):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ClickHouseHTTP:
+    """Client HTTP ClickHouse dùng chung: keep-alive (pool theo Session), nén body gửi lên và nhận về.
+
+    - Body >= ``compress_min_bytes`` được nén ``gzip``/``zstd`` và gửi kèm ``Content-Encoding``
+      (ClickHouse tự giải nén); ``compression="none"`` tắt.
+    - ``accept_compressed``: bật ``enable_http_compression`` để ClickHouse nén response; requests/urllib3 tự giải nén.
+    - ``stats()``: số request, số kết nối TCP mở mới (còn lại là tái dùng), byte thô / byte trên dây.
+    Thread-safe: nhiều thread dùng chung 1 instance (pool tối đa ``pool_maxsize`` kết nối).
+    """
+
+    def __init__(
+        self,
+        url: str,
+        user: str = "default",
+        password: str = "",
+        database: str = "aoi",
+        timeout: float = 15.0,
+        compression: str = "gzip",
+        compress_level: Optional[int] = None,
+        compress_min_bytes: int = 1024,
+        accept_compressed: bool = True,
+        pool_maxsize: int = 4,
+    ):
+        self.url = url.rstrip("/") + "/"
+        self.database = database
+        self.timeout = float(timeout)
+        self.auth = (user, password) if (user or password) else None
+
+        compression = (compression or "none").lower()
+        if compression == "zstd" and zstd is None:
+            log.warning("zstandard not installed; ClickHouse request compression falls back to gzip")
+            compression = "gzip"
+        if compression not in ("gzip", "zstd", "none"):
+            raise ValueError(f"compression must be gzip|zstd|none, got {compression!r}")
+        self.compression = compression
+        self.compress_level = int(compress_level if compress_level is not None else _DEFAULT_LEVEL.get(compression, 0))
+        self.compress_min_bytes = int(compress_min_bytes)
+        self.accept_compressed = bool(accept_compressed)
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, int(pool_maxsize)), max_retries=0)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers["Accept-Encoding"] = "zstd, gzip" if (accept_compressed and zstd is not None) \
+            else ("gzip" if accept_compressed else "identity")
+        self._adapter = adapter
+        self._tls = threading.local()
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.bytes_out_raw = 0
+        self.bytes_out_wire = 0
+        self.bytes_in_raw = 0
+        self.bytes_in_wire = 0
+
+    # ---------------- compression ----------------
+    def _encode(self, body: bytes) -> tuple:
+        if self.compression == "none" or len(body) < self.compress_min_bytes:
+            return body, None
+        if self.compression == "zstd":
+            c = getattr(self._tls, "zc", None)
+            if c is None:  # ZstdCompressor không dùng chung được giữa các thread
+                c = self._tls.zc = zstd.ZstdCompressor(level=self.compress_level)
+            return c.compress(body), "zstd"
+        return gzip.compress(body, compresslevel=self.compress_level), "gzip"
+
+    # ---------------- requests ----------------
+    def _post(self, params: Dict[str, Any], body: bytes, stream: bool = False,
+              timeout: Any = None) -> requests.Response:
+        data, enc = self._encode(body)
+        headers = {"Content-Encoding": enc} if enc else None
+        p = {"database": self.database}
+        if self.accept_compressed:
+            p["enable_http_compression"] = "1"
+        p.update(params)
+        try:
+            r = self._session.post(self.url, params=p, data=data, headers=headers, auth=self.auth,
+                                   timeout=timeout or self.timeout, stream=stream)
+        except Exception:
+            with self._lock:
+                self.requests += 1
+                self.errors += 1
+            raise
+        with self._lock:
+            self.requests += 1
+            self.bytes_out_raw += len(body)
+            self.bytes_out_wire += len(data)
+            if r.status_code != 200:
+                self.errors += 1
+        if r.status_code != 200:
+            text = r.text
+            r.close()
+            raise ClickHouseHTTPError(f"ClickHouse HTTP {r.status_code}: {text[:1000]}", r.status_code)
+        if not stream:
+            self._count_in(r)
+        return r
+
+    def _count_in(self, r: requests.Response) -> None:
+        raw = len(r.content)
+        try:
+            wire = int(r.raw.tell())  # byte đọc từ socket (trước giải nén)
+        except Exception:
+            wire = raw
+        with self._lock:
+            self.bytes_in_raw += raw
+            self.bytes_in_wire += wire or raw
+
+    def insert(self, sql: str, body: bytes, settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """``INSERT ... FORMAT X`` với dữ liệu trong body (nén nếu đủ lớn). Trả về header X-ClickHouse-Summary."""
+        params = {"query": sql}
+        if settings:
+            params.update({k: str(v) for k, v in settings.items()})
+        r = self._post(params, body)
+        try:
+            return json.loads(r.headers.get("X-ClickHouse-Summary") or "{}")
+        except ValueError:
+            return {}
+
+    def query(self, sql: str, params: Optional[Dict[str, Any]] = None, settings: Optional[Dict[str, Any]] = None,
+              stream: bool = False, timeout: Any = None) -> requests.Response:
+        """Chạy SQL (trong body). ``params`` -> tham số ``{name:Type}`` (``param_<name>``).
+        ``stream=True``: trả Response chưa đọc, caller tự ``iter_lines()`` và đóng."""
+        p: Dict[str, Any] = {f"param_{k}": str(v) for k, v in (params or {}).items()}
+        if settings:
+            p.update({k: str(v) for k, v in settings.items()})
+        return self._post(p, sql.encode("utf-8"), stream=stream, timeout=timeout)
+
+    def select_json(self, sql: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        r = self.query(sql.rstrip().rstrip(";") + " FORMAT JSONEachRow", params=params)
+        return [json.loads(line) for line in r.text.splitlines() if line.strip()]
+
+    def ping(self, timeout: float = 5.0) -> bool:
+        try:
+            r = self.query("SELECT 1", timeout=min(self.timeout, timeout))
+            return r.text.strip() == "1"
+        except Exception as e:
+            log.warning("ClickHouse ping failed: %s", e)
+            return False
+
+    # ---------------- metrics ----------------
+    def stats(self) -> Dict[str, Any]:
+        opened = 0
+        try:
+            for pool in list(self._adapter.poolmanager.pools._container.values()):
+                opened += int(getattr(pool, "num_connections", 0))
+        except Exception:
+            pass
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "connections_opened": opened,
+                "connection_reuse": round(1.0 - opened / self.requests, 4) if self.requests else None,
+                "compression": self.compression,
+                "bytes_out_raw": self.bytes_out_raw,
+                "bytes_out_wire": self.bytes_out_wire,
+                "bytes_in_raw": self.bytes_in_raw,
+                "bytes_in_wire": self.bytes_in_wire,
+            }
+
+    def close(self) -> None:
+        self._session.close()
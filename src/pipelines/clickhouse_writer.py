@@ -1,10 +1,19 @@
 # src/pipelines/clickhouse_writer.py
 from __future__ import annotations
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
 from pathlib import Path
-import logging, time, json, threading, os
+from collections import deque
+import logging, time, json, threading, os, random, hashlib
+from datetime import datetime
 from urllib.parse import urlparse
-import requests
+
+from .clickhouse_http import ClickHouseHTTP, ClickHouseHTTPError
+from .rowbinary import RowBinaryEncoder
+
+try:
+    from aoi.io.segments import SegmentLog
+except ImportError:  # chạy dạng src.apps.*
+    from src.aoi.io.segments import SegmentLog
 
 try:
     import yaml
@@ -29,6 +38,30 @@ def _safe_read_yaml(path: str | Path) -> Dict[str, Any]:
     return data
 
 
+def _retryable(e: Exception) -> bool:
+    """Lỗi mạng/timeout/5xx/408/429 -> thử lại; 4xx khác (sai dữ liệu, quyền) thì không."""
+    if isinstance(e, ClickHouseHTTPError):
+        return e.status_code >= 500 or e.status_code in (408, 429)
+    return True
+
+
+def _partition_fn(name: str, tz: str, cols: List[str]) -> Callable[[Dict[str, Any]], Any]:
+    """Hàm lấy 1 thành phần khoá partition từ dòng: "day"/"month" (theo ts_ms, múi giờ ``tz``
+    giống server ClickHouse) hoặc tên cột bất kỳ trong _COLS."""
+    if name in ("day", "month"):
+        if tz.upper() == "UTC":
+            if name == "day":
+                return lambda r: r["ts_ms"] // 86_400_000
+            return lambda r: time.gmtime(r["ts_ms"] // 1000)[:2]
+        from zoneinfo import ZoneInfo
+        z = ZoneInfo(tz)
+        fmt = "%Y%m%d" if name == "day" else "%Y%m"
+        return lambda r: datetime.fromtimestamp(r["ts_ms"] / 1000.0, z).strftime(fmt)
+    if name in cols:
+        return lambda r: r.get(name)
+    raise ValueError(f"unsupported partition_by component {name!r} (day, month or a column name)")
+
+
 def _build_http_url(cfg_clickhouse: Dict[str, Any]) -> str:
 
     env_url = os.getenv("CLICKHOUSE_URL") or os.getenv("CLICKHOUSE_HTTP_URL")
@@ -65,8 +98,19 @@ class ClickHouseWriter:
         "aql_mini_decision", "aql_final_decision", "fail_reason",
         "defect_count", "defects_json",
         "image_overlay_url", "image_raw_url",
+        "spec_version",
     ]
 
+    # kiểu cột theo infra/sql/init_clickhouse.sql (dùng cho FORMAT RowBinary)
+    _COL_TYPES = {
+        "ts_ms": "UInt64", "event_id": "String", "product_code": "String", "station_id": "String",
+        "board_serial": "Nullable(String)", "model_family": "String", "model_version": "String",
+        "latency_ms": "UInt32", "aql_mini_decision": "String", "aql_final_decision": "String",
+        "fail_reason": "Nullable(String)", "defect_count": "UInt16", "defects_json": "String",
+        "image_overlay_url": "String", "image_raw_url": "String", "spec_version": "String",
+    }
+    INSERT_FORMATS = ("JSONEachRow", "RowBinary")
+
     def __init__(
         self,
         http_url: str,
@@ -77,6 +121,26 @@ class ClickHouseWriter:
         bulk_max_rows: int = 0,
         bulk_max_seconds: float = 0.0,
         timeout: float = 15.0,
+        on_flush: Optional[Callable[[List[Any]], None]] = None,
+        background: bool = False,
+        max_pending_rows: int = 0,
+        backpressure: str = "block",
+        compression: str = "gzip",
+        http: Optional[ClickHouseHTTP] = None,
+        insert_format: str = "JSONEachRow",
+        retry_max_attempts: int = 4,
+        retry_base_s: float = 0.2,
+        retry_max_s: float = 5.0,
+        spill: Optional[SegmentLog] = None,
+        replay_interval_s: float = 5.0,
+        async_insert: bool = False,
+        wait_for_async_insert: bool = True,
+        async_insert_busy_timeout_ms: int = 0,
+        dedup_token: bool = True,
+        partition_by: Optional[List[str]] = None,
+        partition_tz: str = "UTC",
+        target_parts_per_min: float = 0.0,
+        adaptive_max_scale: float = 8.0,
     ):
         self.http_url = http_url.rstrip("/") if http_url else DEFAULT_HTTP_URL
         self.database = database
@@ -85,16 +149,117 @@ class ClickHouseWriter:
         self.table = table
         self.bulk_max_rows = int(bulk_max_rows or 0)
         self.bulk_max_seconds = float(bulk_max_seconds or 0.0)
+        # ---- batch theo partition + ngưỡng bulk thích nghi để giữ số part tạo ra / phút dưới mục tiêu
+        # bulk_max_rows / bulk_max_seconds là ngưỡng đang áp dụng = ngưỡng gốc * _scale
+        self._base_rows = self.bulk_max_rows
+        self._base_secs = self.bulk_max_seconds
+        self.partition_by = list(partition_by or [])
+        self._partition_fns = [_partition_fn(n, partition_tz, self._COLS) for n in self.partition_by]
+        self.target_parts_per_min = float(target_parts_per_min or 0.0)
+        self.adaptive_max_scale = max(1.0, float(adaptive_max_scale))
+        self._scale = 1.0
+        self._last_adapt = time.monotonic()
+        self._parts_lock = threading.Lock()
+        self._part_times: deque = deque()
+        self.parts_created = 0
         self.timeout = float(timeout or 15.0)
 
         u = urlparse(self.http_url)
         if not u.scheme or not u.scheme.startswith("http"):
             raise ValueError(f"Invalid clickhouse http_url: {self.http_url}")
+        # kết nối keep-alive + nén body insert; có thể truyền client dùng chung
+        self.http = http or ClickHouseHTTP(self.http_url, user=user, password=password, database=database,
+                                           timeout=self.timeout, compression=compression)
+        if insert_format not in self.INSERT_FORMATS:
+            raise ValueError(f"insert_format must be one of {self.INSERT_FORMATS}, got {insert_format!r}")
+        self.insert_format = insert_format
+        self._rowbinary = RowBinaryEncoder([(c, self._COL_TYPES[c]) for c in self._COLS]) \
+            if insert_format == "RowBinary" else None
+
+        # ---- settings insert phía server: async_insert gom nhiều insert nhỏ thành 1 part;
+        # insert_deduplication_token theo event_id của batch -> retry của writer và replay spill (gửi lại đúng batch
+        # cũ) không sinh bản trùng. KHÔNG chống trùng khi Kafka giao lại message sau crash: batch mới gom khác
+        # -> token khác (xem _batch_token)
+        self.async_insert = bool(async_insert)
+        self.wait_for_async_insert = bool(wait_for_async_insert)
+        self.dedup_token = bool(dedup_token)
+        self._insert_settings: Dict[str, Any] = {}
+        if self.async_insert:
+            self._insert_settings["async_insert"] = 1
+            self._insert_settings["wait_for_async_insert"] = 1 if self.wait_for_async_insert else 0
+            if async_insert_busy_timeout_ms:
+                self._insert_settings["async_insert_busy_timeout_ms"] = int(async_insert_busy_timeout_ms)
+            if self.dedup_token:
+                self._insert_settings["async_insert_deduplicate"] = 1
+            if self.target_parts_per_min:
+                log.info("async_insert enabled: adaptive batch sizing (target_parts_per_min) is disabled")
+            if not self.wait_for_async_insert:
+                log.warning("async_insert without wait_for_async_insert: offsets are committed before rows "
+                            "are durable in ClickHouse; server-side flush errors are not reported")
+        self.dedup_hits = 0  # insert được ClickHouse bỏ qua vì trùng token (written_rows = 0)
+
+        # ---- retry (exponential backoff + full jitter) rồi spill ra SegmentLog, thread nền replay khi CH sống lại
+        self.retry_max_attempts = max(1, int(retry_max_attempts))
+        self.retry_base_s = float(retry_base_s)
+        self.retry_max_s = float(retry_max_s)
+        self.retries = 0
+        self.retry_exhausted = 0
+        self._spill = spill
+        self.replay_interval_s = float(replay_interval_s)
+        self._ch_available = True
+        self.spilled_batches = 0
+        self.spilled_rows = 0
+        self.spilled_bytes = 0
+        self.replayed_batches = 0
+        self.replayed_rows = 0
+        self.dead_letters = 0
+        self._spill_head_ts_ms: Optional[int] = None
+        self._replay_wake = threading.Event()
+        self._replay_stop = threading.Event()
+        self._replay_thread: Optional[threading.Thread] = None
+        if self._spill is not None:
+            if self._spill.pending():
+                log.info("ClickHouse spill %s: %d batch(es) pending replay", self._spill.dir, self._spill.pending())
+            self._replay_thread = threading.Thread(target=self._replay_run, name="aoi-ck-replay", daemon=True)
+            self._replay_thread.start()
 
         self._buf: List[Dict[str, Any]] = []
+        # token (vd. offset Kafka) của các batch đang nằm trong _buf, theo thứ tự;
+        # chỉ được trả cho on_flush sau khi các dòng trước nó đã insert thành công
+        self._tokens: List[Any] = []
+        # nhóm dòng insert lỗi, giữ nguyên cùng token dedup; gửi lại trước mọi dòng mới để retry
+        # (kể cả khi lần trước thực ra đã ghi xong) có đúng token cũ -> ClickHouse bỏ qua bản trùng
+        self._sealed: List[Tuple[List[Dict[str, Any]], Optional[str]]] = []
+        self._sealed_rows = 0
+        self.on_flush = on_flush
         self._lock = threading.Lock()
         self._last_flush = time.monotonic()
 
+        # ---- chế độ background: thread riêng flush, caller chỉ append vào buffer
+        # double buffer: thread lấy _buf ra (inflight) rồi insert ngoài lock, caller ghi tiếp vào _buf mới
+        self.background = bool(background)
+        self.max_pending_rows = int(max_pending_rows or 0)
+        if backpressure not in ("block", "drop"):
+            raise ValueError(f"backpressure must be 'block' or 'drop', got {backpressure!r}")
+        self.backpressure = backpressure
+        self._cond = threading.Condition(self._lock)
+        self._io_lock = threading.Lock()      # 1 insert tại 1 thời điểm -> token giữ đúng thứ tự
+        self._buf_since = 0.0                 # lúc dòng đầu tiên vào buffer rỗng (hạn bulk_max_seconds)
+        self._inflight = 0
+        self._flush_requested = False
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+        # ---- metrics
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flush_errors = 0
+        self.dropped_rows = 0
+        self.blocked_s = 0.0
+        self._flush_ms: deque = deque(maxlen=256)
+        if self.background:
+            self.start()
+
 
     def add(self, row: Dict[str, Any]) -> None:
 
@@ -112,75 +277,522 @@ class ClickHouseWriter:
     def insert_inspection(self, record: Dict[str, Any]) -> None:
         self._add_or_buffer(record)
 
-    def flush(self) -> int:
-
+    def insert_many(self, records: List[Dict[str, Any]], token: Any = None) -> int:
+        """Validate + buffer cả batch với 1 lần lấy lock; flush nếu vượt ngưỡng bulk.
+
+        ``token`` (vd. offset Kafka của batch) được trả lại qua ``on_flush`` khi mọi dòng
+        tới batch này đã insert xong; batch rỗng vẫn có thể mang token.
+        Không bật bulk thì batch được insert ngay trong 1 request. Trả về số dòng nhận.
+        """
+        recs = []
+        for r in records:
+            try:
+                recs.append(self._validate_and_cast(r))
+            except (ValueError, TypeError) as e:
+                # dòng hỏng không thể insert được -> bỏ, không chặn cả batch / offset
+                log.error("invalid row dropped (event_id=%s): %s", r.get("event_id"), e)
+        if not recs and token is None:
+            return 0
+        if self.background:
+            return self._enqueue(recs, token)
+        bulk = self.bulk_max_rows > 0 or self.bulk_max_seconds > 0
+
+        to_flush = None
         with self._lock:
-            if not self._buf:
-                return 0
-            rows = self._buf
-            self._buf = []
-            self._last_flush = time.monotonic()
+            self._buf.extend(recs)
+            if token is not None:
+                self._tokens.append(token)
+            now = time.monotonic()
+            if not bulk or (self.bulk_max_rows and len(self._buf) >= self.bulk_max_rows) or \
+                    (self.bulk_max_seconds and (now - self._last_flush) >= self.bulk_max_seconds):
+                to_flush = self._take_locked(now)
+        if to_flush:
+            self._flush_rows(*to_flush)
+        return len(recs)
 
-        self._insert_many_http(rows)
+    def flush(self) -> int:
+        """Insert ngay mọi dòng đang chờ (đồng bộ, trên thread gọi). Lỗi -> raise, dòng vẫn giữ để thử lại."""
+        with self._io_lock:
+            with self._lock:
+                if not self._buf and not self._tokens and not self._sealed:
+                    return 0
+                rows, tokens, sealed = self._take_locked(time.monotonic())
+                self._inflight = len(rows) + sum(len(g) for g, _ in sealed)
+            try:
+                self._flush_rows(rows, tokens, sealed)
+            finally:
+                with self._cond:
+                    self._inflight = 0
+                    self._cond.notify_all()
         return len(rows)
 
-    def healthy(self) -> bool:
-
+    def _take_locked(self, now: float):
+        rows, tokens, sealed = self._buf, self._tokens, self._sealed
+        self._buf, self._tokens, self._sealed = [], [], []
+        self._sealed_rows = 0
+        self._last_flush = now
+        self._flush_requested = False
+        return rows, tokens, sealed
+
+    def _queued_locked(self) -> int:
+        return len(self._buf) + self._sealed_rows
+
+    def _flush_rows(self, rows: List[Dict[str, Any]], tokens: List[Any],
+                    sealed: Optional[List[Tuple[List[Dict[str, Any]], Optional[str]]]] = None) -> None:
+        """Insert (có retry) rồi báo token cho on_flush.
+
+        Hết lượt retry: có spill -> ghi batch đã encode xuống đĩa (fsync) và coi như đã flush; ClickHouse đang
+        không sẵn sàng thì spill luôn, không chờ retry. Không có spill -> các nhóm chưa insert được giữ lại
+        nguyên (dòng, token dedup) trong ``_sealed`` và gửi lại trước dòng mới ở lần flush sau; tokens trả về
+        đầu buffer (giữ thứ tự, không token nào được báo khi dòng trước nó chưa được lưu).
+        Lỗi không retry được (4xx dữ liệu: parse, sai kiểu) -> nhóm vào dead-letter, không chặn các nhóm sau.
+        """
+        t0 = time.perf_counter()
+        # nhóm lỗi từ lần trước đi trước, với token cũ; 1 insert / partition -> mỗi insert tạo 1 part
+        units = list(sealed or []) + [(g, self._batch_token(g)) for g in self._group_rows(rows)]
+        done = dead = 0
+        try:
+            for g, tok in units:
+                body = self._encode_rows(g)
+                try:
+                    self._store(body, len(g), tok)
+                except Exception as e:
+                    if _retryable(e):
+                        raise
+                    self._dead_letter(self._spill_record(body, len(g), tok), e, g[0].get("event_id"))
+                    dead += len(g)
+                done += 1
+        except Exception:
+            self.flush_errors += 1
+            if self.on_flush is not None or self.background:
+                # nhóm đã insert không đưa lại (tránh trùng); token chờ tới khi mọi nhóm còn lại thành công
+                rest = units[done:]
+                with self._lock:
+                    if not self._buf and not self._sealed:
+                        self._buf_since = time.monotonic()
+                    self._sealed[:0] = rest
+                    self._sealed_rows += sum(len(g) for g, _ in rest)
+                    self._tokens[:0] = tokens
+            raise
+        self._flush_ms.append((time.perf_counter() - t0) * 1000.0)
+        self.flushes += 1
+        self.flushed_rows += sum(len(g) for g, _ in units) - dead
+        if tokens and self.on_flush is not None:
+            try:
+                self.on_flush(tokens)
+            except Exception as e:
+                log.error("on_flush callback failed: %s", e)
+        self._adapt()
+
+    def _group_rows(self, rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        if not rows:
+            return []
+        fns = self._partition_fns
+        if not fns:
+            return [rows]
+        groups: Dict[Any, List[Dict[str, Any]]] = {}
+        if len(fns) == 1:
+            f = fns[0]
+            for r in rows:
+                groups.setdefault(f(r), []).append(r)
+        else:
+            for r in rows:
+                groups.setdefault(tuple(f(r) for f in fns), []).append(r)
+        return list(groups.values())
+
+    # ---------------- part rate / adaptive batch ----------------
+    def _note_part(self) -> None:
+        # async_insert: server gom nhiều insert vào 1 part, số insert không phản ánh số part -> không đếm
+        if self.async_insert:
+            return
+        with self._parts_lock:
+            self._part_times.append(time.monotonic())
+            self.parts_created += 1
+
+    def parts_per_min(self) -> Optional[int]:
+        """Số part tạo ra trong 60s gần nhất, ước lượng phía client: mỗi insert đồng bộ thành công (có cả replay)
+        = 1 part mới. Với async_insert không ước lượng được (None); xem ``system.part_log`` phía server."""
+        if self.async_insert:
+            return None
+        cutoff = time.monotonic() - 60.0
+        with self._parts_lock:
+            q = self._part_times
+            while q and q[0] < cutoff:
+                q.popleft()
+            return len(q)
+
+    def _adapt(self) -> None:
+        """Nhiều part hơn mục tiêu -> tăng ngưỡng bulk (x1.5, tối đa adaptive_max_scale); ít hẳn -> giảm dần về gốc.
+        Tối đa 1 lần / 15s để cửa sổ 60s kịp phản ánh thay đổi. Tắt khi async_insert (server tự gom part)."""
+        if not self.target_parts_per_min or self.async_insert or not (self._base_rows or self._base_secs):
+            return
+        now = time.monotonic()
+        if now - self._last_adapt < 15.0:
+            return
+        self._last_adapt = now
+        rate = self.parts_per_min()
+        scale = self._scale
+        if rate > self.target_parts_per_min:
+            scale = min(self.adaptive_max_scale, scale * 1.5)
+        elif rate < self.target_parts_per_min * 0.5:
+            scale = max(1.0, scale / 1.5)
+        if scale == self._scale:
+            return
+        self._scale = scale
+        self.bulk_max_rows = int(self._base_rows * scale)
+        self.bulk_max_seconds = self._base_secs * scale
+        log.info("adaptive batch: parts/min=%d target=%.0f -> scale=%.2f (max_rows=%d max_seconds=%.1f)",
+                 rate, self.target_parts_per_min, scale, self.bulk_max_rows, self.bulk_max_seconds)
+
+    # ---------------- retry / spill / replay ----------------
+    def _insert_sql(self, fmt: str, cols: List[str]) -> str:
+        return f"INSERT INTO {self.database}.{self.table} ({', '.join(cols)}) FORMAT {fmt}"
+
+    def _batch_token(self, rows: List[Dict[str, Any]]) -> Optional[str]:
+        """Token dedup = hash các event_id (đã sort) của batch: cùng tập dòng -> cùng token, không phụ thuộc thứ tự.
+
+        Chỉ idempotent khi gửi lại nguyên batch (retry, ``_sealed``, replay spill). Message Kafka giao lại sau
+        crash được consume/gom batch theo cách khác nên token khác -> dòng trùng theo event_id vẫn có thể vào bảng.
+        """
+        if not self.dedup_token:
+            return None
+        h = hashlib.sha1(f"{self.database}.{self.table}".encode("utf-8"))
+        for eid in sorted(r["event_id"] for r in rows):
+            h.update(b"\x00")
+            h.update(eid.encode("utf-8"))
+        return h.hexdigest()
+
+    def _settings(self, token: Optional[str]) -> Optional[Dict[str, Any]]:
+        if token is None:
+            return self._insert_settings or None
+        return {**self._insert_settings, "insert_deduplication_token": token}
+
+    def _store(self, body: bytes, nrows: int, token: Optional[str] = None) -> None:
+        """Insert có retry; có spill thì lỗi retry được cuối cùng (hoặc CH đang down) -> ghi xuống đĩa thay vì raise.
+        Lỗi không retry được luôn raise (spill chỉ dời lỗi sang lúc replay)."""
+        if self._spill is not None and not self._ch_available:
+            if self._spill_batch(body, nrows, token=token):
+                return
+            raise RuntimeError("ClickHouse unavailable and spill write failed")
         try:
-            params = {"query": "SELECT 1", "database": self.database}
-            auth = (self.user, self.password) if (self.user or self.password) else None
-            r = requests.get(self.http_url, params=params, auth=auth, timeout=min(self.timeout, 5.0))
-            return r.status_code == 200 and r.text.strip() == "1"
+            self._post_with_retry(self._insert_sql(self.insert_format, self._COLS), body, self._settings(token))
         except Exception as e:
-            log.warning("ClickHouse healthy() failed: %s", e)
+            if self._spill is None or not _retryable(e) or not self._spill_batch(body, nrows, e, token=token):
+                raise
+
+    def _post_with_retry(self, sql: str, body: bytes, settings: Optional[Dict[str, Any]] = None) -> None:
+        attempt = 0
+        while True:
+            try:
+                self._count_dedup(self.http.insert(sql, body, settings=settings), settings)
+                self._note_part()
+                return
+            except Exception as e:
+                attempt += 1
+                if attempt >= self.retry_max_attempts or not _retryable(e):
+                    self.retry_exhausted += 1
+                    raise
+                self.retries += 1
+                delay = random.uniform(0.0, min(self.retry_max_s, self.retry_base_s * (2 ** (attempt - 1))))
+                log.warning("ClickHouse insert failed (attempt %d/%d, retry in %.2fs): %s",
+                            attempt, self.retry_max_attempts, delay, e)
+                time.sleep(delay)
+
+    def _count_dedup(self, summary: Dict[str, Any], settings: Optional[Dict[str, Any]]) -> None:
+        # async_insert không báo written_rows đáng tin cậy
+        if settings and "insert_deduplication_token" in settings and not self.async_insert \
+                and str(summary.get("written_rows", "")) == "0":
+            self.dedup_hits += 1
+
+    def _spill_batch(self, body: bytes, nrows: int, err: Optional[Exception] = None,
+                     token: Optional[str] = None) -> bool:
+        """Ghi 1 batch (header JSON + body đã encode) vào spill và fsync; False nếu không ghi được."""
+        now_ms = int(time.time() * 1000)
+        rec = self._spill_record(body, nrows, token, now_ms)
+        try:
+            empty = self._spill.pending() == 0
+            self._spill.append(rec)
+            self._spill.sync()  # token (offset Kafka) sẽ được commit ngay sau khi trả về
+        except Exception as e:
+            log.error("ClickHouse spill write failed: %s", e)
             return False
+        if empty:
+            self._spill_head_ts_ms = now_ms
+        # chỉ lỗi mạng/5xx mới coi là ClickHouse down; lỗi dữ liệu 4xx không đẩy các batch sau xuống đĩa
+        if err is None or _retryable(err):
+            if self._ch_available:
+                log.warning("ClickHouse unavailable (%s); spilling batches to %s", err, self._spill.dir)
+            self._ch_available = False
+        self.spilled_batches += 1
+        self.spilled_rows += nrows
+        self.spilled_bytes += len(rec)
+        self._replay_wake.set()
+        return True
+
+    def _spill_record(self, body: bytes, nrows: int, token: Optional[str], ts_ms: Optional[int] = None) -> bytes:
+        hdr = {"fmt": self.insert_format, "cols": self._COLS, "rows": nrows,
+               "ts_ms": ts_ms or int(time.time() * 1000), "token": token}
+        return json.dumps(hdr, separators=(",", ":")).encode("utf-8") + b"\n" + body
+
+    def _dead_letter(self, rec: bytes, err: Exception, first_event_id: Any = None, name: Optional[str] = None) -> None:
+        """Batch ClickHouse từ chối hẳn: đếm, log, ghi ``<spill dir>/dead/`` nếu có spill (không thì chỉ log)."""
+        self.dead_letters += 1
+        where = "not saved (no spill dir)"
+        if self._spill is not None:
+            hdr = json.loads(rec[:rec.index(b"\n")])
+            dead = Path(self._spill.dir) / "dead" / (name or f"{hdr.get('ts_ms', 0)}-{hashlib.sha1(rec).hexdigest()[:16]}.bin")
+            try:
+                dead.parent.mkdir(parents=True, exist_ok=True)
+                dead.write_bytes(rec)
+                where = f"moved to {dead}"
+            except Exception as e:
+                where = f"dead-letter write failed: {e}"
+        log.error("batch rejected by ClickHouse (first event_id=%s): %s; %s", first_event_id, err, where)
+
+    def _replay_run(self) -> None:
+        while not self._replay_stop.is_set():
+            busy = self._ch_available and self._spill.pending() > 0
+            if not busy:
+                self._replay_wake.wait(self.replay_interval_s)
+                self._replay_wake.clear()
+            if self._replay_stop.is_set():
+                return
+            try:
+                self._spill.sync(only_if_dirty=True)
+                if not self._ch_available:
+                    self._ch_available = self.http.ping()
+                    if self._ch_available and self._spill.pending():
+                        log.info("ClickHouse reachable, replaying %d spilled batch(es)", self._spill.pending())
+                if self._ch_available and self._spill.pending() > 0:
+                    self._replay_one()
+            except Exception as e:
+                self._ch_available = False
+                log.error("ClickHouse replay error: %s", e)
+
+    def _replay_one(self) -> None:
+        records, pos = self._spill.read(1)
+        if not records:
+            return
+        rec = records[0]
+        nl = rec.index(b"\n")
+        hdr = json.loads(rec[:nl])
+        self._spill_head_ts_ms = int(hdr.get("ts_ms", 0)) or None
+        try:
+            # cùng token với lần insert gốc: nếu batch thực ra đã vào (timeout sau khi ghi) thì ClickHouse bỏ qua
+            settings = self._settings(hdr.get("token"))
+            self._count_dedup(self.http.insert(self._insert_sql(hdr["fmt"], hdr["cols"]), rec[nl + 1:],
+                                               settings=settings), settings)
+            self._note_part()
+        except ClickHouseHTTPError as e:
+            if _retryable(e):
+                raise
+            # batch không bao giờ insert được (vd. lỗi parse 400): chuyển sang dead-letter để không chặn hàng đợi
+            self._dead_letter(rec, e, name=f"{hdr.get('ts_ms', 0)}-{pos[0]}-{pos[1]}.bin")
+        else:
+            self.replayed_batches += 1
+            self.replayed_rows += int(hdr.get("rows", 0))
+        self._spill.ack(pos, 1)
+        if self._spill.pending() == 0:
+            self._spill_head_ts_ms = None
+            log.info("ClickHouse spill drained (replayed_batches=%d)", self.replayed_batches)
+
+    def spill_stats(self) -> Optional[Dict[str, Any]]:
+        if self._spill is None:
+            return None
+        head = self._spill_head_ts_ms
+        pending = self._spill.pending()
+        return {
+            "backlog": self._spill.backlog(),
+            "ch_available": self._ch_available,
+            "spilled_batches": self.spilled_batches,
+            "spilled_rows": self.spilled_rows,
+            "spilled_bytes": self.spilled_bytes,
+            "replayed_batches": self.replayed_batches,
+            "replayed_rows": self.replayed_rows,
+            "dead_letters": self.dead_letters,
+            # tuổi batch cũ nhất chưa replay
+            "replay_lag_ms": (int(time.time() * 1000) - head) if (pending and head) else 0,
+        }
+
+    # ---------------- background flush ----------------
+    def _enqueue(self, recs: List[Dict[str, Any]], token: Any) -> int:
+        """Đưa batch vào buffer cho thread flush; buffer đầy -> chờ (block) hoặc bỏ dòng (drop)."""
+        with self._cond:
+            limit = self.max_pending_rows
+            if limit and recs and self._queued_locked() + self._inflight + len(recs) > limit:
+                if self.backpressure == "drop":
+                    # token vẫn giữ: offset được commit qua các dòng bị bỏ (chấp nhận mất dữ liệu)
+                    self.dropped_rows += len(recs)
+                    log.warning("writer buffer full (%d rows); dropped %d rows", self._queued_locked() + self._inflight,
+                                len(recs))
+                    recs = []
+                else:
+                    t0 = time.monotonic()
+                    # batch lớn hơn cả giới hạn vẫn được nhận khi buffer rỗng (tránh kẹt vĩnh viễn)
+                    while not self._stopping and (self._buf or self._sealed or self._inflight) and \
+                            self._queued_locked() + self._inflight + len(recs) > limit:
+                        self._flush_requested = True  # không chờ hạn bulk khi đã đầy
+                        self._cond.notify_all()
+                        self._cond.wait(1.0)
+                    self.blocked_s += time.monotonic() - t0
+            if not self._buf and not self._tokens and not self._sealed:
+                self._buf_since = time.monotonic()
+                self._cond.notify_all()
+            self._buf.extend(recs)
+            if token is not None:
+                self._tokens.append(token)
+            if self.bulk_max_rows and len(self._buf) >= self.bulk_max_rows:
+                self._cond.notify_all()
+        return len(recs)
+
+    def _due_locked(self, now: float) -> Optional[float]:
+        """Số giây còn lại tới lúc phải flush (<= 0: flush ngay); None: buffer rỗng."""
+        if not self._buf and not self._tokens and not self._sealed:
+            return None
+        if self._flush_requested or self._stopping or self._sealed:
+            return 0.0
+        if self.bulk_max_rows and len(self._buf) >= self.bulk_max_rows:
+            return 0.0
+        if self.bulk_max_seconds:
+            return self._buf_since + self.bulk_max_seconds - now
+        if not self.bulk_max_rows:
+            return 0.0  # không cấu hình bulk: gom những gì đến trong lúc insert trước
+        return None
+
+    def _run(self) -> None:
+        retry_s = 0.5
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopping:
+                        return
+                    due = self._due_locked(time.monotonic())
+                    if due is not None and due <= 0:
+                        break
+                    self._cond.wait(due if due is not None else 1.0)
+            try:
+                self.flush()
+                retry_s = 0.5
+            except Exception as e:
+                # dòng đã được trả về buffer; caller bị chặn bởi max_pending_rows nếu lỗi kéo dài
+                log.error("ClickHouse background flush failed (retry in %.1fs): %s", retry_s, e)
+                with self._cond:
+                    self._cond.wait_for(lambda: self._stopping, timeout=retry_s)
+                retry_s = min(retry_s * 2, 30.0)
+
+    def request_flush(self) -> None:
+        """Yêu cầu thread nền flush sớm (không chờ)."""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.background = True
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="aoi-ck-flush", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """Dừng thread nền rồi flush nốt phần còn lại trên thread gọi (lỗi -> raise)."""
+        if self._thread is not None:
+            with self._cond:
+                self._stopping = True
+                self._cond.notify_all()
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        finally:
+            if self._replay_thread is not None:
+                self._replay_stop.set()
+                self._replay_wake.set()
+                self._replay_thread.join(timeout=10.0)
+                self._replay_thread = None
+            if self._spill is not None:
+                self._spill.close()
+                if self._spill.pending():
+                    log.warning("ClickHouse spill closed with %d pending batch(es); replayed on next start",
+                                self._spill.pending())
+            self.http.close()
+
+    def pending_rows(self) -> int:
+        """Độ sâu hàng đợi: dòng đang chờ + dòng đang insert."""
+        with self._lock:
+            return self._queued_locked() + self._inflight
+
+    def stats(self) -> Dict[str, Any]:
+        lat = sorted(self._flush_ms)
+        with self._lock:
+            buffered, inflight = self._queued_locked(), self._inflight
+        return {
+            "mode": "background" if self.background else "inline",
+            "buffered_rows": buffered,
+            "inflight_rows": inflight,
+            "pending_rows": buffered + inflight,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "flush_errors": self.flush_errors,
+            "dropped_rows": self.dropped_rows,
+            "blocked_s": round(self.blocked_s, 3),
+            "flush_ms_p50": round(lat[len(lat) // 2], 1) if lat else None,
+            "flush_ms_p95": round(lat[min(len(lat) - 1, int(len(lat) * 0.95))], 1) if lat else None,
+            "flush_ms_max": round(lat[-1], 1) if lat else None,
+            "partition_by": self.partition_by,
+            "parts_created": self.parts_created,
+            "parts_per_min": self.parts_per_min(),
+            "batch_scale": round(self._scale, 2),
+            "bulk_max_rows": self.bulk_max_rows,
+            "bulk_max_seconds": self.bulk_max_seconds,
+            "async_insert": self.async_insert,
+            "dedup_hits": self.dedup_hits,
+            "dead_letters": self.dead_letters,
+            "retries": self.retries,
+            "retry_exhausted": self.retry_exhausted,
+            "spill": self.spill_stats(),
+            "http": self.http.stats(),
+        }
+
+    def healthy(self) -> bool:
+
+        return self.http.ping()
 
 
     def _add_or_buffer(self, row: Dict[str, Any]) -> None:
         rec = self._validate_and_cast(row)
 
-        if self.bulk_max_rows > 0 or self.bulk_max_seconds > 0:
-            to_flush: Optional[List[Dict[str, Any]]] = None
+        if self.background:
+            self._enqueue([rec], None)
+        elif self.bulk_max_rows > 0 or self.bulk_max_seconds > 0:
+            to_flush = None
             with self._lock:
                 self._buf.append(rec)
                 now = time.monotonic()
 
                 if self.bulk_max_rows and len(self._buf) >= self.bulk_max_rows:
-                    to_flush = self._buf
-                    self._buf = []
-                    self._last_flush = now
+                    to_flush = self._take_locked(now)
 
                 elif self.bulk_max_seconds and (now - self._last_flush) >= self.bulk_max_seconds:
-                    to_flush = self._buf
-                    self._buf = []
-                    self._last_flush = now
+                    to_flush = self._take_locked(now)
             if to_flush:
-                self._insert_many_http(to_flush)
+                self._flush_rows(*to_flush)
         else:
+            # như insert_many không bulk: cùng đường retry / spill / settings insert, nhóm lỗi cũ gửi trước
+            with self._lock:
+                self._buf.append(rec)
+                to_flush = self._take_locked(time.monotonic())
+            self._flush_rows(*to_flush)
 
-            self._insert_many_http([rec])
-
-    def _insert_many_http(self, rows: List[Dict[str, Any]]) -> None:
-        if not rows:
-            return
-
-
+    def _encode_rows(self, rows: List[Dict[str, Any]]) -> bytes:
+        """Body insert theo ``insert_format``: RowBinary (nhị phân, không qua JSON) hoặc NDJSON."""
+        if self._rowbinary is not None:
+            return self._rowbinary.encode(rows)
         ndjson_lines = []
         for r in rows:
             item = {k: r.get(k) for k in self._COLS}
             ndjson_lines.append(json.dumps(item, ensure_ascii=False))
-        ndjson = "\n".join(ndjson_lines) + "\n"
-
-        sql = f"INSERT INTO {self.database}.{self.table} ({', '.join(self._COLS)}) FORMAT JSONEachRow"
-        params = {"query": sql, "database": self.database}
-        auth = (self.user, self.password) if (self.user or self.password) else None
-
-        resp = requests.post(
-            self.http_url, params=params, data=ndjson.encode("utf-8"),
-            auth=auth, timeout=self.timeout
-        )
-        if resp.status_code != 200:
-            raise RuntimeError(f"ClickHouse insert failed {resp.status_code}: {resp.text}")
+        return ("\n".join(ndjson_lines) + "\n").encode("utf-8")
 
     def _validate_and_cast(self, r: Dict[str, Any]) -> Dict[str, Any]:
 
@@ -191,6 +803,8 @@ class ClickHouseWriter:
         out = dict(r)
 
         out["ts_ms"] = int(out["ts_ms"])
+        if out["ts_ms"] < 0:
+            raise ValueError(f"ts_ms out of range: {out['ts_ms']}")
         out["event_id"] = str(out["event_id"])
         out["product_code"] = str(out["product_code"])
         out["station_id"] = str(out["station_id"])
@@ -202,6 +816,8 @@ class ClickHouseWriter:
         out["model_family"] = str(out["model_family"])
         out["model_version"] = str(out["model_version"])
         out["latency_ms"] = int(out["latency_ms"])
+        if not 0 <= out["latency_ms"] <= 0xFFFFFFFF:
+            raise ValueError(f"latency_ms out of range: {out['latency_ms']}")
 
         # Quyết định
         out["aql_mini_decision"] = str(out["aql_mini_decision"])
@@ -215,6 +831,8 @@ class ClickHouseWriter:
         out["fail_reason"] = None if fr in (None, "", "null") else str(fr)
 
         out["defect_count"] = int(out["defect_count"])
+        if not 0 <= out["defect_count"] <= 0xFFFF:
+            raise ValueError(f"defect_count out of range: {out['defect_count']}")
 
         dj = out.get("defects_json")
         if dj is None:
@@ -232,6 +850,9 @@ class ClickHouseWriter:
         iru = out.get("image_raw_url")
         out["image_raw_url"] = str(iru) if iru not in (None, "", "null") else out["image_overlay_url"]
 
+        sv = out.get("spec_version")
+        out["spec_version"] = "" if sv is None else str(sv)
+
         return out
 
 
@@ -242,15 +863,24 @@ class ClickHouseWriter:
         project_root: Optional[str] = None,
         bulk_max_rows: int = 0,
         bulk_max_seconds: float = 0.0,
+        background: Optional[bool] = None,
+        spill_subdir: Optional[str] = None,
+        spill: Optional[bool] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
     ) -> "ClickHouseWriter":
+        """``spill=False``: bỏ qua clickhouse.spill (tool offline không được mở chung spill dir với processor);
+        None: theo config/env. ``user``/``password``: ghi đè ENV/YAML (auth gắn vào client HTTP lúc tạo)."""
 
         cfg = _safe_read_yaml(path)
         ch = (cfg.get("clickhouse") or {}) if isinstance(cfg, dict) else {}
 
         http_url = _build_http_url(ch)
 
-        user = os.getenv("CLICKHOUSE_USER", str(ch.get("user", "default")))
-        password = os.getenv("CLICKHOUSE_PASSWORD", str(ch.get("password", "")))
+        if user is None:
+            user = os.getenv("CLICKHOUSE_USER", str(ch.get("user", "default")))
+        if password is None:
+            password = os.getenv("CLICKHOUSE_PASSWORD", str(ch.get("password", "")))
         database = os.getenv("CLICKHOUSE_DATABASE", str(ch.get("database", "aoi")))
         table = os.getenv("CLICKHOUSE_TABLE", str(ch.get("table", "aoi_inspections")))
 
@@ -266,6 +896,35 @@ class ClickHouseWriter:
         elif bulk_max_seconds == 0.0:
             bulk_max_seconds = float((ch.get("bulk", {}) or {}).get("max_seconds", 0.0))
 
+        bc = ch.get("bulk", {}) or {}
+        if background is None:
+            background = os.getenv("CLICKHOUSE_BACKGROUND_FLUSH", str(bc.get("background", "0"))).lower() \
+                in ("1", "true", "yes")
+        max_pending_rows = int(os.getenv("CLICKHOUSE_MAX_PENDING_ROWS", str(bc.get("max_pending_rows", 0))))
+        backpressure = os.getenv("CLICKHOUSE_BACKPRESSURE", str(bc.get("backpressure", "block")))
+
+        hc = ch.get("http", {}) or {}
+        http = ClickHouseHTTP(
+            http_url, user=user, password=password, database=database,
+            timeout=float(hc.get("timeout_s", 15.0)),
+            compression=os.getenv("CLICKHOUSE_COMPRESSION", str(hc.get("compression", "gzip"))),
+            compress_min_bytes=int(hc.get("compress_min_bytes", 1024)),
+            accept_compressed=bool(hc.get("accept_compressed", True)),
+            pool_maxsize=int(hc.get("pool_maxsize", 4)),
+        )
+
+        rc = ch.get("retry", {}) or {}
+        ac = ch.get("async_insert", {}) or {}
+        sc = ch.get("spill", {}) or {}
+        if spill is None:
+            spill = os.getenv("CLICKHOUSE_SPILL", str(sc.get("enabled", "0"))).lower() in ("1", "true", "yes")
+        spill_log = None
+        if spill:
+            sdir = Path(os.getenv("CLICKHOUSE_SPILL_DIR", str(sc.get("dir", "data/spill/clickhouse"))))
+            if spill_subdir:
+                sdir = sdir / spill_subdir  # mỗi worker 1 thư mục (SegmentLog không chia sẻ giữa process)
+            spill_log = SegmentLog.from_config({**sc, "dir": str(sdir)}, sdir)
+
         return cls(
             http_url=http_url,
             database=database,
@@ -274,4 +933,25 @@ class ClickHouseWriter:
             table=table,
             bulk_max_rows=bulk_max_rows,
             bulk_max_seconds=bulk_max_seconds,
+            background=background,
+            max_pending_rows=max_pending_rows,
+            backpressure=backpressure,
+            timeout=http.timeout,
+            http=http,
+            insert_format=os.getenv("CLICKHOUSE_INSERT_FORMAT", str(ch.get("insert_format", "JSONEachRow"))),
+            retry_max_attempts=int(rc.get("max_attempts", 4)),
+            retry_base_s=float(rc.get("base_s", 0.2)),
+            retry_max_s=float(rc.get("max_s", 5.0)),
+            spill=spill_log,
+            replay_interval_s=float(sc.get("replay_interval_s", 5.0)),
+            async_insert=os.getenv("CLICKHOUSE_ASYNC_INSERT", str(ac.get("enabled", "0"))).lower()
+            in ("1", "true", "yes"),
+            wait_for_async_insert=bool(ac.get("wait", True)),
+            async_insert_busy_timeout_ms=int(ac.get("busy_timeout_ms", 0)),
+            dedup_token=bool(ch.get("dedup_token", True)),
+            partition_by=list(ch.get("partition_by") or []),
+            partition_tz=str(ch.get("partition_tz", "UTC")),
+            target_parts_per_min=float(os.getenv("CLICKHOUSE_TARGET_PARTS_PER_MIN",
+                                                 str(bc.get("target_parts_per_min", 0)))),
+            adaptive_max_scale=float(bc.get("adaptive_max_scale", 8.0)),
         )
@@ -1,21 +1,154 @@
 from __future__ import annotations
-from typing import Iterator, Dict, Any, Optional, List
+from typing import Callable, Iterator, Dict, Any, Optional, List, Tuple
 from pathlib import Path
 import json
+import struct
+import threading
 import time
 import logging
 import yaml
 import os
 
 try:
-    from confluent_kafka import Consumer, KafkaException, KafkaError 
+    from confluent_kafka import Consumer, KafkaException, KafkaError, TopicPartition
 except Exception as e:
     raise RuntimeError(
         "pipelines.kafka_consumer: cần confluent-kafka. Cài: pip install confluent-kafka"
     ) from e
 
+try:
+    from aoi.io.avro_codec import compile_decoder
+except ImportError:  # chạy dạng src.pipelines.* (stream processor)
+    from src.aoi.io.avro_codec import compile_decoder
+
 log = logging.getLogger("aoi.kafka_consumer")
 
+_AVRO_MAGIC = 0
+
+
+# ---------------- deserializers: bytes -> dict ----------------
+class JSONDeserializer:
+    name = "json"
+
+    def __call__(self, value: bytes) -> Dict[str, Any]:
+        return json.loads(value)
+
+
+class ConfluentAvroDeserializer:
+    """Confluent wire format (0x00 + schema_id u32 BE + Avro binary).
+
+    Decoder được compile 1 lần cho mỗi schema ID (writer schema lấy từ registry) và cache lại.
+    """
+
+    name = "avro"
+
+    def __init__(self, schema_registry_url: Optional[str] = None, sr_client: Any = None):
+        if sr_client is None and schema_registry_url:
+            from confluent_kafka.schema_registry import SchemaRegistryClient
+            sr_client = SchemaRegistryClient({"url": schema_registry_url})
+        self._sr = sr_client
+        self._decoders: Dict[int, Callable] = {}
+        self._lock = threading.Lock()
+
+    def register(self, schema_id: int, schema_str: str) -> None:
+        """Nạp sẵn schema (không cần registry), vd. cho test/replay offline."""
+        self._decoders[int(schema_id)] = compile_decoder(schema_str)
+
+    def _load(self, schema_id: int) -> Callable:
+        with self._lock:
+            dec = self._decoders.get(schema_id)
+            if dec is None:
+                if self._sr is None:
+                    raise ValueError(f"unknown Avro schema id {schema_id} and no schema registry configured")
+                schema = self._sr.get_schema(schema_id)
+                dec = compile_decoder(schema.schema_str)
+                self._decoders[schema_id] = dec
+                log.info("Avro decoder compiled for schema id=%d", schema_id)
+            return dec
+
+    def __call__(self, value: bytes) -> Dict[str, Any]:
+        if len(value) < 5 or value[0] != _AVRO_MAGIC:
+            raise ValueError("not a Confluent Avro message (missing magic byte)")
+        schema_id = struct.unpack_from(">I", value, 1)[0]
+        dec = self._decoders.get(schema_id) or self._load(schema_id)
+        record, _ = dec(value, 5)
+        return record
+
+
+class AutoDeserializer:
+    """Nhận diện theo byte đầu: 0x00 -> Confluent Avro, còn lại -> JSON."""
+
+    name = "auto"
+
+    def __init__(self, avro: ConfluentAvroDeserializer, json_: Optional[JSONDeserializer] = None):
+        self.avro = avro
+        self.json = json_ or JSONDeserializer()
+
+    def __call__(self, value: bytes) -> Dict[str, Any]:
+        if value and value[0] == _AVRO_MAGIC:
+            return self.avro(value)
+        return self.json(value)
+
+
+def make_deserializer(value_format: str = "auto", schema_registry_url: Optional[str] = None) -> Callable[[bytes], Dict[str, Any]]:
+    fmt = (value_format or "auto").lower()
+    if fmt == "json":
+        return JSONDeserializer()
+    if fmt == "avro":
+        return ConfluentAvroDeserializer(schema_registry_url)
+    if fmt == "auto":
+        return AutoDeserializer(ConfluentAvroDeserializer(schema_registry_url))
+    raise ValueError(f"kafka.value_format must be auto|json|avro, got {value_format!r}")
+
+
+class OffsetTracker:
+    """Giữ offset cao nhất theo (topic, partition) và chỉ commit khi ClickHouseWriter báo đã flush.
+
+    Dùng làm ``on_flush`` của writer: token là dict offset của từng batch đã consume,
+    theo đúng thứ tự nên commit không bao giờ vượt qua dòng còn nằm trong buffer.
+    """
+
+    def __init__(self, consumer: "KafkaJSONConsumer", asynchronous: bool = True):
+        self.consumer = consumer
+        self.asynchronous = bool(asynchronous)
+        self._lock = threading.Lock()
+        self._flushed: Dict[Tuple[str, int], int] = {}
+        self._committed: Dict[Tuple[str, int], int] = {}
+        self.commits = 0
+
+    def on_flush(self, tokens: List[Dict[Tuple[str, int], int]]) -> None:
+        with self._lock:
+            for offsets in tokens:
+                for tp, off in offsets.items():
+                    if off > self._flushed.get(tp, -1):
+                        self._flushed[tp] = off
+        self.commit(self.asynchronous)
+
+    def commit(self, asynchronous: Optional[bool] = None) -> None:
+        """Commit các offset đã flush mà chưa commit."""
+        with self._lock:
+            todo = {tp: o for tp, o in self._flushed.items() if o > self._committed.get(tp, -1)}
+            if not todo:
+                return
+            self._committed.update(todo)
+        self.consumer.commit_offsets(todo, asynchronous=self.asynchronous if asynchronous is None else asynchronous)
+        self.commits += 1
+
+    def forget(self, partitions) -> None:
+        """Bỏ state của các partition bị thu hồi (rebalance)."""
+        with self._lock:
+            for tp in partitions or []:
+                key = (tp.topic, tp.partition)
+                self._flushed.pop(key, None)
+                self._committed.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "commits": self.commits,
+                "committed": {f"{t}[{p}]": o for (t, p), o in self._committed.items()},
+            }
+
 
 def load_streaming_config(path: str | Path) -> Dict[str, Any]:
     p = Path(path).resolve()
@@ -35,6 +168,7 @@ class KafkaJSONConsumer:
         max_poll_interval_ms: int = 300000,
         enable_auto_commit: bool = False,
         extra: Optional[Dict[str, Any]] = None,
+        deserializer: Optional[Callable[[bytes], Dict[str, Any]]] = None,
     ):
         cfg = {
             "bootstrap.servers": brokers,
@@ -46,14 +180,32 @@ class KafkaJSONConsumer:
         }
         if extra:
             cfg.update(extra)
+        cfg.setdefault("on_commit", self._on_commit)
+        self.commit_errors = 0
 
         self._consumer = Consumer(cfg)
         self._topics = topics
+        self._deserialize = deserializer or JSONDeserializer()
+        log.info("Kafka consumer value deserializer: %s", getattr(self._deserialize, "name", self._deserialize))
 
-    def subscribe(self):
-        self._consumer.subscribe(self._topics)
+    def subscribe(self, on_revoke: Optional[Callable] = None):
+        if on_revoke is not None:
+            self._consumer.subscribe(self._topics, on_revoke=on_revoke)
+        else:
+            self._consumer.subscribe(self._topics)
         log.info("Kafka subscribed topics=%s", self._topics)
 
+    def _on_commit(self, err, partitions) -> None:
+        # callback của commit (cả async) — chạy trong poll()/consume()
+        if err is not None:
+            self.commit_errors += 1
+            log.error("Offset commit failed: %s", err)
+            return
+        for tp in partitions or []:
+            if tp.error is not None:
+                self.commit_errors += 1
+                log.error("Offset commit failed for %s[%d]: %s", tp.topic, tp.partition, tp.error)
+
     def close(self):
         try:
             self._consumer.close()
@@ -76,9 +228,10 @@ class KafkaJSONConsumer:
 
             key = msg.key().decode("utf-8") if msg.key() else None
             try:
-                payload = json.loads(msg.value().decode("utf-8"))
+                payload = self._deserialize(msg.value())
             except Exception as e:
-                log.error("JSON decode failed (skip message). key=%s err=%s", key, e)
+                log.error("Decode failed (skip message). key=%s topic=%s offset=%s err=%s",
+                          key, msg.topic(), msg.offset(), e)
                 try:
                     self._consumer.commit(message=msg, asynchronous=False)
                 except Exception:
@@ -94,14 +247,62 @@ class KafkaJSONConsumer:
                 "key": key,
             }
 
+    def consume_batch(
+        self, num_messages: int = 500, timeout: float = 1.0
+    ) -> Tuple[List[Dict[str, Any]], Dict[Tuple[str, int], int]]:
+        """Lấy tối đa ``num_messages`` message trong 1 lần gọi ``Consumer.consume``.
+
+        Trả về (messages đã decode, offset cao nhất theo (topic, partition)). Offset tính cả
+        message decode lỗi (đã log và bỏ qua) để commit của batch vượt qua chúng.
+        """
+        out: List[Dict[str, Any]] = []
+        offsets: Dict[Tuple[str, int], int] = {}
+        for msg in self._consumer.consume(num_messages=num_messages, timeout=timeout):
+            if msg.error():
+                if msg.error().code() != KafkaError._PARTITION_EOF:
+                    log.warning("Kafka consume error: %s", msg.error())
+                continue
+
+            tp = (msg.topic(), msg.partition())
+            off = msg.offset()
+            if off > offsets.get(tp, -1):
+                offsets[tp] = off
+
+            key = msg.key().decode("utf-8") if msg.key() else None
+            try:
+                payload = self._deserialize(msg.value())
+            except Exception as e:
+                log.error("Decode failed (skip message). key=%s topic=%s offset=%s err=%s",
+                          key, msg.topic(), off, e)
+                continue
+
+            out.append({
+                "payload": payload,
+                "topic": tp[0],
+                "partition": tp[1],
+                "offset": off,
+                "key": key,
+            })
+        return out, offsets
+
     def commit(self, raw_msg) -> None:
         try:
             self._consumer.commit(message=raw_msg, asynchronous=False)
         except Exception as e:
             log.error("Commit failed: %s", e)
 
+    def commit_offsets(self, offsets: Dict[Tuple[str, int], int], asynchronous: bool = False) -> None:
+        """Commit offset cao nhất đã xử lý của mỗi partition (Kafka lưu offset kế tiếp => +1)."""
+        if not offsets:
+            return
+        tps = [TopicPartition(t, p, o + 1) for (t, p), o in offsets.items()]
+        try:
+            self._consumer.commit(offsets=tps, asynchronous=asynchronous)
+        except Exception as e:
+            log.error("Commit failed: %s", e)
+
     @classmethod
-    def from_yaml(cls, config_path: str | Path):
+    def from_yaml(cls, config_path: str | Path, extra: Optional[Dict[str, Any]] = None):
         cfg = load_streaming_config(config_path)
         kc = cfg.get("kafka", {}) or {}
         topics = []
@@ -117,4 +318,9 @@ class KafkaJSONConsumer:
             group_id=str(kc.get("group_id", "aoi.processor.v1")),
             topics=topics,
             auto_offset_reset=str(kc.get("auto_offset_reset", "earliest")),
+            extra=extra,
+            deserializer=make_deserializer(
+                str(os.getenv("AOI_KAFKA_VALUE_FORMAT") or kc.get("value_format", "auto")),
+                os.getenv("SCHEMA_REGISTRY_URL") or kc.get("schema_registry"),
+            ),
         )
@@ -0,0 +1,112 @@
+# src/pipelines/rowbinary.py
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+import struct
+
+# Encoder RowBinary cho insert ClickHouse: compile 1 lần từ danh sách (cột, kiểu), dùng closure như avro_codec.
+# https://clickhouse.com/docs/en/interfaces/formats#rowbinary
+
+Encoder = Callable[[bytearray, Any], None]
+
+_FIXED: Dict[str, struct.Struct] = {
+    "UInt8": struct.Struct("<B"), "UInt16": struct.Struct("<H"), "UInt32": struct.Struct("<I"),
+    "UInt64": struct.Struct("<Q"), "Int8": struct.Struct("<b"), "Int16": struct.Struct("<h"),
+    "Int32": struct.Struct("<i"), "Int64": struct.Struct("<q"),
+    "Float32": struct.Struct("<f"), "Float64": struct.Struct("<d"),
+}
+_LEN1 = [bytes((i,)) for i in range(128)]  # độ dài < 128: varint 1 byte
+_K_STR, _K_NSTR, _K_OTHER = 0, 1, 2
+
+
+def _write_varint(out: bytearray, n: int) -> None:
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _enc_string(out: bytearray, v: Any) -> None:
+    b = v.encode("utf-8") if isinstance(v, str) else bytes(v)
+    n = len(b)
+    if n < 128:
+        out += _LEN1[n]
+    else:
+        _write_varint(out, n)
+    out += b
+
+
+def _fixed(t: str) -> Encoder:
+    pack = _FIXED[t].pack
+    conv = float if t.startswith("Float") else int
+
+    def enc(out: bytearray, v: Any) -> None:
+        try:
+            out += pack(conv(v))
+        except struct.error as e:
+            raise ValueError(f"value {v!r} out of range for {t}") from e
+    return enc
+
+
+def _compile(t: str) -> Encoder:
+    t = t.strip()
+    if t.startswith("Nullable(") and t.endswith(")"):
+        inner = _compile(t[len("Nullable("):-1])
+
+        def enc_nullable(out: bytearray, v: Any) -> None:
+            if v is None:
+                out.append(1)
+            else:
+                out.append(0)
+                inner(out, v)
+        return enc_nullable
+    if t == "String":
+        return _enc_string
+    if t in _FIXED:
+        return _fixed(t)
+    raise ValueError(f"unsupported RowBinary type {t!r}")
+
+
+class RowBinaryEncoder:
+    """Encode list dict -> body ``INSERT ... FORMAT RowBinary`` theo đúng thứ tự ``columns``.
+
+    Hỗ trợ String, Nullable(...), (U)Int8..64, Float32/64. Dòng thiếu cột -> KeyError;
+    None ở cột không Nullable -> ValueError/AttributeError (writer đã validate trước đó).
+    """
+
+    format_name = "RowBinary"
+
+    def __init__(self, columns: Sequence[Tuple[str, str]]):
+        self.columns = [c for c, _ in columns]
+        self.types = [t.strip() for _, t in columns]
+        # String / Nullable(String) (phần lớn cột) encode inline trong vòng lặp, kiểu khác gọi closure
+        self._plan: List[Tuple[str, int, Encoder]] = [
+            (c, _K_STR if t == "String" else _K_NSTR if t == "Nullable(String)" else _K_OTHER, _compile(t))
+            for c, t in zip(self.columns, self.types)
+        ]
+
+    def encode(self, rows: Sequence[Dict[str, Any]]) -> bytes:
+        out = bytearray()
+        plan = self._plan
+        len1 = _LEN1
+        for r in rows:
+            for name, kind, enc in plan:
+                v = r[name]
+                if kind == _K_OTHER:
+                    enc(out, v)
+                    continue
+                if kind == _K_NSTR:
+                    if v is None:
+                        out.append(1)
+                        continue
+                    out.append(0)
+                b = v.encode("utf-8") if isinstance(v, str) else bytes(v)
+                n = len(b)
+                if n < 128:
+                    out += len1[n]
+                else:
+                    _write_varint(out, n)
+                out += b
+        return bytes(out)
+
+    def __call__(self, rows: Sequence[Dict[str, Any]]) -> bytes:
+        return self.encode(rows)